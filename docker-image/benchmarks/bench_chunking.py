@@ -0,0 +1,97 @@
+"""
+Compares the legacy clean + split_text path (encoder looked up per call,
+four regex passes, every overlapping window decoded) against TokenChunker
+on the sample PDFs in data/learning_pdfs.
+
+    python benchmarks/bench_chunking.py --repeat 5 --max-tokens 300 --overlap 50
+
+Text is extracted once up front; only cleanup and chunking are timed.
+Reports chunks and best-of-N wall time per file and in total.
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, project_root)
+# textUtils builds OpenAI clients at import; nothing is sent
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+import tiktoken
+from src.chunker import TokenChunker
+from src.textUtils import clean_extracted_text, iter_pdf_pages
+
+DEFAULT_PDF_DIR = os.path.join(project_root, "..", "data", "learning_pdfs")
+
+
+def legacy_clean(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', text)
+    text = re.sub(r'(?<=[a-zA-Z])(?=[0-9])', ' ', text)
+    text = re.sub(r'(?<=[0-9])(?=[a-zA-Z])', ' ', text)
+    return text.strip()
+
+
+def legacy_split(text, max_tokens, overlap):
+    enc = tiktoken.get_encoding("cl100k_base")
+    token_ids = enc.encode(text)
+    chunks = []
+    start = 0
+    while start < len(token_ids):
+        end = min(start + max_tokens, len(token_ids))
+        chunks.append(enc.decode(token_ids[start:end]))
+        start += max_tokens - overlap
+    return chunks
+
+
+def best_of(repeat, fn):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf-dir", default=DEFAULT_PDF_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.pdf_dir, "*.pdf")))
+    if not paths:
+        sys.exit(f"no PDFs found in {args.pdf_dir}")
+
+    variants = {
+        "legacy": lambda text: legacy_split(legacy_clean(text), args.max_tokens, args.overlap),
+        "chunker": lambda text: TokenChunker(args.max_tokens, args.overlap).split(clean_extracted_text(text)),
+        "chunker/sentence": lambda text: TokenChunker(args.max_tokens, args.overlap, boundary="sentence")
+            .split(clean_extracted_text(text)),
+    }
+    # Warm the encoder cache so the first variant does not pay for loading it
+    TokenChunker().chunks("warm up")
+
+    totals = dict.fromkeys(variants, 0.0)
+    for path in paths:
+        with open(path, "rb") as f:
+            text = "\n".join(iter_pdf_pages(f.read()))
+        line = f"{os.path.basename(path)[:32]:<32} chars={len(text):<8}"
+        for name, fn in variants.items():
+            elapsed, chunks = best_of(args.repeat, lambda: fn(text))
+            totals[name] += elapsed
+            line += f" {name}: {len(chunks)} chunks {elapsed * 1000:.1f}ms"
+        print(line)
+
+    base = totals["legacy"]
+    for name, total in totals.items():
+        print(f"{name:<18} total_ms={total * 1000:<9.1f} speedup={base / total if total else 0:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compares per-chunk embedding calls against the batched EmbeddingEngine using
+a local stub of the OpenAI embeddings endpoint, so no API quota is spent.
+
+    python benchmarks/bench_embedding.py --chunks 1000 --latency-ms 40 --throttle-every 7
+
+Reports API calls and wall time, normalised per 1k chunks.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, project_root)
+
+from openai import OpenAI
+from src.embedding_engine import EmbeddingEngine
+
+DIM = 1536
+
+
+class StubEmbeddingsServer(ThreadingHTTPServer):
+    def __init__(self, latency_s: float, throttle_every: int):
+        super().__init__(("127.0.0.1", 0), StubEmbeddingsHandler)
+        self.latency_s = latency_s
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+
+class StubEmbeddingsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            throttle = server.throttle_every and server.requests % server.throttle_every == 0
+            if throttle:
+                server.throttled += 1
+        if throttle:
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("retry-after", "0.05")
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": {"message": "rate limited"}}).encode())
+            return
+
+        time.sleep(server.latency_s)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        payload = {
+            "object": "list",
+            "model": body["model"],
+            "data": [
+                {"object": "embedding", "index": i, "embedding": [float(len(t) % 7)] * DIM}
+                for i, t in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+        raw = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+def run(label, server, fn, chunks):
+    server.requests = server.throttled = 0
+    start = time.perf_counter()
+    rows = fn(chunks)
+    elapsed = time.perf_counter() - start
+    per_1k = 1000 / len(chunks)
+    print(f"{label:<28} rows={rows:<6} api_calls/1k={server.requests * per_1k:<8.1f} "
+          f"throttled={server.throttled:<4} wall_s/1k={elapsed * per_1k:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="answer every Nth request with HTTP 429")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    args = parser.parse_args()
+
+    server = StubEmbeddingsServer(args.latency_ms / 1000, args.throttle_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(api_key="stub", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+                    max_retries=0)
+    chunks = [f"chunk {i} " + "lorem ipsum " * (i % 50) for i in range(args.chunks)]
+
+    per_chunk = EmbeddingEngine(client, "text-embedding-ada-002", batch_size=1, max_in_flight=1,
+                                base_delay=0.05)
+    run("per-chunk (legacy loop)", server, lambda c: len(per_chunk.embed(c)), chunks)
+
+    for batch_size in sorted({64, args.batch_size}):
+        engine = EmbeddingEngine(client, "text-embedding-ada-002", batch_size=batch_size,
+                                 max_in_flight=args.max_in_flight, base_delay=0.05)
+        run(f"batched {batch_size} x{args.max_in_flight} in flight", server,
+            lambda c: len(engine.embed(c)), chunks)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Latency of course-scoped nearest-neighbour queries on pgvector, with and
+without the ANN index, at several table sizes.
+
+    BENCH_POSTGRES_URL=postgresql://... python benchmarks/bench_vector_search.py \
+        --sizes 10000 100000 1000000 --courses 200 --index hnsw --ef-search 40 100 \
+        --iterative-scan off relaxed_order
+
+Rows go into a scratch "BenchFileChunk" table shaped like "FileChunk", which
+is dropped afterwards, so the benchmark never touches application data.
+Prints p50/p99 latency (ms) for a sequential scan and for each ef_search
+(hnsw) or probes (ivfflat) setting, plus recall@k against the exact scan and
+fill, the share of the k rows a course-scoped query actually returned. With
+many courses and iterative scans off, the course filter runs after the ANN
+scan has stopped at ef_search/probes candidates, so fill drops below 1.
+"""
+import argparse
+import os
+import time
+import uuid
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from pgvector.psycopg2 import register_vector
+
+TABLE = '"BenchFileChunk"'
+
+
+def create_table(cur, dim):
+    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cur.execute(f"""
+        CREATE TABLE {TABLE} (
+            id BIGSERIAL PRIMARY KEY,
+            content TEXT NOT NULL,
+            embedding vector({dim}) NOT NULL,
+            file_id UUID NOT NULL,
+            course_id UUID NOT NULL,
+            chunk_index INTEGER NOT NULL
+        )
+    """)
+
+
+def fill(cur, rng, start, stop, dim, courses):
+    batch = 5000
+    for lo in range(start, stop, batch):
+        hi = min(lo + batch, stop)
+        vecs = rng.standard_normal((hi - lo, dim), dtype=np.float32)
+        rows = [
+            (f"chunk {i}", vecs[i - lo], str(courses[i % len(courses)][1]),
+             str(courses[i % len(courses)][0]), i)
+            for i in range(lo, hi)
+        ]
+        execute_values(cur, f"INSERT INTO {TABLE} (content, embedding, file_id, course_id, chunk_index) VALUES %s",
+                       rows)
+
+
+def timed_queries(cur, queries, course_ids, k, settings):
+    latencies, results = [], []
+    for q, cid in zip(queries, course_ids):
+        cur.execute("BEGIN")
+        for name, value in settings:
+            cur.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+        start = time.perf_counter()
+        cur.execute(
+            f"SELECT id FROM {TABLE} WHERE course_id = %s ORDER BY embedding <-> %s LIMIT %s",
+            (cid, q, k)
+        )
+        ids = [r[0] for r in cur.fetchall()]
+        latencies.append((time.perf_counter() - start) * 1000)
+        cur.execute("COMMIT")
+        results.append(ids)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), results
+
+
+def fill(results, k):
+    return sum(len(ids) for ids in results) / (k * len(results)) if results else 1.0
+
+
+def recall(exact, approx):
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact, approx))
+    total = sum(len(e) for e in exact)
+    return hits / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--index", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[40, 100])
+    parser.add_argument("--probes", type=int, nargs="+", default=[10, 32])
+    parser.add_argument("--iterative-scan", nargs="+", default=["off", "relaxed_order"],
+                        help="pgvector >= 0.8 iterative scan modes to compare")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ["BENCH_POSTGRES_URL"])
+    conn.autocommit = True
+    cur = conn.cursor()
+    create_table(cur, args.dim)
+    register_vector(conn)
+
+    rng = np.random.default_rng(0)
+    courses = [(uuid.uuid4(), uuid.uuid4()) for _ in range(args.courses)]
+    loaded = 0
+    try:
+        for size in sorted(args.sizes):
+            cur.execute(f"DROP INDEX IF EXISTS bench_embedding_ann")
+            fill(cur, rng, loaded, size, args.dim, courses)
+            loaded = size
+            cur.execute(f"CREATE INDEX IF NOT EXISTS bench_course ON {TABLE} (course_id, file_id)")
+            cur.execute(f"ANALYZE {TABLE}")
+
+            queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+            course_ids = [str(courses[i % len(courses)][0]) for i in range(args.queries)]
+
+            p50, p99, exact = timed_queries(cur, queries, course_ids, args.k, [])
+            print(f"{size:>9} rows  seq scan             p50={p50:8.2f}ms p99={p99:8.2f}ms")
+
+            if args.index == "hnsw":
+                cur.execute(f"CREATE INDEX bench_embedding_ann ON {TABLE} "
+                            f"USING hnsw (embedding vector_l2_ops) WITH (m = 16, ef_construction = 64)")
+                sweep = [("hnsw.ef_search", v) for v in args.ef_search]
+            else:
+                lists = max(size // 1000, 10)
+                cur.execute(f"CREATE INDEX bench_embedding_ann ON {TABLE} "
+                            f"USING ivfflat (embedding vector_l2_ops) WITH (lists = {lists})")
+                sweep = [("ivfflat.probes", v) for v in args.probes]
+            cur.execute(f"ANALYZE {TABLE}")
+
+            for mode in args.iterative_scan:
+                for name, value in sweep:
+                    settings = [(name, value), (f"{args.index}.iterative_scan", mode)]
+                    p50, p99, approx = timed_queries(cur, queries, course_ids, args.k, settings)
+                    print(f"{size:>9} rows  {name}={value:<6} {mode:<13} "
+                          f"p50={p50:8.2f}ms p99={p99:8.2f}ms "
+                          f"recall@{args.k}={recall(exact, approx):.3f} fill={fill(approx, args.k):.3f}")
+    finally:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import os, sys
+import io
+import pickle
+import faiss
 import pandas as pd
 import openai
 import glob
 from dotenv import load_dotenv, find_dotenv
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import (
     PyPDFLoader,
@@ -12,9 +14,106 @@ from langchain_community.document_loaders import (
     UnstructuredWordDocumentLoader,
     UnstructuredPowerPointLoader
 )
+from langchain.schema import Document
+from PyPDF2 import PdfReader
+from src.faiss_cache import shared_openai_embeddings
 
 # Load environment variables from .env file
 load_dotenv(find_dotenv())
+
+def cached_openai_embeddings():
+    # Chunk vectors are shared with every other ingestion path through the embedding cache
+    return shared_openai_embeddings()
+
+# Same chunking for the directory and in-memory paths
+def _text_splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+# In-memory counterpart of the loader_mapping in create_database
+def load_documents_from_bytes(file_data, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".pdf":
+        reader = PdfReader(io.BytesIO(file_data))
+        return [
+            Document(page_content=page.extract_text() or "", metadata={"source": filename, "page": i})
+            for i, page in enumerate(reader.pages)
+        ]
+    if ext in (".docx", ".pptx"):
+        # Same partitioners the Unstructured loaders use, fed from memory
+        if ext == ".docx":
+            from unstructured.partition.docx import partition_docx as partition
+        else:
+            from unstructured.partition.pptx import partition_pptx as partition
+        elements = partition(file=io.BytesIO(file_data))
+        text = "\n\n".join(str(el) for el in elements)
+        return [Document(page_content=text, metadata={"source": filename})]
+    if ext == ".txt":
+        return [Document(page_content=file_data.decode("utf-8", errors="ignore"), metadata={"source": filename})]
+    return []
+
+# Builds the per-file LangChain store (chunks, embeddings, citations) without touching disk.
+# Returns (index_bytes, docstore_bytes) in the same format as save_local's index.faiss / index.pkl.
+def build_file_store(file_data, filename):
+    documents = load_documents_from_bytes(file_data, filename)
+    texts = _text_splitter().split_documents(documents)
+    texts = [t for t in texts if t.page_content.strip()]
+    if not texts:
+        raise ValueError(f"No supported content found in {filename}")
+
+    vectordb = FAISS.from_documents(documents=texts, embedding=cached_openai_embeddings())
+    attach_citations(vectordb.docstore.__dict__['_dict'])
+
+    index_bytes = faiss.serialize_index(vectordb.index).tobytes()
+    docstore_bytes = pickle.dumps((vectordb.docstore, vectordb.index_to_docstore_id))
+    return index_bytes, docstore_bytes
+
+# Re-labels a build_file_store docstore copied from another file with the same bytes
+def rename_store_source(docstore_bytes, old_filename, new_filename):
+    docstore, index_to_docstore_id = pickle.loads(docstore_bytes)
+    for doc in docstore.__dict__['_dict'].values():
+        if doc.metadata.get("source") == old_filename:
+            doc.metadata["source"] = new_filename
+    return pickle.dumps((docstore, index_to_docstore_id))
+
+def _obtain_reference_using_gpt(text_for_obtaining_reference):
+    completion = openai.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "You are a straightforward assistant who provides quick, direct APA 7th-style citations. "
+                    "Use only the provided text chunk. If you cannot generate a citation, respond with 'I do not know'."
+                ),
+            },
+            {
+                "role": "user",
+                "content": f"Text chunk: {text_for_obtaining_reference}",
+            }
+        ],
+    )
+    return completion.choices[0].message.content.strip()
+
+# Adds a 'citation' to each chunk's metadata, one GPT call per source using its first 3 chunks.
+# Returns the source -> reference mapping.
+def attach_citations(docstore_data):
+    first_chunks = {}
+    for doc in docstore_data.values():
+        chunks = first_chunks.setdefault(doc.metadata.get("source", "unknown"), [])
+        if len(chunks) < 3:
+            chunks.append(doc.page_content)
+
+    reference_dict = {
+        source: _obtain_reference_using_gpt(" ".join(chunks))
+        for source, chunks in first_chunks.items()
+    }
+
+    for doc in docstore_data.values():
+        original_source = doc.metadata.get("source", "unknown")
+        if original_source in reference_dict:
+            doc.metadata["citation"] = reference_dict[original_source]
+    return reference_dict
+
 # item_01
 def create_database(course_dir):
     # Validate existence of Course directory
@@ -46,12 +145,12 @@ def create_database(course_dir):
             return
 
     # Splitting the text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200) # Divide into 1000 char chunks w/ 200 char overlap to retain context across chunks
+    text_splitter = _text_splitter() # Divide into 1000 char chunks w/ 200 char overlap to retain context across chunks
     texts = text_splitter.split_documents(all_documents) # contains the document chunks
     print(f"Number of text chunks: {len(texts)}")
 
     # FAISS Vector Store Creation
-    embedding = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY")) # convert text into OpenAI vector embeddings
+    embedding = cached_openai_embeddings() # convert text into OpenAI vector embeddings
     vectordb = FAISS.from_documents(documents=texts, embedding=embedding)
 
     # vectordb.save_local(output_dir)
@@ -64,56 +163,12 @@ def generate_citations(course_dir):
         sys.exit(1)
 
     # Initialize OpenAI embeddings
-    embedding = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
+    embedding = cached_openai_embeddings()
     # Load the FAISS index
     vectordb = FAISS.load_local(course_dir, embedding, allow_dangerous_deserialization=True)
 
-    # Get the document store data
-    docstore_data = vectordb.docstore.__dict__['_dict']
-    values_list = list(docstore_data.values())
-    all_keys = list(docstore_data.keys())
-
-    # Create initial DataFrame
-    df = pd.DataFrame({"Keys": all_keys, "Values": values_list})
-
-    # Extract source from metadata
-    df["Source"] = df["Values"].apply(lambda x: x.metadata.get("source", "unknown"))
-
-    # Get unique sources
-    unique_sources = df['Source'].unique()
-
-    def obtain_reference_using_gpt(text_for_obtaining_reference):
-        completion = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a straightforward assistant who provides quick, direct APA 7th-style citations. "
-                        "Use only the provided text chunk. If you cannot generate a citation, respond with 'I do not know'."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": f"Text chunk: {text_for_obtaining_reference}",
-                }
-            ],
-        )
-        return completion.choices[0].message.content.strip()
-
-    # Generate citations
-    reference_dict = {}
-    for source in unique_sources:
-        df_for_each = df[df["Source"] == source].iloc[:3]
-        combined_text = " ".join(df_for_each["Values"].apply(lambda x: x.page_content))
-        reference = obtain_reference_using_gpt(combined_text)
-        reference_dict[source] = reference
-
-    # Add citation to each chunk’s metadata
-    for key, doc in docstore_data.items():
-        original_source = doc.metadata.get("source", "unknown")
-        if original_source in reference_dict:
-            doc.metadata["citation"] = reference_dict[original_source]
+    # Generate citations and add them to each chunk's metadata
+    reference_dict = attach_citations(vectordb.docstore.__dict__['_dict'])
 
     # Save updated FAISS index
     vectordb.save_local(course_dir)
@@ -134,7 +189,7 @@ def replace_sources(course_dir):
         sys.exit(1)
 
     # Initialize OpenAI embeddings
-    embedding = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
+    embedding = cached_openai_embeddings()
 
     # Load the FAISS index
     vectordb = FAISS.load_local(course_dir, embedding, allow_dangerous_deserialization=True)
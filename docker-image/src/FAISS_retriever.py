@@ -4,11 +4,15 @@ import os
 import sys
 from dotenv import load_dotenv, find_dotenv
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_openai import ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain_core.globals import set_verbose, set_debug
 from langchain.schema import BaseRetriever, Document
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import warnings
+from src.faiss_cache import shared_openai_embeddings
+from src.chunker import get_encoding
 
 # Load environment variables
 load_dotenv(find_dotenv())
@@ -20,6 +24,39 @@ warnings.filterwarnings("ignore", message=".*LangChainDeprecationWarning.*")
 set_verbose(False)
 set_debug(False)
 
+# Documents above this many tokens are condensed with map-reduce before the final "stuff" prompt
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("MAP_REDUCE_THRESHOLD_TOKENS", "60000"))
+# Size of each chunk group summarized in the map step
+MAP_REDUCE_GROUP_TOKENS = int(os.getenv("MAP_REDUCE_GROUP_TOKENS", "8000"))
+# Map-step LLM calls in flight at once
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+# Collapse rounds before the notes are used as they are
+MAP_REDUCE_MAX_ROUNDS = 3
+
+MAP_PROMPT = """
+You are condensing one part of a longer document so it can later be organized into chapters.
+
+Rewrite the text below as detailed notes, in the original order. Keep every meaningful fact,
+definition, name, term, date, formula, step and example; drop only repetition and filler.
+Do not add anything that is not in the text. Return only the notes.
+
+TEXT:
+{text}
+"""
+
+# Chat clients are built once per process and reused across queries
+@lru_cache(maxsize=None)
+def get_chat_llm(model="gpt-4o-mini"):
+    return ChatOpenAI(model=model, temperature=0)
+
+# Accepts a directory written by save_local or an already loaded FAISS store (see src.faiss_cache)
+def load_vectordb(faiss_index):
+    if isinstance(faiss_index, FAISS):
+        return faiss_index
+    return FAISS.load_local(
+        faiss_index, shared_openai_embeddings(), allow_dangerous_deserialization=True
+    )
+
 # OpenAI-powered fallback retriever
 class OpenAIRetriever(BaseRetriever):
     def __init__(self, llm):
@@ -71,12 +108,9 @@ def process_llm_response(llm_response):
 
 # Performs an LLM query using the top similar chunks and falls back to OpenAI knowledge if not enough
 def cascading_LLM_response(query, faiss_index_path, threshold=2):
-    embedding = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    llm = get_chat_llm()
 
-    vectordb = FAISS.load_local(
-        faiss_index_path, embedding, allow_dangerous_deserialization=True
-    )
+    vectordb = load_vectordb(faiss_index_path)
     faiss_retriever = vectordb.as_retriever(search_kwargs={"k" : 5})
 
     # Query FAISS first
@@ -112,17 +146,18 @@ def cascading_LLM_response(query, faiss_index_path, threshold=2):
 
 # Perfoms LLM query using all of the provided chunks and does not fall back to OpenAI knowledge
 def LLM_response_all_chunks(query, faiss_index_path):
-    embedding = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-    vectordb = FAISS.load_local(
-        faiss_index_path, embedding, allow_dangerous_deserialization=True
-    )
+    vectordb = load_vectordb(faiss_index_path)
     all_chunks = list(vectordb.docstore.__dict__["_dict"].values())
 
+    return LLM_response_documents(query, all_chunks)
+
+# Performs LLM query over an explicit list of Documents, e.g. chunks served by the retrieval backend
+def LLM_response_documents(query, documents):
+    llm = get_chat_llm()
+
     class FullDumpRetriever(BaseRetriever):
         def _get_relevant_documents(self, q):
-            return all_chunks
+            return documents
 
     retriever = FullDumpRetriever()
 
@@ -136,6 +171,52 @@ def LLM_response_all_chunks(query, faiss_index_path):
     llm_response = qa_chain.invoke(query)
     return llm_response
 
+def count_tokens(text):
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+# Splits documents, in order, into groups of at most max_tokens (a larger single document is its own group)
+def group_documents(documents, max_tokens):
+    groups, current, size = [], [], 0
+    for doc in documents:
+        n = count_tokens(doc.page_content)
+        if current and size + n > max_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(doc)
+        size += n
+    if current:
+        groups.append(current)
+    return groups
+
+def _summarize_group(llm, documents):
+    text = "\n\n".join(doc.page_content for doc in documents)
+    return llm.invoke(MAP_PROMPT.format(text=text)).content.strip()
+
+# Map step: condenses the documents group by group, in parallel, until the notes fit in one prompt
+def map_documents(documents, group_tokens=None, max_workers=None, threshold_tokens=None):
+    group_tokens = group_tokens or MAP_REDUCE_GROUP_TOKENS
+    max_workers = max_workers or MAP_REDUCE_CONCURRENCY
+    threshold_tokens = threshold_tokens or MAP_REDUCE_THRESHOLD_TOKENS
+    if not documents:
+        return []
+    llm = get_chat_llm()
+
+    notes = documents
+    for _ in range(MAP_REDUCE_MAX_ROUNDS):
+        groups = group_documents(notes, group_tokens)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(groups)),
+                                thread_name_prefix='map-reduce') as pool:
+            summaries = list(pool.map(lambda group: _summarize_group(llm, group), groups))
+        notes = [Document(page_content=summary, metadata={"part": i})
+                 for i, summary in enumerate(summaries)]
+        if len(notes) == 1 or sum(count_tokens(n.page_content) for n in notes) <= threshold_tokens:
+            break
+    return notes
+
+# Reduce step: answers the query over the condensed notes with the regular "stuff" chain
+def LLM_response_documents_map_reduce(query, documents, **map_options):
+    return LLM_response_documents(query, map_documents(documents, **map_options))
+
 def answer_to_QA(query, faiss_index_path):
     llm_response = cascading_LLM_response(query, faiss_index_path)
     
@@ -146,8 +227,24 @@ def answer_to_QA(query, faiss_index_path):
 
     return answer_txt
 
-def answer_to_QA_all_chunks(query, faiss_index_path):
-    llm_response = LLM_response_all_chunks(query, faiss_index_path)
+def answer_to_QA_all_chunks(query, faiss_index_path, mode="auto"):
+    vectordb = load_vectordb(faiss_index_path)
+    all_chunks = list(vectordb.docstore.__dict__["_dict"].values())
+
+    return answer_to_QA_documents(query, all_chunks, mode)
+
+# mode: "stuff" sends every document in one prompt, "map_reduce" condenses them first,
+# "auto" uses map-reduce once the documents exceed MAP_REDUCE_THRESHOLD_TOKENS
+def answer_to_QA_documents(query, documents, mode="auto"):
+    if mode == "auto":
+        total = sum(count_tokens(doc.page_content) for doc in documents)
+        mode = "map_reduce" if total > MAP_REDUCE_THRESHOLD_TOKENS else "stuff"
+    if mode == "map_reduce":
+        llm_response = LLM_response_documents_map_reduce(query, documents)
+    elif mode == "stuff":
+        llm_response = LLM_response_documents(query, documents)
+    else:
+        raise ValueError(f"Unknown generation mode '{mode}'")
     answer_txt = process_llm_response(llm_response)
 
     return answer_txt
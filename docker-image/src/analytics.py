@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from src.db.queries import (
+    FILE_EVENT_TYPES, increment_file_counters, insert_file_events, rollup_file_events
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FileEventBuffer:
+    """
+    Buffers file view/chat events in memory and writes them in batches: the
+    events are appended to FileEvent, and the matching File counters are
+    bumped with atomic UPDATE ... SET c = c + n statements.
+
+    A background thread flushes every flush_interval seconds and folds the
+    event log into the hourly rollups every rollup_interval seconds. Once
+    max_pending events pile up the thread is woken to flush early.
+    flush_interval <= 0 writes every event straight through and leaves
+    rollups to callers. record() never raises on a failed write: the error
+    is logged and the events stay queued for the next flush.
+    """
+
+    def __init__(self, session_factory, flush_interval: float = 5.0,
+                 rollup_interval: float = 300.0, max_pending: int = 1000):
+        self._session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        # Serializes flushes so a batch is never written twice
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        if flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='file-event-flush', daemon=True)
+            self._thread.start()
+
+    def record(self, file_id, event_type: str):
+        if event_type not in FILE_EVENT_TYPES:
+            raise ValueError(f"Unknown file event type '{event_type}'")
+        with self._lock:
+            self._pending.append((str(file_id), event_type, datetime.utcnow()))
+            full = len(self._pending) >= self.max_pending
+        if self.flush_interval <= 0:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("file events: write-through flush failed")
+        elif full:
+            self._wake.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+
+            counters = defaultdict(lambda: defaultdict(int))
+            for fid, event_type, _ in batch:
+                counters[fid][FILE_EVENT_TYPES[event_type]] += 1
+
+            db = self._session_factory()
+            try:
+                # One transaction, so a retried batch is never half written
+                insert_file_events(db, batch)
+                increment_file_counters(db, {fid: dict(c) for fid, c in counters.items()})
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Put the batch back so the events are retried on the next flush
+                with self._lock:
+                    self._pending[:0] = batch
+                raise
+            finally:
+                db.close()
+
+    def rollup(self) -> int:
+        """Flushes pending events, then folds the event log into the hourly rollups."""
+        self.flush()
+        db = self._session_factory()
+        try:
+            return rollup_file_events(db)
+        finally:
+            db.close()
+
+    def _run(self):
+        last_rollup = time.monotonic()
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+                if time.monotonic() - last_rollup >= self.rollup_interval:
+                    last_rollup = time.monotonic()
+                    self.rollup()
+            except Exception:
+                logger.exception("file events: background flush failed")
+
+    def shutdown(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+def event_buffer_settings() -> dict:
+    return {
+        'flush_interval':  float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "5")),
+        'rollup_interval': float(os.getenv("ANALYTICS_ROLLUP_INTERVAL", "300")),
+    }
@@ -1,30 +1,37 @@
 import os
 import uuid
-import tempfile
-import pickle
-import faiss
+import atexit
 import numpy as np
-import tempfile
-import shutil
 import json
+import time
+import itertools
 from datetime import datetime
-from flask import Flask, jsonify, request, Response
+from flask import Flask, jsonify, request, Response, g
 from flask_cors import CORS
 import firebase_admin
 from firebase_admin import auth, credentials
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
 from src.db.schema import Base
+from src.db.pgvector_adapter import register_vector_adapter
+from src.db.pool import engine_options, pool_metrics
 from openai import OpenAI
-from transcriber import transcribe_audio
-from indexer import rebuild_course_index, rebuild_file_index, store_file_embeddings
+from indexer import store_file_embeddings
+from src.ingestion import IngestionQueue
+from src.retrieval import get_retrieval_backend
 from io import BytesIO
-from src.textUtils import openai_embed_text
+from src.embedding_cache import embedding_cache
+from src.file_outlines import file_outline_cache
+from src.chat_stream import stream_chat_completion
+from src.blobstore import BlobNotFound, get_blob_store
+from src.auth_cache import principal_cache
+from src.analytics import FileEventBuffer, event_buffer_settings
+from src.course_faqs import refresh_course_faqs
 
 from src.db.queries import (
     # User & Role
-    get_access_code_by_course, get_access_code_by_id, get_course_title, get_enrollment, get_file_metrics_for_course, get_files_without_raw_by_module, get_module_metrics_for_course, get_report_by_course, get_student_questions_for_course, get_user_by_id, get_user_by_email, get_user_by_firebase_uid,
+    get_access_code_by_course, get_access_code_by_id, get_enrollment, get_file_metrics_for_course, get_files_without_raw_by_module, get_module_metrics_for_course, get_report_by_course, get_user_by_id, get_user_by_email, get_user_by_firebase_uid,
     create_user, update_user, delete_user,
     get_role_by_user_id, set_role,
     # Profiles
@@ -33,6 +40,7 @@ from src.db.queries import (
     get_admin_profile, create_admin_profile, update_admin_profile, delete_admin_profile,
     # Domain
     get_course_by_id, get_courses_by_instructor_id, get_courses_by_student_id, create_course, update_course, delete_course,
+    get_course_version, get_course_tree, get_file_course_id,
     get_module_by_id, get_modules_by_course, create_module, update_module, delete_module,
     get_file_by_id, get_files_by_module, create_file, update_file, delete_file,
     get_access_code_by_code, create_access_code, delete_access_code,
@@ -41,7 +49,8 @@ from src.db.queries import (
     update_personalized_file, delete_personalized_file,
     get_chat_by_id, get_chats_by_student, create_chat, update_chat, delete_chat,
     get_message_by_id, get_messages_by_chat, create_message, delete_messages_after,
-    get_report_by_id, create_report, update_report, delete_report
+    get_report_by_id, create_report, update_report, delete_report,
+    get_ingestion_job_by_id, copy_duplicate_file_chunks, get_file_blob
 )
 
 from src.prompts import (
@@ -49,12 +58,9 @@ from src.prompts import (
     prompt2_generate_course_outline, prompt2_generate_course_outline_RAG,
     prompt3_generate_module_content, prompt3_generate_module_content_RAG, 
     prompt4_valid_query,
-    prompt_course_faqs,
-    prompt_generate_personalized_file_content
+    FILE_OUTLINE_PROMPT_VERSION, prompt_structure_file_content, prompt_personalize_file_content
 )
 
-from FAISS_db_generation import create_database, generate_citations, replace_sources, file_cleanup
-
 load_dotenv()
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
@@ -67,40 +73,90 @@ firebase_admin.initialize_app(cred)
 POSTGRES_URL = os.getenv("POSTGRES_URL")
 if not POSTGRES_URL:
     raise RuntimeError("POSTGRES_URL not set")
-engine = create_engine(POSTGRES_URL)
-Session = sessionmaker(bind=engine, expire_on_commit=False)
+engine = create_engine(POSTGRES_URL, **engine_options(POSTGRES_URL))
+register_vector_adapter(engine)
+# Plain sessions for work outside a request (ingestion workers, caches, streamed replies)
+session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+# Request handlers share one session per request; it is removed on teardown
+Session = scoped_session(session_factory)
 Base.metadata.create_all(engine)
+embedding_cache.configure(session_factory)
+file_outline_cache.configure(session_factory)
+
+retrieval_backend = get_retrieval_backend()
+# Fails at startup rather than on the first upload when no blob store is configured
+get_blob_store()
+ingestion_queue = IngestionQueue(
+    session_factory,
+    max_workers=int(os.getenv("INGESTION_WORKERS", "2")),
+    stages=retrieval_backend.ingestion_stages
+)
+file_events = FileEventBuffer(session_factory, **event_buffer_settings())
+atexit.register(file_events.shutdown)
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    Session.remove()
+
 
 def get_user_session():
     token = request.cookies.get('session')
     if not token:
         return {'error': 'Missing session cookie'}
+    claims = principal_cache.get_claims(token)
+    if claims is not None:
+        return claims
     try:
-        return auth.verify_session_cookie(token, check_revoked=True)
+        claims = auth.verify_session_cookie(token, check_revoked=True)
     except Exception as e:
+        principal_cache.invalidate_token(token)
         return {'error': str(e)}
+    principal_cache.put_claims(token, claims)
+    return claims
 
 
-def verify_role(required_role):
+def load_principal(db, firebase_uid):
+    """User id, role and profile id for a Firebase uid, or None if the user is unknown."""
+    user = get_user_by_firebase_uid(db, firebase_uid)
+    if not user:
+        return None
+    role = get_role_by_user_id(db, user.id)
+    role_type = role.role_type if role else None
+    profile_getters = {
+        'instructor': get_instructor_profile,
+        'student':    get_student_profile,
+        'admin':      get_admin_profile,
+    }
+    prof = profile_getters[role_type](db, user.id) if role_type in profile_getters else None
+    return {
+        'user_id':    user.id,
+        'role':       role_type,
+        'profile_id': prof.user_id if prof else None,
+    }
+
+
+def verify_role(*allowed_roles):
     session = get_user_session()
     if 'error' in session:
         return None, (jsonify(session), 401)
 
-    firebase_uid = session['uid']
-
-    db = Session()
-    user = get_user_by_firebase_uid(db, firebase_uid)
-    if not user:
-        db.close()
-        return None, (jsonify({'error': 'User not found'}), 404)
-
-    role = get_role_by_user_id(db, user.id) 
-    db.close()
+    token = request.cookies.get('session')
+    principal = principal_cache.get_principal(token)
+    if principal is None:
+        db = Session()
+        try:
+            principal = load_principal(db, session['uid'])
+        finally:
+            db.close()
+        if not principal:
+            return None, (jsonify({'error': 'User not found'}), 404)
+        principal_cache.put_principal(token, principal)
+    g.principal = principal
 
-    if not role or role.role_type != required_role:
+    if principal['role'] not in allowed_roles:
         return None, (jsonify({'error': 'Forbidden'}), 403)
 
-    return user.id, None
+    return principal['user_id'], None
 
 
 def verify_admin():    return verify_role('admin')
@@ -108,6 +164,78 @@ def verify_instructor(): return verify_role('instructor')
 def verify_student():   return verify_role('student')
 
 
+# Upper bounds for the tuning knobs /courses/<id>/search accepts
+SEARCH_MAX_K = 50
+SEARCH_MAX_EF_SEARCH = 1000
+SEARCH_MAX_PROBES = 1000
+
+
+def bounded_int(data, key, default, upper):
+    """data[key] as an int clamped to upper; ValueError unless it is a positive integer."""
+    value = data.get(key, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{key} must be a positive integer")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{key} must be a positive integer")
+    if value < 1:
+        raise ValueError(f"{key} must be a positive integer")
+    return min(value, upper)
+
+
+def file_blob_response(db, f):
+    """
+    Streams a File's bytes from the blob store, honouring a single HTTP Range
+    and revalidating by content hash. Only the requested range is read, in
+    READ_CHUNK_SIZE pieces, after the DB session has been released.
+    """
+    blob = get_file_blob(db, f.content_hash)
+    if blob is None:
+        return jsonify({'error': 'File content missing'}), 404
+    size, legacy_data = blob.size, blob.data
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, no-cache',
+        'Content-Disposition': f'inline; filename={f.filename}',
+    }
+    if request.if_none_match.contains(f.content_hash):
+        resp = Response(status=304, headers=headers)
+        resp.set_etag(f.content_hash)
+        return resp
+
+    start, end, status = 0, size, 200
+    # Range is ignored (full 200 body, as RFC 9110 allows) for multi-range
+    # requests and unless If-Range is absent or carries this strong ETag;
+    # a date-based If-Range never matches, the hash is the only validator
+    if_range = request.headers.get('If-Range')
+    if (request.range is not None and len(request.range.ranges) == 1
+            and (if_range is None or if_range.strip() == f'"{f.content_hash}"')):
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+        (start, end), status = byte_range, 206
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+
+    if legacy_data is not None:
+        # Blob not yet moved out of the database (see src/db/move_blobs.py)
+        body = [bytes(legacy_data[start:end])]
+    else:
+        chunks = get_blob_store().iter_range(f.content_hash, start, end)
+        try:
+            first = next(chunks, b'')
+        except BlobNotFound:
+            return jsonify({'error': 'File content missing'}), 404
+        body = itertools.chain([first], chunks)
+    headers['Content-Length'] = str(end - start)
+    resp = Response(body, status=status, mimetype=f.file_type, headers=headers,
+                    direct_passthrough=True)
+    resp.set_etag(f.content_hash)
+    return resp
+
+
 @app.route('/me', methods=['GET'])
 def me_get():
     session = get_user_session()
@@ -301,6 +429,7 @@ def instructor_profile():
 
         prof = create_instructor_profile(db, user_id, name, university)
         db.close()
+        principal_cache.invalidate_user(user_id)
 
         out = {
             'user_id':  str(prof.user_id),
@@ -332,6 +461,7 @@ def instructor_profile():
     delete_instructor_profile(db, user_id)
     delete_user(db, user_id)
     db.close()
+    principal_cache.invalidate_user(user_id)
     resp = jsonify({'message':'Instructor deleted'})
     resp.set_cookie('session','',max_age=0)
     return resp, 200
@@ -595,6 +725,9 @@ def instructor_manage_module(module_id):
         updated = update_module(db, module_id, **data)
         db.close()
         return jsonify({'id': str(updated.id)}), 200
+    file_ids = [row.id for row in get_files_without_raw_by_module(db, module_id)]
+    if file_ids:
+        retrieval_backend.remove_files(db, course.id, file_ids)
     delete_module(db, module_id)
     db.close()
     return jsonify({'message': 'Deleted'}), 200
@@ -619,15 +752,6 @@ def instructor_files(module_id):
         if not fobj:
             db.close()
             return jsonify({'error': 'Missing file'}), 400
-        transcription = None
-        mimetype = fobj.mimetype or ""
-        print(f"📎 Uploaded file mimetype: {mimetype}")
-
-        if mimetype.startswith("audio/") or mimetype in ["application/octet-stream", "video/mp4"]:
-            print("🧠 Attempting transcription...")
-            transcription = transcribe_audio(fobj)
-            fobj.stream.seek(0)
-
         file_bytes = fobj.read()
         new_file = create_file(
             db,
@@ -638,68 +762,17 @@ def instructor_files(module_id):
             file_size=len(file_bytes),
             file_data=file_bytes
         )
-        if transcription is not None:
-            update_file(db, new_file.id, transcription=transcription)
-        
-        # Create temporary directory and write uploaded file
-        tmp_root = tempfile.mkdtemp(prefix=f"faiss_tmp_{new_file.id}_")
-        tmp_idx_dir = os.path.join(tmp_root, "faiss_index")
-        os.makedirs(tmp_idx_dir, exist_ok=True)
-        # If transcription, use transcribed text, otherwise use uploaded file
-        if transcription is not None:
-            input_filename = "transcription.txt"
-            with open(os.path.join(tmp_idx_dir, input_filename), "w", encoding="utf-8") as txt:
-                txt.write(transcription)
-        else:
-            # Extract file extension
-            ext = os.path.splitext(fobj.filename)[1]
-            input_filename = f"uploaded{ext}"
-            with open(os.path.join(tmp_idx_dir, input_filename), "wb") as out:
-                out.write(file_bytes)
-
-        # Generate FAISS index files
-        create_database(tmp_idx_dir)
-        generate_citations(tmp_idx_dir)
-        file_cleanup(tmp_idx_dir)
-
-        # Read generated index files
-        try:
-            with open(os.path.join(tmp_idx_dir, "index.faiss"), "rb") as fidx:
-                file_idx = fidx.read()
-            with open(os.path.join(tmp_idx_dir, "index.pkl"), "rb") as fpkl:
-                file_pkl = fpkl.read()
-        except Exception as e:
-            shutil.rmtree(tmp_root)
-            db.close()
-            return jsonify({'error': f'Failed to read index files: {e}'}), 500
-        
-        # Store index in DB
-        app.logger.debug("FILE INDEX sizes:", len(file_idx), len(file_pkl))
-        update_file(db, new_file.id,
-                    index_faiss=file_idx,
-                    index_pkl=file_pkl)        
-        
-        # Rebuild course-level index
-        idx_bytes, pkl_bytes = rebuild_course_index(db, course.id)
-        app.logger.debug("COURSE INDEX sizes:", len(idx_bytes), len(pkl_bytes))
-        update_course(
-            db,
-            course_id=course.id,
-            index_faiss=idx_bytes,
-            index_pkl=pkl_bytes
-        )
-        store_file_embeddings(db, str(new_file.id))
 
-        # Cleanup
-        
-        shutil.rmtree(tmp_root)
+        # Transcription, indexing and embedding run on the ingestion worker pool
+        job, _ = ingestion_queue.enqueue(db, new_file, course.id)
         db.close()
 
         return jsonify({
-            'id':            str(new_file.id),
-            'filename':      new_file.filename,
-            'transcription': transcription
-        }), 201
+            'id':       str(new_file.id),
+            'filename': new_file.filename,
+            'jobId':    str(job.id),
+            'status':   job.status
+        }), 202
 
     # GET: Return file list
     files = get_files_by_module(db, module_id)
@@ -714,6 +787,33 @@ def instructor_files(module_id):
         for f in files
     ]), 200
 
+@app.route('/instructor/ingestion-jobs/<job_id>', methods=['GET'])
+def instructor_ingestion_job(job_id):
+    user_id, err = verify_instructor()
+    if err:
+        return err
+    db = Session()
+    job = get_ingestion_job_by_id(db, job_id)
+    if not job:
+        db.close()
+        return jsonify({'error': 'Not found'}), 404
+    course = get_course_by_id(db, job.course_id)
+    if not course or str(course.instructor_id) != str(user_id):
+        db.close()
+        return jsonify({'error': 'Forbidden'}), 403
+    out = {
+        'id':        str(job.id),
+        'fileId':    str(job.file_id),
+        'status':    job.status,
+        'stage':     job.stage,
+        'stages':    job.stages,
+        'error':     job.error,
+        'createdAt': job.created_at.isoformat(),
+        'updatedAt': job.updated_at.isoformat()
+    }
+    db.close()
+    return jsonify(out), 200
+
 @app.route('/instructor/modules/<module_id>/files/upload', methods=['POST'])
 def upload_to_module(module_id):
     db = Session()
@@ -733,7 +833,11 @@ def upload_to_module(module_id):
             file_data=file_data,
         )
 
-        num_chunks = store_file_embeddings(db, str(new_file.id))
+        # A byte-identical upload that is already embedded lends its chunks
+        num_chunks = (
+            copy_duplicate_file_chunks(db, new_file.id, new_file.module.course_id, new_file.content_hash)
+            or store_file_embeddings(db, str(new_file.id))
+        )
         return jsonify({"message": f"File added and embedded into course. {num_chunks} chunks."})
 
     except Exception as e:
@@ -746,25 +850,21 @@ def upload_to_module(module_id):
 def search_course_chunks(course_id):
     db = Session()
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         query = data.get("query")
         if not query:
             return jsonify({"error": "Missing query"}), 400
-
-        # Embed the query sentence
-        vector_list = openai_embed_text([query])[0].tolist()
-        pgvector_str = f"[{','.join(map(str, vector_list))}]"
-
-        # Perform vector similarity search
-        sql = text("""
-            SELECT content
-            FROM "FileChunk"
-            WHERE course_id = :cid
-            ORDER BY embedding <-> :query_vec
-            LIMIT 5
-        """)
-        rows = db.execute(sql, {"cid": course_id, "query_vec": pgvector_str}).fetchall()
-        return jsonify({"results": [{"content": row[0]} for row in rows]})
+        try:
+            k = bounded_int(data, "k", 5, SEARCH_MAX_K)
+            ef_search = bounded_int(data, "efSearch", None, SEARCH_MAX_EF_SEARCH)
+            probes = bounded_int(data, "probes", None, SEARCH_MAX_PROBES)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        hits = retrieval_backend.search(
+            db, course_id, query, k=k, ef_search=ef_search, probes=probes
+        )
+        return jsonify({"results": [{"content": hit['content']} for hit in hits]})
 
     except Exception as e:
         db.rollback()
@@ -802,6 +902,7 @@ def instructor_manage_file(file_id):
         updated = update_file(db, file_id, **data)
         db.close()
         return jsonify({'id': str(updated.id)}), 200
+    retrieval_backend.remove_files(db, course.id, [f.id])
     delete_file(db, file_id)
     db.close()
     return jsonify({'message': 'Deleted'}), 200
@@ -821,9 +922,9 @@ def instructor_file_content(file_id):
     if str(course.instructor_id) != str(user_id):
         db.close()
         return jsonify({'error': 'Forbidden'}), 403
-    data, mtype, fname = f.file_data, f.file_type, f.filename
+    resp = file_blob_response(db, f)
     db.close()
-    return Response(data, mimetype=mtype, headers={"Content-Disposition": f"inline; filename={fname}"})
+    return resp
 
 @app.route('/student/profile', methods=['POST','GET','PATCH','DELETE'])
 def student_profile():
@@ -849,6 +950,7 @@ def student_profile():
             want_quizzes
         )
         db.close()
+        principal_cache.invalidate_user(user_id)
 
         out = {
             'user_id':       str(prof.user_id),
@@ -884,6 +986,7 @@ def student_profile():
     delete_student_profile(db, user_id)
     delete_user(db, user_id)
     db.close()
+    principal_cache.invalidate_user(user_id)
     resp = jsonify({'message':'Student deleted'})
     resp.set_cookie('session','',max_age=0)
     return resp, 200
@@ -932,13 +1035,9 @@ def student_file_content(file_id):
         db.close()
         return jsonify({'error': 'Forbidden'}), 403
 
-    data, mimetype, fname = f.file_data, f.file_type, f.filename
+    resp = file_blob_response(db, f)
     db.close()
-    return Response(
-        data,
-        mimetype=mimetype,
-        headers={'Content-Disposition': f'inline; filename={fname}'}
-    )
+    return resp
 
 @app.route('/student/enrollments/<enrollment_id>', methods=['DELETE'])
 def student_unenroll(enrollment_id):
@@ -956,48 +1055,35 @@ def student_unenroll(enrollment_id):
 
 @app.route('/courses/<course_id>/moduleswithfiles', methods=['GET'])
 def moduleswithfiles(course_id):
-    session = get_user_session()
-    if 'error' in session:
-        return jsonify(session), 401
+    user_id, err = verify_role('student', 'instructor')
+    if err:
+        return err
 
-    firebase_uid = session['uid']
     db = Session()
-    user = get_user_by_firebase_uid(db, firebase_uid)
-    role = get_role_by_user_id(db, user.id)
-
-    if role.role_type == 'student':
-        if not get_enrollment_by_student_course(db, user.id, course_id):
-            db.close()
-            return jsonify({'error':'Forbidden'}), 403
-    elif role.role_type == 'instructor':
-        course = get_course_by_id(db, course_id)
-        if not course or str(course.instructor_id) != str(user.id):
+    version = get_course_version(db, course_id)
+    if not version:
+        db.close()
+        return jsonify({'error':'Forbidden'}), 403
+    if g.principal['role'] == 'student':
+        if not get_enrollment_by_student_course(db, user_id, course_id):
             db.close()
             return jsonify({'error':'Forbidden'}), 403
-    else:
+    elif str(version.instructor_id) != str(user_id):
         db.close()
         return jsonify({'error':'Forbidden'}), 403
 
-    modules = get_modules_by_course(db, course_id)
-    out = []
-    for m in modules:
-        rows = get_files_without_raw_by_module(db, m.id)
-        out.append({
-            'id':       str(m.id),
-            'title':    m.title,
-            'ordering': m.ordering,
-            'files': [
-                {
-                  'id':       str(row.id),
-                  'title':    row.title,
-                  'ordering': row.ordering,
-                }
-                for row in rows
-            ]
-        })
-
-    db.close()
-    return jsonify(out), 200
+    # The tree only changes when Course.last_updated is bumped (see touch_course)
+    etag = f"{course_id}-{version.last_updated.timestamp():.6f}"
+    if request.if_none_match.contains(etag):
+        db.close()
+        resp = Response(status=304)
+    else:
+        out = get_course_tree(db, course_id)
+        db.close()
+        resp = jsonify(out)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
 
 @app.route('/student/courses/<course_id>/modules', methods=['GET'])
 def student_modules(course_id):
@@ -1071,40 +1157,27 @@ def generate_personalized_file_content():
         persona.append(f'they study best **{profile["schedule"]}**')
     full_persona = ". ".join(persona)
 
-    # Fetch FAISS data from DB
+    # Fetch the file's chunks from the retrieval backend
     db_session = Session()
     try:
-        file = get_file_by_id(db_session, file_id)
-        if file:
-            # Create temp directory
-            tmp_root = tempfile.mkdtemp(prefix=f"faiss_tmp_{file_id}_")
-            tmp_idx_dir = os.path.join(tmp_root, "faiss_index")
-            os.makedirs(tmp_idx_dir, exist_ok=True) 
-            
-            faiss_bytes = file.index_faiss
-            pkl_bytes = file.index_pkl
-    except Exception as e:
-        print(f"Error fetching file for ID {file_id}: {e}")
+        documents = retrieval_backend.file_documents(db_session, file_id)
     finally:
         db_session.close()
+    if not documents:
+        return jsonify({"error": "File has not been indexed yet"}), 404
 
     try:
-        with open(os.path.join(tmp_idx_dir, "index.faiss"), "wb") as idx_faiss:
-            idx_faiss.write(faiss_bytes)
-        with open(os.path.join(tmp_idx_dir, "index.pkl"), "wb") as idx_pkl:
-            idx_pkl.write(pkl_bytes)
-
-        # Generate response using the temp directory
-        response = prompt_generate_personalized_file_content(tmp_idx_dir, full_persona)
+        # The chapter outline is shared by every student on this file; only the rewrite is per persona
+        outline = file_outline_cache.get_or_build(
+            file_id, documents, FILE_OUTLINE_PROMPT_VERSION, prompt_structure_file_content
+        )
+        response = prompt_personalize_file_content(outline, full_persona)
         # Verify JSON is valid
         try:
             response_json = json.loads(response)
         except (ValueError, AttributeError, IndexError) as e:
             return jsonify({"error": "Invalid JSON returned from AI response", "details": str(e)}), 400
 
-        # Recursively remove temp directory
-        shutil.rmtree(tmp_root)
-            
         # Save personalized file to DB
         db = Session()
         print("Saving personalized file with original_file_id:", file_id)
@@ -1156,11 +1229,9 @@ def student_chats():
         data = request.get_json() or {}
         file_id = data.get('fileId')
         c = create_chat(db, user_id, file_id, data.get('title'))
-        if file_id:
-            f = get_file_by_id(db, file_id)
-            f.chat_count += 1
-            db.commit()
         db.close()
+        if file_id:
+            file_events.record(file_id, 'chat')
         return jsonify({'id': str(c.id)}), 201
     chats = get_chats_by_student(db, user_id)
     db.close()
@@ -1248,20 +1319,34 @@ def instructor_create_or_update_report(course_id):
     user_id, err = verify_instructor()
     if err:
         return err
+    # Optional ISO date/datetime range for the metrics, [from, to), as query args or JSON
+    data = request.get_json(silent=True) or {}
+    range_from = request.args.get('from') or data.get('from')
+    range_to = request.args.get('to') or data.get('to')
+    try:
+        start = datetime.fromisoformat(range_from) if range_from else None
+        end = datetime.fromisoformat(range_to) if range_to else None
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO dates'}), 400
     db = Session()
     try:
         course = get_course_by_id(db, course_id)
         if not course or str(course.instructor_id) != str(user_id):
             return jsonify({'error': 'Forbidden'}), 403
-        file_metrics = get_file_metrics_for_course(db, course_id)
-        module_metrics = get_module_metrics_for_course(db, course_id)
-        questions = get_student_questions_for_course(db, course_id)
-        faqs_obj = prompt_course_faqs(get_course_title(db, course_id), questions)
+        file_events.rollup()
+        file_metrics = get_file_metrics_for_course(db, course_id, start, end)
+        module_metrics = get_module_metrics_for_course(db, course_id, start, end)
+        faqs_obj = refresh_course_faqs(db, course_id, course.title)
         summary = {
             'fileMetrics': file_metrics,
             'moduleMetrics': module_metrics,
             'faqs': faqs_obj.get('faqs', [])
         }
+        if start or end:
+            summary['range'] = {
+                'from': start.isoformat() if start else None,
+                'to':   end.isoformat() if end else None,
+            }
         existing = get_report_by_course(db, course_id)
         if existing:
             rpt, status = update_report(db, existing.id, summary=summary), 200
@@ -1363,8 +1448,7 @@ def ai_chat():
             chat_id = str(chat.id)
 
             if f:
-                f.chat_count += 1
-                db.commit()
+                file_events.record(f.id, 'chat')
 
         if not f or not f.module:
             db.close()
@@ -1374,19 +1458,9 @@ def ai_chat():
         # 4. Save incoming user message
         create_message(db, chat_id, role='user', content=user_message)
 
-        # 5. Embed query and retrieve top 5 chunks
-        vector_list = openai_embed_text([user_message])[0].tolist()
-        pgvector_str = f"[{','.join(map(str, vector_list))}]"
-
-        sql = text("""
-            SELECT content
-            FROM "FileChunk"
-            WHERE course_id = :cid
-            ORDER BY embedding <-> :query_vec
-            LIMIT 3
-        """)
-        rows = db.execute(sql, {"cid": course_id, "query_vec": pgvector_str}).fetchall()
-        retrieved_chunks = [row[0] for row in rows if row[0]]
+        # 5. Retrieve the top 3 course chunks for the query
+        hits = retrieval_backend.search(db, course_id, user_message, k=3)
+        retrieved_chunks = [hit['content'] for hit in hits if hit['content']]
 
         # 6. Build messages for OpenAI
         messages = [
@@ -1475,12 +1549,29 @@ def ai_chat():
 
         # 8. Call OpenAI
         client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.5,
-            max_tokens=300,
-        )
+        completion_kwargs = {"model": "gpt-4o", "temperature": 0.5, "max_tokens": 300}
+
+        # Streaming mode: forward tokens as SSE and save the reply once the stream ends
+        if data.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            db.close()
+
+            def save_reply(reply):
+                sdb = session_factory()
+                try:
+                    create_message(sdb, chat_id, role="assistant", content=reply)
+                finally:
+                    sdb.close()
+
+            return Response(
+                stream_chat_completion(client, messages, save_reply, meta={"chatId": chat_id},
+                                       logger=app.logger, **completion_kwargs),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        start = time.perf_counter()
+        resp = client.chat.completions.create(messages=messages, **completion_kwargs)
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
 
         assistant_reply = resp.choices[0].message.content.strip()
 
@@ -1490,7 +1581,7 @@ def ai_chat():
         db.close()
 
         # 10. Return result
-        return jsonify({"assistant": assistant_reply, "chatId": chat_id}), 200
+        return jsonify({"assistant": assistant_reply, "chatId": chat_id, "totalMs": total_ms}), 200
 
     except Exception as e:
         import traceback
@@ -1500,15 +1591,13 @@ def ai_chat():
 
 @app.route('/courses/<course_id>/citations', methods=['GET'])
 def citations_route(course_id):
-    course = get_course_by_id(Session(), course_id)
-    if not course.index_pkl:
+    db = Session()
+    try:
+        citations = retrieval_backend.course_citations(db, course_id)
+    finally:
+        db.close()
+    if not citations:
         return jsonify({'error':'No index built'}), 404
-    metadata = pickle.loads(course.index_pkl)
-    citations = [
-      {'source': md.get('source','Unknown'),
-       'citation': f"Mock APA Citation for {md.get('filename')}"}
-      for md in metadata.values()
-    ]
     return jsonify({'citations': citations}), 200
 
 @app.route('/sessionLogin', methods=['POST'])
@@ -1533,10 +1622,20 @@ def session_login():
 
 @app.route('/sessionLogout', methods=['POST'])
 def session_logout():
+    token = request.cookies.get('session')
+    if token:
+        principal_cache.invalidate_token(token)
     resp = jsonify({'message': 'Logged out'})
     resp.set_cookie('session', '', max_age=0)
     return resp, 200
 
+@app.route('/admin/pool-metrics', methods=['GET'])
+def admin_pool_metrics():
+    admin_id, err = verify_admin()
+    if err:
+        return err
+    return jsonify(pool_metrics(engine)), 200
+
 @app.route('/admin/users', methods=['GET', 'POST'])
 def admin_users():
     admin_id, err = verify_admin()
@@ -1600,11 +1699,13 @@ def admin_manage_user(user_id):
         updated = update_user(db, user_id=user_id, **data)
         if 'role_type' in data:
             set_role(db, user_id, data['role_type'])
+            principal_cache.invalidate_user(user_id)
         db.close()
         return jsonify({'id': str(updated.id), 'email': updated.email}), 200
 
     delete_user(db, user_id)
     db.close()
+    principal_cache.invalidate_user(user_id)
     return jsonify({'message': 'Deleted'}), 200
 
 @app.route('/admin/news', methods=['GET', 'POST'])
@@ -1750,17 +1851,15 @@ def raw_file_view(file_id):
     if err:
         return err
     db = Session()
-    f = get_file_by_id(db, file_id)
-    if not f:
+    course_id = get_file_course_id(db, file_id)
+    if not course_id:
         db.close()
         return jsonify({'error': 'File not found'}), 404
-    m = get_module_by_id(db, f.module_id)
-    if not m or not get_enrollment_by_student_course(db, user_id, m.course_id):
+    if not get_enrollment_by_student_course(db, user_id, course_id):
         db.close()
         return jsonify({'error': 'Forbidden'}), 403
-    f.view_count_raw += 1
-    db.commit()
     db.close()
+    file_events.record(file_id, 'view_raw')
     return '', 204
 
 @app.route('/student/files/<file_id>/view-personalized', methods=['POST'])
@@ -1769,17 +1868,15 @@ def personalized_file_view(file_id):
     if err:
         return err
     db = Session()
-    f = get_file_by_id(db, file_id)
-    if not f:
+    course_id = get_file_course_id(db, file_id)
+    if not course_id:
         db.close()
         return jsonify({'error': 'File not found'}), 404
-    m = get_module_by_id(db, f.module_id)
-    if not m or not get_enrollment_by_student_course(db, user_id, m.course_id):
+    if not get_enrollment_by_student_course(db, user_id, course_id):
         db.close()
         return jsonify({'error': 'Forbidden'}), 403
-    f.view_count_personalized += 1
-    db.commit()
     db.close()
+    file_events.record(file_id, 'view_personalized')
     return '', 204
 
 @app.route('/instructor/courses/<course_id>/faqs', methods=['GET'])
@@ -1792,11 +1889,9 @@ def instructor_course_faqs(course_id):
         course = get_course_by_id(db, course_id)
         if not course or str(course.instructor_id) != str(user_id):
             return jsonify({'error': 'Forbidden'}), 403
-        questions = get_student_questions_for_course(db, course_id)
-        title     = get_course_title(db, course_id)
+        faqs_payload = refresh_course_faqs(db, course_id, course.title)
     finally:
         db.close()
-    faqs_payload = prompt_course_faqs(title, questions)
     return jsonify(faqs_payload), 200
 
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class PrincipalCache:
+    """
+    Caches verified session cookies, keyed by sha256(cookie).
+
+    Each entry holds the decoded cookie claims and, once a role check has
+    run, the principal: user id, role and profile id. Claims are reused
+    until revocation_check_interval seconds have passed since Firebase last
+    confirmed the cookie was not revoked. The principal is reused for ttl
+    seconds. Nothing outlives the cookie's own expiry.
+    """
+
+    def __init__(self, ttl: float = 300, revocation_check_interval: float = 300,
+                 max_entries: int = 10000):
+        self.ttl = ttl
+        self.revocation_check_interval = revocation_check_interval
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live_entry(self, token, now):
+        key = token_hash(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_claims(self, token: str):
+        """Claims verified within the revocation check interval, else None."""
+        now = time.time()
+        with self._lock:
+            entry = self._live_entry(token, now)
+            if entry is None or now - entry['checked_at'] >= self.revocation_check_interval:
+                return None
+            return entry['claims']
+
+    def put_claims(self, token: str, claims: dict):
+        """Records claims just verified with check_revoked=True."""
+        now = time.time()
+        key = token_hash(token)
+        with self._lock:
+            entry = self._entries.get(key) or {'principal': None, 'principal_at': 0}
+            entry.update(claims=claims, checked_at=now,
+                         expires_at=float(claims.get('exp') or now + self.ttl))
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_principal(self, token: str):
+        now = time.time()
+        with self._lock:
+            entry = self._live_entry(token, now)
+            if entry is None or entry['principal'] is None or now - entry['principal_at'] >= self.ttl:
+                return None
+            return entry['principal']
+
+    def put_principal(self, token: str, principal: dict):
+        with self._lock:
+            entry = self._entries.get(token_hash(token))
+            if entry is not None:
+                entry.update(principal=principal, principal_at=time.time())
+
+    def invalidate_token(self, token: str):
+        with self._lock:
+            self._entries.pop(token_hash(token), None)
+
+    def invalidate_user(self, user_id):
+        """Drops every cached session of a user, e.g. after a role change or deletion."""
+        user_id = str(user_id)
+        with self._lock:
+            for key in [k for k, e in self._entries.items()
+                        if e['principal'] and str(e['principal']['user_id']) == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "300")),
+    revocation_check_interval=float(os.getenv("AUTH_REVOCATION_CHECK_INTERVAL", "300")),
+)
@@ -0,0 +1,179 @@
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Iterator
+
+# Bytes per read when streaming a blob to a client
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class BlobNotFound(KeyError):
+    pass
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed object storage for uploaded file bytes. Keys are the
+    sha256 hex digests FileBlob rows are keyed by, so writes are idempotent.
+    """
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        """Stores data under key."""
+
+    def get(self, key: str) -> bytes:
+        return b"".join(self.iter_range(key))
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        """Byte length of a blob; raises BlobNotFound if it is missing."""
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.size(key)
+            return True
+        except BlobNotFound:
+            return False
+
+    @abstractmethod
+    def iter_range(self, key: str, start: int = 0, end: int = None,
+                   chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yields bytes [start, end) of a blob (end=None reads to the end) in chunk_size reads."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Removes a blob; deleting a missing one is not an error."""
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under root, sharded as root/ab/cd/<key>."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def size(self, key: str) -> int:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def iter_range(self, key, start=0, end=None, chunk_size=READ_CHUNK_SIZE):
+        try:
+            f = open(self._path(key), 'rb')
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+        with f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                block = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore(BlobStore):
+    """Blobs in an S3-compatible bucket (AWS S3, MinIO) under an optional key prefix."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _missing(self, error) -> bool:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def size(self, key: str) -> int:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ContentLength']
+        except Exception as e:
+            if self._missing(e):
+                raise BlobNotFound(key)
+            raise
+
+    def iter_range(self, key, start=0, end=None, chunk_size=READ_CHUNK_SIZE):
+        if end is not None and end <= start:
+            return
+        byte_range = f"bytes={start}-{'' if end is None else end - 1}"
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._key(key), Range=byte_range)
+        except Exception as e:
+            if self._missing(e):
+                raise BlobNotFound(key)
+            raise
+        body = obj['Body']
+        try:
+            while True:
+                block = body.read(chunk_size)
+                if not block:
+                    break
+                yield block
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+@lru_cache(maxsize=None)
+def get_blob_store() -> BlobStore:
+    """
+    The store selected by BLOB_STORE ('local' or 's3'), built once per process.
+    There is no default: container disks (Knative, Cloud Run) are wiped on
+    every restart, so 'local' must be chosen explicitly along with a
+    BLOB_STORE_DIR on a mounted volume.
+    """
+    kind = os.getenv("BLOB_STORE")
+    if not kind:
+        raise RuntimeError("BLOB_STORE not set; use 's3', or 'local' with a persistent BLOB_STORE_DIR")
+    kind = kind.lower()
+    if kind == 'local':
+        root = os.getenv("BLOB_STORE_DIR")
+        if not root:
+            raise RuntimeError("BLOB_STORE_DIR not set for the local blob store")
+        return LocalBlobStore(root)
+    if kind == 's3':
+        return S3BlobStore(
+            bucket=os.environ["BLOB_STORE_BUCKET"],
+            prefix=os.getenv("BLOB_STORE_PREFIX", ""),
+            endpoint_url=os.getenv("BLOB_STORE_ENDPOINT") or None,
+        )
+    raise ValueError(f"Unknown BLOB_STORE '{kind}'")
@@ -0,0 +1,68 @@
+import json
+import logging
+import time
+from typing import Callable, Iterator
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Formats one Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+def _deltas(stream) -> Iterator[str]:
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def stream_chat_completion(client, messages: list, on_complete: Callable[[str], None],
+                           meta: dict = None, logger: logging.Logger = None,
+                           **create_kwargs) -> Iterator[str]:
+    """
+    Streams a chat completion as SSE frames:
+
+        event: meta   {...meta}                       (once, before the request)
+        data:         {"delta": "..."}                (per token chunk)
+        event: done   {"assistant", "ttftMs", "totalMs", ...meta}
+        event: error  {"error"}                       (if the stream fails)
+
+    on_complete receives the full reply once the stream ends, before "done"
+    is sent. If the client disconnects mid-stream, the rest of the completion
+    is still read and passed to on_complete before the generator closes.
+    """
+    logger = logger or logging.getLogger(__name__)
+    meta = meta or {}
+    yield sse_event(meta, event="meta")
+
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    try:
+        deltas = _deltas(client.chat.completions.create(messages=messages, stream=True, **create_kwargs))
+        for delta in deltas:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+
+        reply = "".join(parts).strip()
+        on_complete(reply)
+    except GeneratorExit:
+        # The client stopped reading: finish the completion so the reply is still saved
+        try:
+            parts.extend(deltas)
+            on_complete("".join(parts).strip())
+        except Exception:
+            logger.exception("chat stream: failed to save reply after client disconnect")
+        raise
+    except Exception as e:
+        logger.exception("chat stream failed")
+        yield sse_event({"error": str(e)}, event="error")
+        return
+
+    total = time.perf_counter() - start
+    ttft_ms = round((ttft if ttft is not None else total) * 1000, 1)
+    total_ms = round(total * 1000, 1)
+    logger.info("chat stream: ttft=%sms total=%sms chars=%s", ttft_ms, total_ms, len(reply))
+    yield sse_event({"assistant": reply, "ttftMs": ttft_ms, "totalMs": total_ms, **meta}, event="done")
@@ -0,0 +1,134 @@
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Union
+
+import tiktoken
+
+# Positions a boundary-aware chunk may end at: after sentence punctuation
+# (plus closing quotes/brackets) or after a blank line
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*(?=\s)')
+_PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n')
+
+BOUNDARIES = (None, 'sentence', 'paragraph')
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = "cl100k_base"):
+    return tiktoken.get_encoding(name)
+
+
+class Chunk(NamedTuple):
+    text: str
+    token_start: int
+    token_end: int
+    char_start: int
+    char_end: int
+
+
+class TokenChunker:
+    """
+    Splits text into windows of at most max_tokens tokens, overlapping by
+    overlap tokens. The text is encoded once and decoded once with token
+    offsets; chunk texts are slices of that decoded text.
+
+    boundary=None cuts at exactly max_tokens, like the original split_text.
+    'sentence' or 'paragraph' ends each window at the last such boundary
+    that still leaves it at least min_fill of max_tokens long; windows with
+    no such boundary are cut at max_tokens.
+    """
+
+    def __init__(self, max_tokens: int = 300, overlap: int = 50, boundary: str = None,
+                 min_fill: float = 0.5, encoding_name: str = "cl100k_base"):
+        if not 0 <= overlap < max_tokens:
+            raise ValueError("overlap must be between 0 and max_tokens - 1")
+        if boundary not in BOUNDARIES:
+            raise ValueError(f"Unknown chunk boundary '{boundary}'")
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.boundary = boundary
+        self.min_tokens = max(1, int(max_tokens * min_fill))
+        self.encoding_name = encoding_name
+
+    @property
+    def encoding(self):
+        return get_encoding(self.encoding_name)
+
+    def _boundary_tokens(self, text: str, offsets: List[int]) -> List[int]:
+        """Sorted indices of tokens that start at a boundary."""
+        if self.boundary is None:
+            return []
+        positions = {m.end() for m in _PARAGRAPH_BREAK.finditer(text)}
+        if self.boundary == 'sentence':
+            positions.update(m.end() for m in _SENTENCE_END.finditer(text))
+        return [i for i, off in enumerate(offsets) if i and off in positions]
+
+    def _windows(self, text: str, final: bool):
+        """
+        Chunks of text, the decoded text, and the token index and character
+        offset the next window starts at. Unless final, only windows that
+        cannot change with more text are cut.
+        """
+        enc = self.encoding
+        tokens = enc.encode(text, disallowed_special=())
+        text, offsets = enc.decode_with_offsets(tokens)
+        n = len(tokens)
+        offsets.append(len(text))
+        breaks = self._boundary_tokens(text, offsets)
+        # A boundary-aware window that reaches the end of the text may still
+        # find a better boundary once more text arrives
+        lookahead = 0 if self.boundary is None else 1
+
+        chunks = []
+        start = 0
+        while start < n and (final or start + self.max_tokens + lookahead <= n):
+            end = min(start + self.max_tokens, n)
+            if breaks and end < n:
+                i = bisect_right(breaks, end) - 1
+                if i >= 0 and breaks[i] >= start + self.min_tokens:
+                    end = breaks[i]
+            chunks.append(Chunk(text[offsets[start]:offsets[end]], start, end,
+                                offsets[start], offsets[end]))
+            if self.boundary is None:
+                start += self.max_tokens - self.overlap
+            elif end == n:
+                start = n
+            else:
+                start = max(end - self.overlap, start + 1)
+        start = min(start, n)
+        return chunks, text, start, offsets[start]
+
+    def chunks(self, text: str) -> List[Chunk]:
+        """Chunks with token ranges and character offsets into text."""
+        return self._windows(text, final=True)[0]
+
+    def iter_chunks(self, sections: Iterable[str]) -> Iterator[Chunk]:
+        """
+        Chunks a stream of sections joined with newlines. Windows are cut as
+        sections arrive and only the text after the last cut is carried over
+        (and re-encoded with the next section). Ranges are relative to the
+        whole stream.
+        """
+        carry, first = "", True
+        token_base = char_base = 0
+        for section in sections:
+            text = carry + (section if first else "\n" + section)
+            first = False
+            chunks, text, next_token, next_char = self._windows(text, final=False)
+            for c in chunks:
+                yield self._shift(c, token_base, char_base)
+            carry = text[next_char:]
+            token_base, char_base = token_base + next_token, char_base + next_char
+        if carry:
+            for c in self._windows(carry, final=True)[0]:
+                yield self._shift(c, token_base, char_base)
+
+    @staticmethod
+    def _shift(chunk: Chunk, tokens: int, chars: int) -> Chunk:
+        return chunk._replace(token_start=chunk.token_start + tokens, token_end=chunk.token_end + tokens,
+                              char_start=chunk.char_start + chars, char_end=chunk.char_end + chars)
+
+    def split(self, text: Union[str, Iterable[str]]) -> List[str]:
+        if isinstance(text, str):
+            return [c.text for c in self.chunks(text)]
+        return [c.text for c in self.iter_chunks(text)]
@@ -0,0 +1,59 @@
+import os
+from datetime import datetime, timedelta
+
+from src.db.queries import (
+    get_course_faq_state, get_course_faq_state_for_update, get_database_now,
+    get_student_questions_since
+)
+from src.faq_engine import FaqState
+from src.prompts import prompt_label_faqs
+from src.textUtils import openai_embed_text
+
+# Messages inserted less than this long ago (by the database clock) are left
+# for the next refresh, so one whose transaction commits late is not skipped
+FAQ_WATERMARK_GRACE = timedelta(seconds=float(os.getenv("FAQ_WATERMARK_GRACE", "5")))
+
+
+def refresh_course_faqs(db, course_id, course_title: str, top_n: int = 10,
+                        now: datetime = None) -> dict:
+    """
+    Folds student questions asked since the course's watermark into its
+    persisted FAQ clusters and returns the top_n as {"faqs": [...]}.
+
+    Only new messages are embedded and clustered. Only top clusters without
+    a label go to the LLM, and their labels are stored with the clusters.
+    Those calls run without locks: the state row is locked only to write
+    the result, which is dropped if another refresh wrote the row first.
+    """
+    now = now or get_database_now(db)
+    row = get_course_faq_state(db, course_id)
+    seen = (row.last_message_seq, row.updated_at)
+    state = FaqState.load(row.clusters, row.centroid_sums, row.dim)
+    rows = get_student_questions_since(db, course_id, row.last_message_seq,
+                                       until=now - FAQ_WATERMARK_GRACE)
+    db.commit()
+
+    if rows:
+        state.add([r.content for r in rows], openai_embed_text)
+    top = state.top(top_n)
+    unlabelled = [c for c in top if not c.label]
+    if unlabelled:
+        # Fall back to the raw representatives if the labels don't line up
+        for cluster, label in zip(unlabelled, prompt_label_faqs(course_title, unlabelled) or []):
+            cluster.label = label
+    if not (rows or unlabelled):
+        return {"faqs": [c.to_dict() for c in top]}
+
+    row = get_course_faq_state_for_update(db, course_id)
+    if (row.last_message_seq, row.updated_at) != seen:
+        # Another refresh got there first; serve its clusters, and the
+        # messages it has not folded in stay past the watermark for next time
+        db.commit()
+        state = FaqState.load(row.clusters, row.centroid_sums, row.dim)
+        return {"faqs": [c.to_dict() for c in state.top(top_n)]}
+    row.clusters, row.centroid_sums, row.dim = state.dump()
+    if rows:
+        row.last_message_seq = rows[-1].seq
+    row.updated_at = now
+    db.commit()
+    return {"faqs": [c.to_dict() for c in top]}
@@ -0,0 +1,15 @@
+-- Retrieval is served from "FileChunk" (RETRIEVAL_BACKEND=pgvector), so the
+-- per-file and per-course FAISS blobs are no longer built or read.
+-- Skip this migration for deployments that keep RETRIEVAL_BACKEND=faiss.
+UPDATE "File" SET "index_faiss" = NULL, "index_pkl" = NULL
+  WHERE "index_faiss" IS NOT NULL OR "index_pkl" IS NOT NULL;
+UPDATE "Course" SET "index_faiss" = NULL, "index_pkl" = NULL
+  WHERE "index_faiss" IS NOT NULL OR "index_pkl" IS NOT NULL;
+
+-- The freed TOAST space is reused by later writes once autovacuum runs.
+-- Returning it to the OS is optional manual maintenance, not part of this
+-- migration: VACUUM cannot run inside a transaction block, and VACUUM FULL
+-- holds an ACCESS EXCLUSIVE lock on the table for the whole rewrite. If
+-- needed, run these separately in a maintenance window:
+--   VACUUM FULL "File";
+--   VACUUM FULL "Course";
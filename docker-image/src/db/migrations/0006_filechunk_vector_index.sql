@@ -0,0 +1,17 @@
+-- ANN index for "FileChunk".embedding plus a course-scoped btree for the
+-- WHERE course_id = :cid filter. CONCURRENTLY keeps the table writable while
+-- the indexes build; run this file outside a transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_filechunk_course_file
+  ON "FileChunk" ("course_id", "file_id");
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_filechunk_embedding_hnsw
+  ON "FileChunk" USING hnsw ("embedding" vector_l2_ops)
+  WITH (m = 16, ef_construction = 64);
+
+-- IVFFlat alternative (faster to build, lower recall at equal latency).
+-- Build it after the table holds data; pick lists ~ rows / 1000, then set
+-- VECTOR_INDEX=ivfflat so queries tune ivfflat.probes instead of hnsw.ef_search.
+-- CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_filechunk_embedding_ivfflat
+--   ON "FileChunk" USING ivfflat ("embedding" vector_l2_ops) WITH (lists = 100);
+
+ANALYZE "FileChunk";
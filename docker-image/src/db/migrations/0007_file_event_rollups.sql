@@ -0,0 +1,43 @@
+-- Append-only file event log plus hourly rollups that reports read from.
+-- Existing "File" counters are carried over as a single rollup bucket at
+-- migration time so report totals stay continuous.
+CREATE TABLE IF NOT EXISTS "FileEvent" (
+  "id" BIGSERIAL PRIMARY KEY,
+  "file_id" UUID NOT NULL,
+  "event_type" VARCHAR(32) NOT NULL,
+  "hour" TIMESTAMP NOT NULL,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  CONSTRAINT fk_fileevent_file FOREIGN KEY("file_id") REFERENCES "File"("id") ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS "FileEventRollup" (
+  "file_id" UUID NOT NULL,
+  "hour" TIMESTAMP NOT NULL,
+  "event_type" VARCHAR(32) NOT NULL,
+  "module_id" UUID NOT NULL,
+  "course_id" UUID NOT NULL,
+  "count" INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY ("file_id", "hour", "event_type"),
+  CONSTRAINT fk_fileeventrollup_file FOREIGN KEY("file_id") REFERENCES "File"("id") ON DELETE CASCADE,
+  CONSTRAINT fk_fileeventrollup_course FOREIGN KEY("course_id") REFERENCES "Course"("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS ix_fileeventrollup_course_hour ON "FileEventRollup" ("course_id", "hour");
+
+CREATE TABLE IF NOT EXISTS "FileEventRollupState" (
+  "name" VARCHAR(32) PRIMARY KEY,
+  "last_event_id" BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO "FileEventRollupState" ("name", "last_event_id")
+  VALUES ('file_events', 0) ON CONFLICT DO NOTHING;
+
+INSERT INTO "FileEventRollup" ("file_id", "hour", "event_type", "module_id", "course_id", "count")
+SELECT f."id", date_trunc('hour', now() AT TIME ZONE 'utc'), c.event_type, m."id", m."course_id", c.n
+FROM "File" f
+JOIN "Module" m ON m."id" = f."module_id"
+CROSS JOIN LATERAL (VALUES
+  ('view_raw', f."view_count_raw"),
+  ('view_personalized', f."view_count_personalized"),
+  ('chat', f."chat_count")
+) AS c(event_type, n)
+WHERE c.n > 0
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,14 @@
+-- Per-course FAQ clusters, updated incrementally from user messages newer
+-- than the (last_message_at, last_message_id) watermark.
+CREATE TABLE IF NOT EXISTS "CourseFaqState" (
+  "course_id" UUID PRIMARY KEY,
+  "clusters" JSONB NOT NULL DEFAULT '[]'::jsonb,
+  "centroid_sums" BYTEA,
+  "dim" INTEGER,
+  "last_message_at" TIMESTAMP,
+  "last_message_id" UUID,
+  "updated_at" TIMESTAMP NOT NULL DEFAULT now(),
+  CONSTRAINT fk_coursefaqstate_course FOREIGN KEY("course_id") REFERENCES "Course"("id") ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_message_role_created ON "Message" ("role", "created_at", "id");
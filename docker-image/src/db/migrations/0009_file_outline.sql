@@ -0,0 +1,11 @@
+-- Cached persona-independent outlines for personalized file generation,
+-- keyed by file, chunk content hash and outline prompt version.
+CREATE TABLE IF NOT EXISTS "FileOutline" (
+  "file_id" UUID NOT NULL,
+  "content_hash" VARCHAR(64) NOT NULL,
+  "prompt_version" VARCHAR(32) NOT NULL,
+  "outline" TEXT NOT NULL,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  PRIMARY KEY ("file_id", "content_hash", "prompt_version"),
+  CONSTRAINT fk_fileoutline_file FOREIGN KEY("file_id") REFERENCES "File"("id") ON DELETE CASCADE
+);
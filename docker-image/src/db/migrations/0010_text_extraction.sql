@@ -0,0 +1,15 @@
+-- Extracted text and chunk boundaries cached by sha256 of the uploaded bytes,
+-- so re-indexing never re-parses a file it has seen before.
+ALTER TABLE "File" ADD COLUMN IF NOT EXISTS "content_hash" VARCHAR(64);
+UPDATE "File" SET "content_hash" = encode(sha256("file_data"), 'hex')
+  WHERE "content_hash" IS NULL;
+
+CREATE TABLE IF NOT EXISTS "TextExtraction" (
+  "content_hash" VARCHAR(64) NOT NULL,
+  "extractor" VARCHAR(32) NOT NULL,
+  "text" TEXT NOT NULL,
+  "clean_text" TEXT,
+  "chunkings" JSONB NOT NULL DEFAULT '{}'::jsonb,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  PRIMARY KEY ("content_hash", "extractor")
+);
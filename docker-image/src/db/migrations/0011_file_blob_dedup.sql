@@ -0,0 +1,42 @@
+-- File bytes move to "FileBlob", stored once per sha256 and reference
+-- counted by the "File" rows that point at them. Run after 0010.
+-- This step only copies: "File"."file_data" is kept (and made nullable, as
+-- the app no longer writes it) until 0016 drops it after checking the copy.
+CREATE TABLE IF NOT EXISTS "FileBlob" (
+  "content_hash" VARCHAR(64) PRIMARY KEY,
+  "data" BYTEA NOT NULL,
+  "size" BIGINT NOT NULL,
+  "ref_count" INTEGER NOT NULL DEFAULT 0,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now()
+);
+
+INSERT INTO "FileBlob" ("content_hash", "data", "size", "ref_count")
+SELECT DISTINCT ON ("content_hash") "content_hash", "file_data", octet_length("file_data"), 0
+  FROM "File"
+ WHERE "file_data" IS NOT NULL
+ ORDER BY "content_hash", "created_at"
+ON CONFLICT ("content_hash") DO NOTHING;
+
+UPDATE "FileBlob" b
+   SET "ref_count" = (SELECT count(*) FROM "File" f WHERE f."content_hash" = b."content_hash");
+
+ALTER TABLE "File" ALTER COLUMN "content_hash" SET NOT NULL;
+ALTER TABLE "File" ALTER COLUMN "file_data" DROP NOT NULL;
+
+CREATE INDEX IF NOT EXISTS ix_file_content_hash ON "File" ("content_hash");
+
+-- Fails the migration if any file's bytes did not make it into "FileBlob"
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1
+      FROM "File" f
+      LEFT JOIN "FileBlob" b ON b."content_hash" = f."content_hash"
+     WHERE f."file_data" IS NOT NULL
+       AND (b."content_hash" IS NULL
+            OR b."size" <> octet_length(f."file_data")
+            OR encode(sha256(f."file_data"), 'hex') <> f."content_hash")
+  ) THEN
+    RAISE EXCEPTION 'FileBlob copy is incomplete; fix it before running 0016';
+  END IF;
+END $$;
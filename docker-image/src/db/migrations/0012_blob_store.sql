@@ -0,0 +1,4 @@
+-- File bytes are written to the blob store (BLOB_STORE=local|s3) and
+-- "FileBlob" keeps only metadata. Existing bytes stay readable from "data"
+-- until moved with: python -m src.db.move_blobs
+ALTER TABLE "FileBlob" ALTER COLUMN "data" DROP NOT NULL;
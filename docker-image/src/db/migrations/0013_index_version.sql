@@ -0,0 +1,4 @@
+-- Version counters for the FAISS blobs, so cached deserialized indexes are
+-- validated without reading the blobs. Bumped by every write of the blobs.
+ALTER TABLE "Course" ADD COLUMN IF NOT EXISTS "index_version" INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "File" ADD COLUMN IF NOT EXISTS "index_version" INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,6 @@
+-- Server-side insert time for "FileEvent". The rollup watermark advances
+-- only past rows inserted more than the grace period ago, by the database
+-- clock; "created_at" is the app-side event time, which is old for batches
+-- re-queued after a failed flush. Existing rows get the migration time.
+ALTER TABLE "FileEvent" ADD COLUMN IF NOT EXISTS "inserted_at" TIMESTAMP NOT NULL
+  DEFAULT timezone('utc', clock_timestamp());
@@ -0,0 +1,4 @@
+-- "TextExtraction" rows are now deleted with the last "FileBlob" reference
+-- to their hash; drop the ones left behind by files deleted before that.
+DELETE FROM "TextExtraction" t
+ WHERE NOT EXISTS (SELECT 1 FROM "FileBlob" b WHERE b."content_hash" = t."content_hash");
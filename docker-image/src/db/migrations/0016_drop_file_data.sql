@@ -0,0 +1,27 @@
+-- Irreversible: drops the original copy of every file's bytes. Run it as
+-- its own step, once 0011 has succeeded and the app has run on "FileBlob"
+-- (and, with 0012, the blob store) for a while. Take a backup first.
+-- The check below aborts the migration if any file still lacks its blob.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1
+      FROM "File" f
+      LEFT JOIN "FileBlob" b ON b."content_hash" = f."content_hash"
+     WHERE b."content_hash" IS NULL
+        OR (f."file_data" IS NOT NULL
+            AND (b."size" <> octet_length(f."file_data")
+                 OR encode(sha256(f."file_data"), 'hex') <> f."content_hash"))
+  ) THEN
+    RAISE EXCEPTION 'Some files have no matching FileBlob; not dropping "File"."file_data"';
+  END IF;
+END $$;
+
+ALTER TABLE "File" DROP COLUMN IF EXISTS "file_data";
+
+-- The dropped bytes' TOAST space is reused by later writes once autovacuum
+-- runs. Returning it to the OS is optional manual maintenance, not part of
+-- this migration: VACUUM cannot run inside a transaction block, and
+-- VACUUM FULL holds an ACCESS EXCLUSIVE lock on "File" for the whole
+-- rewrite. If needed, run it separately in a maintenance window:
+--   VACUUM FULL "File";
@@ -0,0 +1,30 @@
+-- Database-assigned insert order ("seq") and insert time ("inserted_at")
+-- for "Message". The FAQ watermark follows "seq" and only moves past
+-- messages inserted more than the grace period ago by the database clock;
+-- "created_at" comes from the app clock and can predate a late commit.
+CREATE SEQUENCE IF NOT EXISTS message_seq;
+ALTER TABLE "Message" ADD COLUMN IF NOT EXISTS "seq" BIGINT;
+ALTER TABLE "Message" ADD COLUMN IF NOT EXISTS "inserted_at" TIMESTAMP NOT NULL
+  DEFAULT timezone('utc', clock_timestamp());
+
+-- Existing messages are numbered in created_at order
+UPDATE "Message" m
+   SET "seq" = o.n
+  FROM (SELECT "id", row_number() OVER (ORDER BY "created_at", "id") AS n FROM "Message") o
+ WHERE m."id" = o."id" AND m."seq" IS NULL;
+SELECT setval('message_seq', coalesce((SELECT max("seq") FROM "Message"), 0) + 1, false);
+ALTER TABLE "Message" ALTER COLUMN "seq" SET DEFAULT nextval('message_seq');
+ALTER TABLE "Message" ALTER COLUMN "seq" SET NOT NULL;
+ALTER SEQUENCE message_seq OWNED BY "Message"."seq";
+
+CREATE INDEX IF NOT EXISTS ix_message_role_seq ON "Message" ("role", "seq");
+DROP INDEX IF EXISTS ix_message_role_created;
+
+-- The (last_message_at, last_message_id) watermark becomes the folded message's seq
+ALTER TABLE "CourseFaqState" ADD COLUMN IF NOT EXISTS "last_message_seq" BIGINT NOT NULL DEFAULT 0;
+UPDATE "CourseFaqState" s
+   SET "last_message_seq" = m."seq"
+  FROM "Message" m
+ WHERE m."id" = s."last_message_id";
+ALTER TABLE "CourseFaqState" DROP COLUMN IF EXISTS "last_message_at";
+ALTER TABLE "CourseFaqState" DROP COLUMN IF EXISTS "last_message_id";
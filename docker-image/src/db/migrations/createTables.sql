@@ -52,6 +52,7 @@ CREATE TABLE IF NOT EXISTS "Course" (
   "created_at" TIMESTAMP NOT NULL DEFAULT now(),
   "index_pkl" BYTEA,
   "index_faiss" BYTEA,
+  "index_version" INTEGER NOT NULL DEFAULT 0,
   "instructor_id" UUID NOT NULL,
   CONSTRAINT fk_course_instructor FOREIGN KEY("instructor_id") REFERENCES "InstructorProfile"("user_id") ON DELETE CASCADE
 );
@@ -70,7 +71,7 @@ CREATE TABLE IF NOT EXISTS "File" (
   "filename" VARCHAR NOT NULL,
   "file_type" VARCHAR NOT NULL,
   "file_size" INTEGER NOT NULL,
-  "file_data" BYTEA NOT NULL,
+  "content_hash" VARCHAR(64) NOT NULL,
   "transcription" TEXT,
   "created_at" TIMESTAMP NOT NULL DEFAULT now(),
   CONSTRAINT fk_file_module FOREIGN KEY("module_id") REFERENCES "Module"("id") ON DELETE CASCADE
@@ -126,14 +127,21 @@ CREATE TABLE IF NOT EXISTS "Chat" (
   CONSTRAINT fk_chat_file FOREIGN KEY("file_id") REFERENCES "File"("id") ON DELETE SET NULL
 );
 
+CREATE SEQUENCE IF NOT EXISTS message_seq;
+
 CREATE TABLE IF NOT EXISTS "Message" (
   "id" UUID PRIMARY KEY DEFAULT gen_random_uuid(),
   "chat_id" UUID NOT NULL,
   "role" VARCHAR NOT NULL,
   "content" TEXT NOT NULL,
   "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  "seq" BIGINT NOT NULL DEFAULT nextval('message_seq'),
+  "inserted_at" TIMESTAMP NOT NULL DEFAULT timezone('utc', clock_timestamp()),
   CONSTRAINT fk_message_chat FOREIGN KEY("chat_id") REFERENCES "Chat"("id") ON DELETE CASCADE
 );
+ALTER SEQUENCE message_seq OWNED BY "Message"."seq";
+
+CREATE INDEX IF NOT EXISTS ix_message_role_seq ON "Message" ("role", "seq");
 
 CREATE TABLE IF NOT EXISTS "Report" (
   "id" UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -163,4 +171,98 @@ ALTER TABLE "File" ADD COLUMN index_faiss bytea;
 ALTER TABLE "File" ADD COLUMN ordering integer NOT NULL DEFAULT 0;
 ALTER TABLE "File" ADD COLUMN view_count_raw INTEGER NOT NULL DEFAULT 0,
 ALTER TABLE "File" ADD COLUMN view_count_personalized INTEGER NOT NULL DEFAULT 0,
-ALTER TABLE "File" ADD COLUMN chat_count INTEGER NOT NULL DEFAULT 0;
\ No newline at end of file
+ALTER TABLE "File" ADD COLUMN chat_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "File" ADD COLUMN index_version INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS "IngestionJob" (
+  "id" UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  "file_id" UUID NOT NULL,
+  "course_id" UUID NOT NULL,
+  "status" VARCHAR(16) NOT NULL DEFAULT 'queued',
+  "stage" VARCHAR(32),
+  "stages" JSONB NOT NULL DEFAULT '{}'::jsonb,
+  "error" TEXT,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  "updated_at" TIMESTAMP NOT NULL DEFAULT now(),
+  CONSTRAINT fk_ingestionjob_file FOREIGN KEY("file_id") REFERENCES "File"("id") ON DELETE CASCADE,
+  CONSTRAINT fk_ingestionjob_course FOREIGN KEY("course_id") REFERENCES "Course"("id") ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS "EmbeddingCache" (
+  "model" VARCHAR(64) NOT NULL,
+  "content_hash" VARCHAR(64) NOT NULL,
+  "dim" INTEGER NOT NULL,
+  "embedding" BYTEA NOT NULL,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  PRIMARY KEY ("model", "content_hash")
+);
+
+CREATE INDEX IF NOT EXISTS ix_filechunk_course_file ON "FileChunk" ("course_id", "file_id");
+CREATE INDEX IF NOT EXISTS ix_filechunk_embedding_hnsw ON "FileChunk"
+  USING hnsw ("embedding" vector_l2_ops) WITH (m = 16, ef_construction = 64);
+
+CREATE TABLE IF NOT EXISTS "FileEvent" (
+  "id" BIGSERIAL PRIMARY KEY,
+  "file_id" UUID NOT NULL,
+  "event_type" VARCHAR(32) NOT NULL,
+  "hour" TIMESTAMP NOT NULL,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  "inserted_at" TIMESTAMP NOT NULL DEFAULT timezone('utc', clock_timestamp()),
+  CONSTRAINT fk_fileevent_file FOREIGN KEY("file_id") REFERENCES "File"("id") ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS "FileEventRollup" (
+  "file_id" UUID NOT NULL,
+  "hour" TIMESTAMP NOT NULL,
+  "event_type" VARCHAR(32) NOT NULL,
+  "module_id" UUID NOT NULL,
+  "course_id" UUID NOT NULL,
+  "count" INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY ("file_id", "hour", "event_type"),
+  CONSTRAINT fk_fileeventrollup_file FOREIGN KEY("file_id") REFERENCES "File"("id") ON DELETE CASCADE,
+  CONSTRAINT fk_fileeventrollup_course FOREIGN KEY("course_id") REFERENCES "Course"("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS ix_fileeventrollup_course_hour ON "FileEventRollup" ("course_id", "hour");
+
+CREATE TABLE IF NOT EXISTS "FileEventRollupState" (
+  "name" VARCHAR(32) PRIMARY KEY,
+  "last_event_id" BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS "CourseFaqState" (
+  "course_id" UUID PRIMARY KEY,
+  "clusters" JSONB NOT NULL DEFAULT '[]'::jsonb,
+  "centroid_sums" BYTEA,
+  "dim" INTEGER,
+  "last_message_seq" BIGINT NOT NULL DEFAULT 0,
+  "updated_at" TIMESTAMP NOT NULL DEFAULT now(),
+  CONSTRAINT fk_coursefaqstate_course FOREIGN KEY("course_id") REFERENCES "Course"("id") ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS "FileOutline" (
+  "file_id" UUID NOT NULL,
+  "content_hash" VARCHAR(64) NOT NULL,
+  "prompt_version" VARCHAR(32) NOT NULL,
+  "outline" TEXT NOT NULL,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  PRIMARY KEY ("file_id", "content_hash", "prompt_version"),
+  CONSTRAINT fk_fileoutline_file FOREIGN KEY("file_id") REFERENCES "File"("id") ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS "TextExtraction" (
+  "content_hash" VARCHAR(64) NOT NULL,
+  "extractor" VARCHAR(32) NOT NULL,
+  "text" TEXT NOT NULL,
+  "clean_text" TEXT,
+  "chunkings" JSONB NOT NULL DEFAULT '{}'::jsonb,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+  PRIMARY KEY ("content_hash", "extractor")
+);
+
+CREATE TABLE IF NOT EXISTS "FileBlob" (
+  "content_hash" VARCHAR(64) PRIMARY KEY,
+  "data" BYTEA,
+  "size" BIGINT NOT NULL,
+  "ref_count" INTEGER NOT NULL DEFAULT 0,
+  "created_at" TIMESTAMP NOT NULL DEFAULT now()
+);
@@ -2,9 +2,19 @@ DROP TABLE IF EXISTS "News" CASCADE;
 DROP TABLE IF EXISTS "Market" CASCADE;
 DROP TABLE IF EXISTS "Report" CASCADE;
 DROP TABLE IF EXISTS "Message" CASCADE;
+DROP SEQUENCE IF EXISTS message_seq;
 DROP TABLE IF EXISTS "Chat" CASCADE;
 DROP TABLE IF EXISTS "PersonalizedFile" CASCADE;
 DROP TABLE IF EXISTS "Enrollment" CASCADE;
+DROP TABLE IF EXISTS "FileBlob" CASCADE;
+DROP TABLE IF EXISTS "TextExtraction" CASCADE;
+DROP TABLE IF EXISTS "FileOutline" CASCADE;
+DROP TABLE IF EXISTS "CourseFaqState" CASCADE;
+DROP TABLE IF EXISTS "FileEventRollupState" CASCADE;
+DROP TABLE IF EXISTS "FileEventRollup" CASCADE;
+DROP TABLE IF EXISTS "FileEvent" CASCADE;
+DROP TABLE IF EXISTS "IngestionJob" CASCADE;
+DROP TABLE IF EXISTS "EmbeddingCache" CASCADE;
 DROP TABLE IF EXISTS "AccessCode" CASCADE;
 DROP TABLE IF EXISTS "File" CASCADE;
 Drop Table IF EXISTS "FileChunk" CASCADE;
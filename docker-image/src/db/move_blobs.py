@@ -0,0 +1,39 @@
+"""
+Moves FileBlob bytes still held in Postgres into the configured blob store
+(BLOB_STORE / BLOB_STORE_DIR / BLOB_STORE_BUCKET), one row at a time.
+
+    python -m src.db.move_blobs --batch 50
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db.queries import get_file_blobs_in_database, move_file_blob_to_store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    load_dotenv()
+    Session = sessionmaker(bind=create_engine(os.environ["POSTGRES_URL"]))
+    moved = 0
+    db = Session()
+    try:
+        while True:
+            hashes = get_file_blobs_in_database(db, args.batch)
+            if not hashes:
+                break
+            for content_hash in hashes:
+                moved += move_file_blob_to_store(db, content_hash)
+            print(f"moved {moved} blobs")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
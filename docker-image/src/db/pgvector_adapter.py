@@ -0,0 +1,37 @@
+from sqlalchemy import event
+from pgvector.sqlalchemy import Vector
+
+
+class NativeVector(Vector):
+    """
+    Vector type for query parameters. When the pgvector driver adapter is
+    registered, numpy arrays are handed to the driver untouched (binary
+    format on psycopg 3) instead of being formatted as a '[...]' string.
+    """
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        if getattr(dialect, '_pgvector_native', False):
+            return None
+        return super().bind_processor(dialect)
+
+
+def register_vector_adapter(engine):
+    """
+    Registers pgvector's psycopg/psycopg2 adapter on every new connection.
+    No-op for other dialects (e.g. SQLite in tests).
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    if engine.dialect.driver == 'psycopg':
+        from pgvector.psycopg import register_vector
+    elif engine.dialect.driver == 'psycopg2':
+        from pgvector.psycopg2 import register_vector
+    else:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _register(dbapi_connection, connection_record):
+        register_vector(dbapi_connection)
+
+    engine.dialect._pgvector_native = True
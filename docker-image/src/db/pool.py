@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that also counts checkouts which found the pool exhausted
+    (no idle connection, overflow used up) and had to wait, how long they
+    waited, and how many gave up after pool_timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self._metrics_lock = threading.Lock()
+
+    def _do_get(self):
+        must_wait = (self._max_overflow > -1 and self._overflow >= self._max_overflow
+                     and self._pool.empty())
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            if must_wait:
+                with self._metrics_lock:
+                    self.waits += 1
+                    self.wait_seconds += time.perf_counter() - start
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def engine_options(url: str) -> dict:
+    """
+    create_engine() keyword arguments for the app's database, read from env.
+    Pool settings only apply to Postgres; SQLite (tests) keeps its default pool.
+    """
+    if make_url(url).get_backend_name() != 'postgresql':
+        return {}
+    options = {
+        'poolclass':     InstrumentedQueuePool,
+        'pool_size':     int(os.getenv("DB_POOL_SIZE", "5")),
+        'max_overflow':  int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        'pool_timeout':  float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        'pool_recycle':  int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        'pool_pre_ping': _env_bool("DB_POOL_PRE_PING", "true"),
+    }
+    statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+    if statement_timeout_ms > 0:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    return options
+
+
+def pool_metrics(engine) -> dict:
+    pool = engine.pool
+    metrics = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            checkedOut=pool.checkedout(),
+            checkedIn=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            maxOverflow=pool._max_overflow,
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        metrics.update(
+            waits=pool.waits,
+            waitSeconds=round(pool.wait_seconds, 3),
+            timeouts=pool.timeouts,
+        )
+    return metrics
@@ -1,9 +1,14 @@
-from sqlalchemy import func, select, asc, desc, delete
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, asc, desc, delete, bindparam, update, or_, and_
+from sqlalchemy.orm import Session, undefer, undefer_group, selectinload
+from collections import Counter
 from werkzeug.security import generate_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 import uuid
 
+from src.db.pgvector_adapter import NativeVector
+from src.faiss_cache import faiss_index_cache
+from src.blobstore import get_blob_store
 from src.db.schema import (
     User,
     Role,
@@ -14,6 +19,15 @@ from src.db.schema import (
     Module,
     File,
     FileChunk,
+    EmbeddingCacheEntry,
+    IngestionJob,
+    FileEvent,
+    FileEventRollup,
+    FileEventRollupState,
+    CourseFaqState,
+    FileOutline,
+    TextExtraction,
+    FileBlob,
     AccessCode,
     Enrollment,
     PersonalizedFile,
@@ -21,7 +35,8 @@ from src.db.schema import (
     Message,
     Report,
     News,
-    Market
+    Market,
+    utc_clock
 )
 
 # --- User & Role CRUD ---
@@ -68,11 +83,26 @@ def update_user(db: Session, user_id: str, **kwargs):
     return user
 
 
+def _instructor_file_hashes(db: Session, user_id) -> list:
+    """content_hash of every file in the instructor's courses, one per File row."""
+    if isinstance(user_id, str):
+        user_id = uuid.UUID(user_id)
+    return db.execute(
+        select(File.content_hash)
+        .join(Module, Module.id == File.module_id)
+        .join(Course, Course.id == Module.course_id)
+        .filter(Course.instructor_id == user_id)
+    ).scalars().all()
+
+
 def delete_user(db: Session, user_id: str):
     user = get_user_by_id(db, user_id)
     if user:
+        # An instructor's courses and files go with the user through ON DELETE CASCADE
+        released = release_file_blobs(db, _instructor_file_hashes(db, user.id))
         db.delete(user)
         db.commit()
+        purge_file_blobs(db, released)
 
 
 def get_role_by_user_id(db: Session, user_id):
@@ -135,8 +165,11 @@ def update_instructor_profile(db: Session, user_id: str, **kwargs):
 def delete_instructor_profile(db: Session, user_id: str):
     prof = get_instructor_profile(db, user_id)
     if prof:
+        # Courses and their files go with the profile through ON DELETE CASCADE
+        released = release_file_blobs(db, _instructor_file_hashes(db, prof.user_id))
         db.delete(prof)
         db.commit()
+        purge_file_blobs(db, released)
 
 
 def get_student_profile(db: Session, user_id):
@@ -228,10 +261,26 @@ def delete_admin_profile(db: Session, user_id: str):
 
 # --- Course CRUD ---
 
-def get_course_by_id(db: Session, course_id):
+def get_course_by_id(db: Session, course_id, with_index: bool = False):
+    """with_index also loads the deferred index_faiss/index_pkl blobs."""
     if isinstance(course_id, str):
         course_id = uuid.UUID(course_id)
-    return db.execute(select(Course).filter_by(id=course_id)).scalars().first()
+    stmt = select(Course).filter_by(id=course_id)
+    if with_index:
+        stmt = stmt.options(undefer_group('index'))
+    return db.execute(stmt).scalars().first()
+
+
+def get_course_for_update(db: Session, course_id):
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    return db.execute(
+        select(Course)
+        .filter_by(id=course_id)
+        .options(undefer_group('index'))
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalars().first()
 
 
 def get_courses_by_instructor_id(db: Session, instructor_id):
@@ -285,7 +334,13 @@ def update_course(db: Session, course_id: str, **kwargs):
     for key in ('title', 'description', 'code', 'term', 'index_pkl', 'index_faiss', 'published'):
         if key in kwargs:
             setattr(c, key, kwargs[key])
+    if 'index_faiss' in kwargs or 'index_pkl' in kwargs:
+        c.index_version = Course.index_version + 1
+    if any(key in kwargs for key in ('title', 'description', 'code', 'term', 'published')):
+        c.last_updated = datetime.utcnow()
     db.commit()
+    if 'index_faiss' in kwargs or 'index_pkl' in kwargs:
+        faiss_index_cache.invalidate('course', c.id)
     db.refresh(c)
     return c
 
@@ -295,9 +350,82 @@ def update_course(db: Session, course_id: str, **kwargs):
 def delete_course(db: Session, course_id: str):
     db.query(AccessCode).filter(AccessCode.course_id == course_id).delete()
     c = get_course_by_id(db, course_id)
+    released = []
     if c:
+        # Files go with the course through ON DELETE CASCADE; drop their blob references first
+        released = release_file_blobs(db, db.execute(
+            select(File.content_hash).join(Module, Module.id == File.module_id)
+            .filter(Module.course_id == c.id)
+        ).scalars().all())
         db.delete(c)
+        faiss_index_cache.invalidate('course', c.id)
     db.commit()
+    purge_file_blobs(db, released)
+
+
+def touch_course(db: Session, course_id=None, module_id=None):
+    """
+    Bumps Course.last_updated, the version behind the course tree ETag.
+    Takes the course directly or via one of its modules; the caller commits.
+    """
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    if isinstance(module_id, str):
+        module_id = uuid.UUID(module_id)
+    if course_id is None:
+        course_id = select(Module.course_id).filter(Module.id == module_id).scalar_subquery()
+    db.execute(
+        update(Course)
+        .where(Course.id == course_id)
+        .values(last_updated=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def get_course_version(db: Session, course_id):
+    """(instructor_id, last_updated) for a course without loading its index blobs."""
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    return db.execute(
+        select(Course.instructor_id, Course.last_updated).filter(Course.id == course_id)
+    ).first()
+
+
+def get_course_tree(db: Session, course_id) -> list[dict]:
+    """
+    Modules of a course with their files (id, title, ordering only), in one
+    query. File blobs are never loaded.
+    """
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    rows = db.execute(
+        select(
+            Module.id, Module.title, Module.ordering,
+            File.id.label("file_id"), File.title.label("file_title"),
+            File.ordering.label("file_ordering"),
+        )
+        .outerjoin(File, File.module_id == Module.id)
+        .filter(Module.course_id == course_id)
+        .order_by(Module.ordering, Module.id, File.ordering)
+    ).all()
+
+    modules = {}
+    for row in rows:
+        m = modules.get(row.id)
+        if m is None:
+            m = modules[row.id] = {
+                'id':       str(row.id),
+                'title':    row.title,
+                'ordering': row.ordering,
+                'files':    [],
+            }
+        if row.file_id is not None:
+            m['files'].append({
+                'id':       str(row.file_id),
+                'title':    row.file_title,
+                'ordering': row.file_ordering,
+            })
+    return list(modules.values())
 
 
 # --- Module CRUD ---
@@ -319,6 +447,8 @@ def get_modules_by_course(db: Session, course_id):
 
 
 def create_module(db: Session, course_id: str, title: str):
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
     max_ord = db.query(func.max(Module.ordering)).filter(Module.course_id == course_id).scalar() or 0
     m = Module(
         course_id=course_id,
@@ -326,6 +456,7 @@ def create_module(db: Session, course_id: str, title: str):
         ordering=max_ord + 1
     )
     db.add(m)
+    touch_course(db, course_id=course_id)
     db.commit()
     db.refresh(m)
     return m
@@ -337,6 +468,7 @@ def update_module(db: Session, module_id: str, **kwargs):
         return None
     if 'title' in kwargs: m.title = kwargs['title']
     if 'ordering' in kwargs: m.ordering = kwargs['ordering']
+    touch_course(db, course_id=m.course_id)
     db.commit()
     db.refresh(m)
     return m
@@ -345,25 +477,153 @@ def update_module(db: Session, module_id: str, **kwargs):
 def delete_module(db: Session, module_id: str):
     m = get_module_by_id(db, module_id)
     if m:
+        touch_course(db, course_id=m.course_id)
+        released = release_file_blobs(db, db.execute(
+            select(File.content_hash).filter(File.module_id == m.id)
+        ).scalars().all())
         db.delete(m)
         db.commit()
+        purge_file_blobs(db, released)
 
 # --- File CRUD ---
 
-def get_file_by_id(db: Session, file_id):
+def _lock_file_blob(db: Session, content_hash: str):
+    """
+    Serializes acquire_file_blob and purge_file_blobs on one hash until the
+    transaction ends. Otherwise a purge that checked for the FileBlob row
+    before a re-upload committed it would delete the bytes the new row
+    relies on (the store skips writing objects that already exist).
+    """
+    if db.bind.dialect.name == 'postgresql':
+        # Transaction-scoped advisory lock keyed by the first 60 bits of the hash
+        db.execute(select(func.pg_advisory_xact_lock(int(content_hash[:15], 16))))
+
+
+def acquire_file_blob(db: Session, file_data: bytes) -> str:
+    """
+    Adds a reference to the FileBlob for file_data, writing the bytes to the
+    blob store only if they are not there yet. Returns the content hash;
+    the caller commits, which also lets pending purges of the hash proceed.
+    """
+    content_hash = hashlib.sha256(file_data).hexdigest()
+    store = get_blob_store()
+    _lock_file_blob(db, content_hash)
+    bumped = db.execute(
+        update(FileBlob)
+        .where(FileBlob.content_hash == content_hash)
+        .values(ref_count=FileBlob.ref_count + 1)
+    ).rowcount
+    if bumped:
+        # Also moves blobs still held in the database and repairs lost objects
+        if not store.exists(content_hash):
+            store.put(content_hash, file_data)
+            db.execute(update(FileBlob).where(FileBlob.content_hash == content_hash).values(data=None))
+        return content_hash
+    if db.bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(FileBlob).values(
+        content_hash=content_hash, data=None, size=len(file_data),
+        ref_count=1, created_at=datetime.utcnow()
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['content_hash'],
+        set_={'ref_count': FileBlob.ref_count + 1}
+    ))
+    store.put(content_hash, file_data)
+    return content_hash
+
+
+def release_file_blobs(db: Session, content_hashes) -> list:
+    """
+    Drops one reference per hash given and deletes unreferenced FileBlob
+    rows along with their TextExtraction cache; the caller commits and then passes the returned hashes to
+    purge_file_blobs.
+    """
+    released = []
+    for content_hash, n in Counter(h for h in content_hashes if h).items():
+        db.execute(
+            update(FileBlob)
+            .where(FileBlob.content_hash == content_hash)
+            .values(ref_count=FileBlob.ref_count - n)
+        )
+        if db.execute(delete(FileBlob).where(
+            FileBlob.content_hash == content_hash, FileBlob.ref_count <= 0
+        )).rowcount:
+            # Extracted text is keyed by the same hash and goes with the last reference
+            db.execute(delete(TextExtraction).where(TextExtraction.content_hash == content_hash))
+            released.append(content_hash)
+    return released
+
+
+def purge_file_blobs(db: Session, content_hashes):
+    """
+    Deletes stored bytes of released blobs, unless the content was uploaded
+    again since. Each hash is checked and deleted under the lock uploads of
+    it take, and committed on its own.
+    """
+    store = get_blob_store()
+    for content_hash in content_hashes:
+        _lock_file_blob(db, content_hash)
+        if db.execute(select(FileBlob.content_hash).filter_by(content_hash=content_hash)).first() is None:
+            store.delete(content_hash)
+        db.commit()
+
+
+def get_file_blob(db: Session, content_hash: str):
+    """(size, data) of a FileBlob; data is None unless the bytes are still held in the database."""
+    return db.execute(
+        select(FileBlob.size, FileBlob.data).filter_by(content_hash=content_hash)
+    ).first()
+
+
+def get_file_blobs_in_database(db: Session, limit: int = 50) -> list[str]:
+    return db.execute(
+        select(FileBlob.content_hash).filter(FileBlob.data.isnot(None)).limit(limit)
+    ).scalars().all()
+
+
+def move_file_blob_to_store(db: Session, content_hash: str) -> bool:
+    """Writes a database-held blob to the blob store and clears it from the row."""
+    row = db.execute(
+        select(FileBlob).filter_by(content_hash=content_hash)
+        .options(undefer(FileBlob.data)).with_for_update()
+    ).scalars().first()
+    if row is None or row.data is None:
+        db.rollback()
+        return False
+    get_blob_store().put(content_hash, bytes(row.data))
+    row.data = None
+    db.commit()
+    return True
+
+
+def _file_blob_options(stmt, with_data: bool, with_index: bool):
+    if with_data:
+        stmt = stmt.options(selectinload(File.blob).undefer(FileBlob.data))
+    if with_index:
+        stmt = stmt.options(undefer_group('index'))
+    return stmt
+
+
+def get_file_by_id(db: Session, file_id, with_data: bool = False, with_index: bool = False):
+    """
+    with_data / with_index also load the file's FileBlob bytes and the
+    deferred index_faiss/index_pkl blobs; otherwise they load lazily on
+    first access.
+    """
     if isinstance(file_id, str):
         file_id = uuid.UUID(file_id)
-    return db.execute(select(File).filter_by(id=file_id)).scalars().first()
+    stmt = _file_blob_options(select(File).filter_by(id=file_id), with_data, with_index)
+    return db.execute(stmt).scalars().first()
 
 
-def get_files_by_module(db: Session, module_id):
+def get_files_by_module(db: Session, module_id, with_data: bool = False, with_index: bool = False):
     if isinstance(module_id, str):
         module_id = uuid.UUID(module_id)
-    return db.execute(
-        select(File)
-        .filter_by(module_id=module_id)
-        .order_by(File.ordering)
-    ).scalars().all()
+    stmt = select(File).filter_by(module_id=module_id).order_by(File.ordering)
+    return db.execute(_file_blob_options(stmt, with_data, with_index)).scalars().all()
 
 
 def get_files_without_raw_by_module(db: Session, module_id):
@@ -383,6 +643,8 @@ def get_files_without_raw_by_module(db: Session, module_id):
 
 def create_file(db: Session, module_id: str, title: str, filename: str,
                 file_type: str, file_size: int, file_data: bytes):
+    if isinstance(module_id, str):
+        module_id = uuid.UUID(module_id)
     max_ord = db.query(func.max(File.ordering)).filter(File.module_id == module_id).scalar() or 0
     f = File(
         module_id=module_id,
@@ -390,10 +652,11 @@ def create_file(db: Session, module_id: str, title: str, filename: str,
         filename=filename,
         file_type=file_type,
         file_size=file_size,
-        file_data=file_data,
+        content_hash=acquire_file_blob(db, file_data),
         ordering=max_ord + 1
     )
     db.add(f)
+    touch_course(db, module_id=module_id)
     db.commit()
     db.refresh(f)
     return f
@@ -403,20 +666,37 @@ def update_file(db: Session, file_id: str, **kwargs):
     if not f:
         return None
     for key in (
-        'title','filename','file_type','file_size','file_data',
+        'title','filename','file_type','file_size',
         'transcription','index_pkl','index_faiss','ordering'
     ):
         if key in kwargs:
             setattr(f, key, kwargs[key])
+    if 'index_faiss' in kwargs or 'index_pkl' in kwargs:
+        f.index_version = File.index_version + 1
+    if 'file_data' in kwargs:
+        old_hash = f.content_hash
+        f.content_hash = acquire_file_blob(db, kwargs['file_data'])
+        released = release_file_blobs(db, [old_hash])
+        db.expire(f, ['blob'])
+    if 'title' in kwargs or 'ordering' in kwargs:
+        touch_course(db, module_id=f.module_id)
     db.commit()
+    if 'file_data' in kwargs:
+        purge_file_blobs(db, released)
+    if 'index_faiss' in kwargs or 'index_pkl' in kwargs:
+        faiss_index_cache.invalidate('file', f.id)
     db.refresh(f)
     return f
 
 def delete_file(db: Session, file_id: str):
     f = get_file_by_id(db, file_id)
     if f:
+        touch_course(db, module_id=f.module_id)
+        released = release_file_blobs(db, [f.content_hash])
         db.delete(f)
         db.commit()
+        purge_file_blobs(db, released)
+        faiss_index_cache.invalidate('file', f.id)
 
 # --- FileChunk CRUD ---
 
@@ -440,6 +720,246 @@ def insert_file_chunks(db, file_id: str, course_id: str, chunks: list[str], vect
     db.commit()
     return len(rows)
 
+def copy_duplicate_file_chunks(db: Session, file_id, course_id, content_hash: str) -> int:
+    """
+    Gives file_id the chunks and embeddings of an already embedded File with
+    the same content hash, if there is one. Returns the number copied.
+
+    The rows are copied, not shared: duplicates cost no extraction or
+    embedding calls, but FileChunk storage still grows with every copy.
+    Each row carries its course_id so the course-scoped ANN query stays a
+    single filtered index scan; sharing rows across files would move that
+    filter behind a join.
+    """
+    if isinstance(file_id, str):
+        file_id = uuid.UUID(file_id)
+    donor_id = db.execute(
+        select(FileChunk.file_id)
+        .join(File, File.id == FileChunk.file_id)
+        .filter(File.content_hash == content_hash, File.id != file_id)
+        .limit(1)
+    ).scalar()
+    if donor_id is None:
+        return 0
+    rows = db.execute(
+        select(FileChunk.content, FileChunk.embedding)
+        .filter(FileChunk.file_id == donor_id)
+        .order_by(FileChunk.chunk_index)
+    ).all()
+    return insert_file_chunks(db, file_id, course_id,
+                              [r.content for r in rows], [r.embedding for r in rows])
+
+
+def get_duplicate_file(db: Session, file_id, content_hash: str, with_index: bool = False):
+    """Another File with the same content hash, preferring ones already indexed or transcribed."""
+    if isinstance(file_id, str):
+        file_id = uuid.UUID(file_id)
+    stmt = (
+        select(File)
+        .filter(File.content_hash == content_hash, File.id != file_id)
+        .order_by(File.transcription.is_(None), File.created_at)
+        .limit(1)
+    )
+    if with_index:
+        stmt = stmt.options(undefer_group('index'))
+    return db.execute(stmt).scalars().first()
+
+def search_file_chunks(db: Session, course_id, query_vec, k: int = 5, file_id=None):
+    """
+    Nearest FileChunk rows to query_vec (numpy array) within a course, optionally
+    within one file. Returns rows of (content, file_id, chunk_index, distance).
+    """
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    if isinstance(file_id, str):
+        file_id = uuid.UUID(file_id)
+    query_param = bindparam('query_vec', query_vec, type_=NativeVector(len(query_vec)))
+    distance = FileChunk.embedding.l2_distance(query_param).label('distance')
+    stmt = (
+        select(FileChunk.content, FileChunk.file_id, FileChunk.chunk_index, distance)
+        .filter(FileChunk.course_id == course_id)
+    )
+    if file_id:
+        stmt = stmt.filter(FileChunk.file_id == file_id)
+    stmt = stmt.order_by(distance).limit(k)
+    # relaxed_order iterative scans may return the k rows slightly out of order
+    return sorted(db.execute(stmt).all(), key=lambda row: row.distance)
+
+
+def get_file_chunks(db: Session, file_id):
+    if isinstance(file_id, str):
+        file_id = uuid.UUID(file_id)
+    return db.execute(
+        select(FileChunk)
+        .filter_by(file_id=file_id)
+        .order_by(FileChunk.chunk_index)
+    ).scalars().all()
+
+
+def get_indexed_files_for_course(db: Session, course_id):
+    """
+    Returns (file_id, filename) for every file in the course that has stored chunks.
+    """
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    stmt = (
+        select(File.id, File.filename)
+        .join(FileChunk, FileChunk.file_id == File.id)
+        .filter(FileChunk.course_id == course_id)
+        .group_by(File.id, File.filename)
+        .order_by(File.filename)
+    )
+    return db.execute(stmt).all()
+
+# --- EmbeddingCache CRUD ---
+
+def get_cached_embeddings(db: Session, model: str, content_hashes: list[str]) -> dict:
+    """
+    Returns {content_hash: (dim, embedding_bytes)} for the hashes already cached for model.
+    """
+    if not content_hashes:
+        return {}
+    stmt = (
+        select(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.dim, EmbeddingCacheEntry.embedding)
+        .filter(EmbeddingCacheEntry.model == model,
+                EmbeddingCacheEntry.content_hash.in_(content_hashes))
+    )
+    return {h: (dim, bytes(emb)) for h, dim, emb in db.execute(stmt).all()}
+
+
+def insert_cached_embeddings(db: Session, model: str, rows: list[tuple]) -> int:
+    """
+    Inserts (content_hash, dim, embedding_bytes) rows, ignoring hashes that
+    another worker cached first. Returns the number of rows submitted.
+    """
+    if not rows:
+        return 0
+    if db.bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(EmbeddingCacheEntry).values([
+        {'model': model, 'content_hash': h, 'dim': dim, 'embedding': emb}
+        for h, dim, emb in rows
+    ]).on_conflict_do_nothing(index_elements=['model', 'content_hash'])
+    db.execute(stmt)
+    db.commit()
+    return len(rows)
+
+# --- FileOutline CRUD ---
+
+def get_file_outline(db: Session, file_id, content_hash: str, prompt_version: str):
+    if isinstance(file_id, str):
+        file_id = uuid.UUID(file_id)
+    return db.execute(
+        select(FileOutline.outline)
+        .filter_by(file_id=file_id, content_hash=content_hash, prompt_version=prompt_version)
+    ).scalar()
+
+
+def save_file_outline(db: Session, file_id, content_hash: str, prompt_version: str, outline: str):
+    """
+    Stores an outline, ignoring one another worker saved first, and drops the
+    file's outlines for older content under the same prompt version.
+    """
+    if isinstance(file_id, str):
+        file_id = uuid.UUID(file_id)
+    if db.bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(delete(FileOutline).where(
+        FileOutline.file_id == file_id,
+        FileOutline.prompt_version == prompt_version,
+        FileOutline.content_hash != content_hash,
+    ))
+    db.execute(insert(FileOutline).values(
+        file_id=file_id, content_hash=content_hash,
+        prompt_version=prompt_version, outline=outline, created_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=['file_id', 'content_hash', 'prompt_version']))
+    db.commit()
+
+# --- TextExtraction CRUD ---
+
+def get_text_extraction(db: Session, content_hash: str, extractor: str, clean: bool = False):
+    """The cached extraction (with text, or clean_text if clean), or None."""
+    return db.execute(
+        select(TextExtraction)
+        .filter_by(content_hash=content_hash, extractor=extractor)
+        .options(undefer(TextExtraction.clean_text if clean else TextExtraction.text))
+    ).scalars().first()
+
+
+def save_text_extraction(db: Session, content_hash: str, extractor: str, text: str = None,
+                         clean_text: str = None, chunking_key: str = None, spans: list = None):
+    """
+    Stores extracted text, cleaned text and/or one chunking's character spans
+    for an upload, creating the row on first use. Fields not given are kept.
+    """
+    if db.bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(insert(TextExtraction).values(
+        content_hash=content_hash, extractor=extractor, text=text or '',
+        clean_text=clean_text, chunkings={}, created_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=['content_hash', 'extractor']))
+
+    row = db.execute(
+        select(TextExtraction)
+        .filter_by(content_hash=content_hash, extractor=extractor)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalars().one()
+    if text is not None:
+        row.text = text
+    if clean_text is not None:
+        row.clean_text = clean_text
+    if chunking_key is not None:
+        row.chunkings = {**(row.chunkings or {}), chunking_key: spans}
+    db.commit()
+    return row
+
+# --- IngestionJob CRUD ---
+
+def get_ingestion_job_by_id(db: Session, job_id):
+    if isinstance(job_id, str):
+        job_id = uuid.UUID(job_id)
+    return db.execute(select(IngestionJob).filter_by(id=job_id)).scalars().first()
+
+
+def create_ingestion_job(db: Session, file_id, course_id, stages: dict):
+    if isinstance(file_id, str):
+        file_id = uuid.UUID(file_id)
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    job = IngestionJob(
+        file_id=file_id,
+        course_id=course_id,
+        status='queued',
+        stages=stages
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def update_ingestion_job(db: Session, job_id, **kwargs):
+    job = get_ingestion_job_by_id(db, job_id)
+    if not job:
+        return None
+    for key in ('status', 'stage', 'error'):
+        if key in kwargs:
+            setattr(job, key, kwargs[key])
+    if 'stages' in kwargs:
+        # JSONB columns only track reassignment, not in-place mutation
+        job.stages = dict(kwargs['stages'])
+    job.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(job)
+    return job
+
 # --- AccessCode CRUD ---
 
 def get_access_code_by_id(db: Session, code_id):
@@ -786,17 +1306,61 @@ def delete_market(db: Session, market_id: str):
 def transcribe_audio(db: Session, file_id: str, transcription: str):
     return update_file(db, file_id, transcription=transcription)
 
-def get_student_questions_for_course(db: Session, course_id: str) -> list[str]:
+def get_student_questions_since(db: Session, course_id, since_seq: int = 0,
+                                until: datetime = None):
+    """
+    User messages of a course after the since_seq watermark, oldest first.
+    With until, stops at the newest message inserted (by the database clock)
+    before it, as rollup_file_events does. Rows are (content, seq).
+    """
     if isinstance(course_id, str):
         course_id = uuid.UUID(course_id)
     stmt = (
-        select(Message.content)
+        select(Message.content, Message.seq)
         .join(Chat, Chat.id == Message.chat_id)
         .join(File, File.id == Chat.file_id)
         .join(Module, Module.id == File.module_id)
-        .filter(Module.course_id == course_id, Message.role == 'user')
+        .filter(Module.course_id == course_id, Message.role == 'user', Message.seq > since_seq)
     )
-    return [row[0] for row in db.execute(stmt).all()]
+    if until is not None:
+        upto = db.execute(
+            stmt.with_only_columns(func.max(Message.seq)).filter(Message.inserted_at < until)
+        ).scalar()
+        if not upto:
+            return []
+        stmt = stmt.filter(Message.seq <= upto)
+    return db.execute(stmt.order_by(Message.seq)).all()
+
+
+def get_course_faq_state(db: Session, course_id):
+    """The course's FAQ state row, created (and committed) if missing; not locked."""
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    state = db.execute(select(CourseFaqState).filter_by(course_id=course_id)).scalars().first()
+    if state:
+        return state
+    if db.bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(insert(CourseFaqState).values(
+        course_id=course_id, clusters=[], last_message_seq=0, updated_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=['course_id']))
+    db.commit()
+    return db.execute(select(CourseFaqState).filter_by(course_id=course_id)).scalars().first()
+
+
+def get_course_faq_state_for_update(db: Session, course_id):
+    """Locks the course's FAQ state row and reloads it; the caller commits."""
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    return db.execute(
+        select(CourseFaqState)
+        .filter_by(course_id=course_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalars().first()
+
 
 def get_course_title(db: Session, course_id: str) -> str:
     if isinstance(course_id, str):
@@ -806,50 +1370,187 @@ def get_course_title(db: Session, course_id: str) -> str:
         raise ValueError(f"Course {course_id} not found")
     return course.title
 
-def get_file_metrics_for_course(db: Session, course_id: str) -> list[dict]:
-    if isinstance(course_id, str):
-        course_id = uuid.UUID(course_id)
-    stmt = (
+FILE_COUNTERS = ('view_count_raw', 'view_count_personalized', 'chat_count')
+
+
+def increment_file_counters(db: Session, deltas: dict):
+    """
+    Applies {file_id: {counter: n}} as UPDATE "File" SET c = c + n, one
+    statement per file and no prior SELECT, so concurrent writers never
+    lose increments. The caller commits.
+    """
+    files = File.__table__
+    for file_id, counts in deltas.items():
+        if isinstance(file_id, str):
+            file_id = uuid.UUID(file_id)
+        values = {
+            counter: files.c[counter] + n
+            for counter, n in counts.items() if counter in FILE_COUNTERS and n
+        }
+        if values:
+            db.execute(update(files).where(files.c.id == file_id).values(**values))
+
+
+def get_file_course_id(db: Session, file_id):
+    """Course id of a file, via its module, without loading the File row."""
+    if isinstance(file_id, str):
+        file_id = uuid.UUID(file_id)
+    return db.execute(
+        select(Module.course_id)
+        .join(File, File.module_id == Module.id)
+        .filter(File.id == file_id)
+    ).scalar()
+
+
+# Event type -> File counter it also increments
+FILE_EVENT_TYPES = {
+    'view_raw':          'view_count_raw',
+    'view_personalized': 'view_count_personalized',
+    'chat':              'chat_count',
+}
+
+# Events younger than this are left for the next rollup, so a transaction that
+# took a lower id but committed late is never skipped by the watermark
+ROLLUP_GRACE = timedelta(seconds=60)
+
+
+def insert_file_events(db: Session, events: list[tuple]) -> int:
+    """Appends (file_id, event_type, created_at) rows to FileEvent. The caller commits."""
+    if not events:
+        return 0
+    db.execute(
+        FileEvent.__table__.insert(),
+        [
+            {
+                'file_id':    uuid.UUID(fid) if isinstance(fid, str) else fid,
+                'event_type': event_type,
+                'hour':       ts.replace(minute=0, second=0, microsecond=0),
+                'created_at': ts,
+            }
+            for fid, event_type, ts in events
+        ]
+    )
+    return len(events)
+
+
+def get_database_now(db: Session) -> datetime:
+    """The database's current UTC time; watermarks use it rather than the app clock."""
+    return db.execute(select(utc_clock())).scalar()
+
+
+def rollup_file_events(db: Session, now: datetime = None) -> int:
+    """
+    Folds FileEvent rows past the watermark into hourly FileEventRollup
+    counts. The watermark only moves past rows inserted more than
+    ROLLUP_GRACE ago by the database clock (inserted_at), so inserts still
+    in flight with lower ids are not skipped. The state row is locked, so
+    concurrent workers never fold the same events twice. Returns the
+    number of rollup rows touched.
+    """
+    now = now or get_database_now(db)
+    state = db.execute(
+        select(FileEventRollupState).filter_by(name='file_events').with_for_update()
+    ).scalars().first()
+    if not state:
+        state = FileEventRollupState(name='file_events', last_event_id=0)
+        db.add(state)
+        db.flush()
+
+    upto = db.execute(
+        select(func.max(FileEvent.id))
+        .filter(FileEvent.id > state.last_event_id, FileEvent.inserted_at < now - ROLLUP_GRACE)
+    ).scalar()
+    if not upto:
+        db.commit()
+        return 0
+
+    rows = db.execute(
         select(
-            File.id,
-            File.view_count_raw,
-            File.view_count_personalized,
-            File.chat_count
+            FileEvent.file_id, FileEvent.hour, FileEvent.event_type,
+            Module.id, Module.course_id, func.count()
         )
+        .join(File, File.id == FileEvent.file_id)
         .join(Module, Module.id == File.module_id)
-        .filter(Module.course_id == course_id)
+        .filter(FileEvent.id > state.last_event_id, FileEvent.id <= upto)
+        .group_by(FileEvent.file_id, FileEvent.hour, FileEvent.event_type, Module.id, Module.course_id)
+    ).all()
+
+    if rows:
+        if db.bind.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(FileEventRollup).values([
+            {'file_id': fid, 'hour': hour, 'event_type': event_type,
+             'module_id': mid, 'course_id': cid, 'count': n}
+            for fid, hour, event_type, mid, cid, n in rows
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['file_id', 'hour', 'event_type'],
+            set_={'count': FileEventRollup.count + stmt.excluded['count']}
+        )
+        db.execute(stmt)
+
+    state.last_event_id = upto
+    db.commit()
+    return len(rows)
+
+
+def _rollup_counts(db: Session, course_id, group_col, start=None, end=None):
+    stmt = (
+        select(group_col, FileEventRollup.event_type, func.sum(FileEventRollup.count))
+        .filter(FileEventRollup.course_id == course_id)
+        .group_by(group_col, FileEventRollup.event_type)
     )
-    rows = db.execute(stmt).all()
+    if start:
+        stmt = stmt.filter(FileEventRollup.hour >= start)
+    if end:
+        stmt = stmt.filter(FileEventRollup.hour < end)
+    counts = {}
+    for key, event_type, n in db.execute(stmt).all():
+        counts.setdefault(key, {})[event_type] = int(n or 0)
+    return counts
+
+
+def get_file_metrics_for_course(db: Session, course_id: str,
+                                start: datetime = None, end: datetime = None) -> list[dict]:
+    """Per-file view/chat counts from the hourly rollups, optionally for [start, end)."""
+    if isinstance(course_id, str):
+        course_id = uuid.UUID(course_id)
+    counts = _rollup_counts(db, course_id, FileEventRollup.file_id, start, end)
+    file_ids = db.execute(
+        select(File.id)
+        .join(Module, Module.id == File.module_id)
+        .filter(Module.course_id == course_id)
+    ).scalars().all()
     return [
         {
             'fileId': str(fid),
-            'rawViews': raw,
-            'personalizedViews': pviews,
-            'chatCount': chats
+            'rawViews': counts.get(fid, {}).get('view_raw', 0),
+            'personalizedViews': counts.get(fid, {}).get('view_personalized', 0),
+            'chatCount': counts.get(fid, {}).get('chat', 0)
         }
-        for fid, raw, pviews, chats in rows
+        for fid in file_ids
     ]
 
 
-def get_module_metrics_for_course(db: Session, course_id: str) -> list[dict]:
+def get_module_metrics_for_course(db: Session, course_id: str,
+                                  start: datetime = None, end: datetime = None) -> list[dict]:
+    """Per-module view/chat counts from the hourly rollups, optionally for [start, end)."""
     if isinstance(course_id, str):
         course_id = uuid.UUID(course_id)
-    stmt = (
-        select(
-            Module.id,
-            func.sum(File.view_count_raw + File.view_count_personalized).label('views'),
-            func.sum(File.chat_count).label('chats')
-        )
+    counts = _rollup_counts(db, course_id, FileEventRollup.module_id, start, end)
+    module_ids = db.execute(
+        select(Module.id)
         .join(File, File.module_id == Module.id)
         .filter(Module.course_id == course_id)
-        .group_by(Module.id)
-    )
-    rows = db.execute(stmt).all()
+        .distinct()
+    ).scalars().all()
     return [
         {
             'moduleId': str(mid),
-            'views': views,
-            'chatCount': chats
+            'views': counts.get(mid, {}).get('view_raw', 0) + counts.get(mid, {}).get('view_personalized', 0),
+            'chatCount': counts.get(mid, {}).get('chat', 0)
         }
-        for mid, views, chats in rows
-    ]
\ No newline at end of file
+        for mid in module_ids
+    ]
@@ -8,9 +8,14 @@ from sqlalchemy import (
     UniqueConstraint,
     Numeric,
     Date,
-    Text
+    Text,
+    Index,
+    BigInteger,
+    Sequence
 )
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import declarative_base, relationship, deferred
+from sqlalchemy.sql.functions import FunctionElement
 from sqlalchemy.dialects.postgresql import UUID, BYTEA, ENUM, JSONB
 from pgvector.sqlalchemy import Vector
 import uuid
@@ -18,6 +23,42 @@ from datetime import datetime
 
 Base = declarative_base()
 
+class utc_clock(FunctionElement):
+    """The database's current UTC wall-clock time (not the transaction start)."""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utc_clock, 'postgresql')
+def _utc_clock_postgresql(element, compiler, **kw):
+    return "timezone('utc', clock_timestamp())"
+
+
+@compiles(utc_clock)
+def _utc_clock_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+# Numbers Message rows in insert order; created with the tables on PostgreSQL
+message_seq = Sequence('message_seq', metadata=Base.metadata)
+
+
+class next_message_seq(FunctionElement):
+    """Next Message.seq: the sequence on PostgreSQL, max + 1 elsewhere (SQLite has one writer)."""
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(next_message_seq, 'postgresql')
+def _next_message_seq_postgresql(element, compiler, **kw):
+    return "nextval('message_seq')"
+
+
+@compiles(next_message_seq)
+def _next_message_seq_default(element, compiler, **kw):
+    return '(SELECT coalesce(max(seq), 0) + 1 FROM "Message")'
+
+
 role_enum = ENUM('admin', 'instructor', 'student', name='role_enum', create_type=True)
 
 class User(Base):
@@ -27,10 +68,15 @@ class User(Base):
     password = Column(String(255), nullable=False)
     firebase_uid = Column(String(128))
 
-    role = relationship('Role', back_populates='user', uselist=False)
-    instructor_profile = relationship('InstructorProfile', back_populates='user', uselist=False)
-    student_profile = relationship('StudentProfile', back_populates='user', uselist=False)
-    admin_profile = relationship('AdminProfile', back_populates='user', uselist=False)
+    # Role and profiles go with the user through ON DELETE CASCADE; without
+    # passive_deletes the ORM would try to blank out their primary keys
+    role = relationship('Role', back_populates='user', uselist=False, passive_deletes=True)
+    instructor_profile = relationship('InstructorProfile', back_populates='user', uselist=False,
+                                      passive_deletes=True)
+    student_profile = relationship('StudentProfile', back_populates='user', uselist=False,
+                                   passive_deletes=True)
+    admin_profile = relationship('AdminProfile', back_populates='user', uselist=False,
+                                 passive_deletes=True)
 
 class Role(Base):
     __tablename__ = 'Role'
@@ -50,7 +96,7 @@ class InstructorProfile(Base):
     university = Column(String(128))
 
     user = relationship('User', back_populates='instructor_profile')
-    courses = relationship('Course', back_populates='instructor_profile')
+    courses = relationship('Course', back_populates='instructor_profile', passive_deletes=True)
 
 class StudentProfile(Base):
     __tablename__ = 'StudentProfile'
@@ -86,8 +132,11 @@ class Course(Base):
     published = Column(Boolean, nullable=False, default=False)
     last_updated = Column(DateTime, nullable=False, default=datetime.utcnow)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
-    index_pkl = Column(BYTEA)
-    index_faiss = Column(BYTEA)
+    # Blobs are deferred; load them with the with_index option in db.queries
+    index_pkl = deferred(Column(BYTEA), group='index')
+    index_faiss = deferred(Column(BYTEA), group='index')
+    # Bumped whenever the blobs are rewritten; keys the in-memory FAISS cache
+    index_version = Column(Integer, nullable=False, default=0, server_default='0')
     instructor_id = Column(UUID(as_uuid=True),
                            ForeignKey('InstructorProfile.user_id', ondelete='CASCADE'),
                            nullable=False)
@@ -120,11 +169,14 @@ class File(Base):
     filename = Column(String, nullable=False)
     file_type = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
-    file_data = Column(BYTEA, nullable=False)
+    # sha256 of the upload; its bytes live in the FileBlob with this hash, and
+    # it also keys the TextExtraction cache
+    content_hash = Column(String(64), nullable=False)
     transcription = Column(Text, nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
-    index_pkl   = Column(BYTEA, nullable=True)
-    index_faiss = Column(BYTEA, nullable=True)
+    index_pkl   = deferred(Column(BYTEA, nullable=True), group='index')
+    index_faiss = deferred(Column(BYTEA, nullable=True), group='index')
+    index_version = Column(Integer, nullable=False, default=0, server_default='0')
     ordering = Column(Integer, nullable=False, default=0)
     view_count_raw = Column(Integer, nullable=False, default=0)
     view_count_personalized = Column(Integer, nullable=False, default=0)
@@ -133,6 +185,37 @@ class File(Base):
     module = relationship('Module', back_populates='files')
     chats = relationship('Chat', back_populates='file')
     personalized_files = relationship('PersonalizedFile', back_populates='original_file')
+    __table_args__ = (
+        Index('ix_file_content_hash', 'content_hash'),
+    )
+
+    blob = relationship('FileBlob', primaryjoin='foreign(File.content_hash) == FileBlob.content_hash',
+                        viewonly=True)
+
+    @property
+    def file_data(self):
+        """The upload's bytes, read from the blob store (or from FileBlob.data for blobs not moved yet)."""
+        blob = self.blob
+        if blob is None:
+            return None
+        if blob.data is not None:
+            return blob.data
+        from src.blobstore import get_blob_store
+        return get_blob_store().get(self.content_hash)
+
+class FileBlob(Base):
+    """
+    Metadata of uploaded bytes stored once per sha256 in the blob store
+    (src.blobstore) and shared by every File with that content.
+    """
+    __tablename__ = 'FileBlob'
+    content_hash = Column(String(64), primary_key=True)
+    # Bytes of blobs written before the blob store existed; NULL once moved
+    data = deferred(Column(BYTEA, nullable=True))
+    size = Column(BigInteger, nullable=False)
+    # Number of File rows pointing at this blob; the blob is deleted at zero
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
 class FileChunk(Base):
     __tablename__ = 'FileChunk'
@@ -149,7 +232,116 @@ class FileChunk(Base):
 
     __table_args__ = (
         UniqueConstraint('file_id', 'chunk_index', name='uq_filechunk_file_index'),
+        Index('ix_filechunk_course_file', 'course_id', 'file_id'),
+        Index('ix_filechunk_embedding_hnsw', 'embedding',
+              postgresql_using='hnsw',
+              postgresql_with={'m': 16, 'ef_construction': 64},
+              postgresql_ops={'embedding': 'vector_l2_ops'}),
+    )
+
+    file = relationship('File')
+    course = relationship('Course')
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = 'EmbeddingCache'
+    model = Column(String(64), primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    dim = Column(Integer, nullable=False)
+    embedding = Column(BYTEA, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class FileOutline(Base):
+    """Persona-independent chapter outline of a file, shared by every student's personalization."""
+    __tablename__ = 'FileOutline'
+    file_id = Column(UUID(as_uuid=True),
+                     ForeignKey('File.id', ondelete='CASCADE'),
+                     primary_key=True)
+    # sha256 of the file's chunk texts the outline was generated from
+    content_hash = Column(String(64), primary_key=True)
+    prompt_version = Column(String(32), primary_key=True)
+    outline = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class TextExtraction(Base):
+    """Extracted text of an upload, keyed by sha256 of its bytes and the extractor used."""
+    __tablename__ = 'TextExtraction'
+    content_hash = Column(String(64), primary_key=True)
+    # "<extension>:<EXTRACTOR_VERSION>", since extraction depends on the file type
+    extractor = Column(String(32), primary_key=True)
+    text = deferred(Column(Text, nullable=False))
+    clean_text = deferred(Column(Text, nullable=True))
+    # {"<raw|clean>:<max_tokens>:<overlap>:<boundary>": [[char_start, char_end], ...]}
+    chunkings = Column(JSONB, nullable=False, default=dict)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class FileEvent(Base):
+    """Append-only log of file views and chat starts; rolled up hourly into FileEventRollup."""
+    __tablename__ = 'FileEvent'
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    file_id = Column(UUID(as_uuid=True),
+                     ForeignKey('File.id', ondelete='CASCADE'),
+                     nullable=False)
+    event_type = Column(String(32), nullable=False)
+    # created_at truncated to the hour, the rollup bucket
+    hour = Column(DateTime, nullable=False)
+    # When the event happened (buffered in the app); a batch re-queued after a
+    # failed flush is inserted later with these original times
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # When the row was inserted, by the database clock; the rollup watermark uses this
+    inserted_at = Column(DateTime, nullable=False, server_default=utc_clock())
+
+class FileEventRollup(Base):
+    __tablename__ = 'FileEventRollup'
+    __table_args__ = (
+        Index('ix_fileeventrollup_course_hour', 'course_id', 'hour'),
     )
+    file_id = Column(UUID(as_uuid=True),
+                     ForeignKey('File.id', ondelete='CASCADE'),
+                     primary_key=True)
+    hour = Column(DateTime, primary_key=True)
+    event_type = Column(String(32), primary_key=True)
+    module_id = Column(UUID(as_uuid=True), nullable=False)
+    course_id = Column(UUID(as_uuid=True),
+                       ForeignKey('Course.id', ondelete='CASCADE'),
+                       nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+class FileEventRollupState(Base):
+    """Watermark: the highest FileEvent.id already folded into FileEventRollup."""
+    __tablename__ = 'FileEventRollupState'
+    name = Column(String(32), primary_key=True)
+    last_event_id = Column(BigInteger, nullable=False, default=0)
+
+class CourseFaqState(Base):
+    """Incremental FAQ clusters for a course and the last student message folded in."""
+    __tablename__ = 'CourseFaqState'
+    course_id = Column(UUID(as_uuid=True),
+                       ForeignKey('Course.id', ondelete='CASCADE'),
+                       primary_key=True)
+    # [{representative, count, variants, label}], in cluster order
+    clusters = Column(JSONB, nullable=False, default=list)
+    # float32 (len(clusters) x dim) running sums of member embeddings
+    centroid_sums = Column(BYTEA, nullable=True)
+    dim = Column(Integer, nullable=True)
+    # Watermark: Message.seq of the newest processed user message
+    last_message_seq = Column(BigInteger, nullable=False, default=0, server_default='0')
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class IngestionJob(Base):
+    __tablename__ = 'IngestionJob'
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id = Column(UUID(as_uuid=True),
+                     ForeignKey('File.id', ondelete='CASCADE'),
+                     nullable=False)
+    course_id = Column(UUID(as_uuid=True),
+                       ForeignKey('Course.id', ondelete='CASCADE'),
+                       nullable=False)
+    status = Column(String(16), nullable=False, default='queued')
+    stage = Column(String(32), nullable=True)
+    stages = Column(JSONB, nullable=False, default=dict)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
     file = relationship('File')
     course = relationship('Course')
@@ -216,6 +408,9 @@ class Chat(Base):
 
 class Message(Base):
     __tablename__ = 'Message'
+    __table_args__ = (
+        Index('ix_message_role_seq', 'role', 'seq'),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     chat_id = Column(UUID(as_uuid=True),
                      ForeignKey('Chat.id', ondelete='CASCADE'),
@@ -223,6 +418,9 @@ class Message(Base):
     role = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Insert order and insert time by the database; the FAQ watermark follows these
+    seq = Column(BigInteger, nullable=False, default=next_message_seq())
+    inserted_at = Column(DateTime, nullable=False, server_default=utc_clock())
 
     chat = relationship('Chat', back_populates='messages')
 
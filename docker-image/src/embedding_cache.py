@@ -0,0 +1,117 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.db.queries import get_cached_embeddings, insert_cached_embeddings
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model, sha256(text)).
+    An in-memory LRU sits in front of the EmbeddingCache table; the table is
+    only used once a session factory has been configured.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._session_factory = None
+
+    def configure(self, session_factory):
+        self._session_factory = session_factory
+
+    def _get_local(self, key):
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is not None:
+                self._entries.move_to_end(key)
+            return vec
+
+    def _put_local(self, key, vec):
+        with self._lock:
+            self._entries[key] = vec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def embed(self, model: str, texts: Sequence[str],
+              embed_fn: Callable[[List[str]], Sequence[Sequence[float]]]) -> np.ndarray:
+        """
+        Returns one float32 row per text, calling embed_fn only for texts that
+        are neither in memory nor persisted. Duplicate texts are embedded once.
+        """
+        hashes = [content_hash(t) for t in texts]
+        found = {}
+        for h in set(hashes):
+            vec = self._get_local((model, h))
+            if vec is not None:
+                found[h] = vec
+
+        missing = [h for h in dict.fromkeys(hashes) if h not in found]
+        if missing and self._session_factory is not None:
+            db = self._session_factory()
+            try:
+                for h, (dim, emb) in get_cached_embeddings(db, model, missing).items():
+                    vec = np.frombuffer(emb, dtype=np.float32)
+                    found[h] = vec
+                    self._put_local((model, h), vec)
+            finally:
+                db.close()
+
+        to_embed = {}
+        for t, h in zip(texts, hashes):
+            if h not in found and h not in to_embed:
+                to_embed[h] = t
+        if to_embed:
+            vectors = embed_fn(list(to_embed.values()))
+            new_rows = []
+            for h, vec in zip(to_embed.keys(), vectors):
+                vec = np.asarray(vec, dtype=np.float32)
+                found[h] = vec
+                self._put_local((model, h), vec)
+                new_rows.append((h, int(vec.shape[0]), vec.tobytes()))
+            if self._session_factory is not None:
+                db = self._session_factory()
+                try:
+                    insert_cached_embeddings(db, model, new_rows)
+                finally:
+                    db.close()
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack([found[h] for h in hashes])
+
+
+embedding_cache = EmbeddingCache(max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")))
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain Embeddings wrapper that routes documents and queries through
+    the shared embedding cache, so FAISS builds reuse vectors across uploads.
+    """
+
+    def __init__(self, inner: Embeddings, model: str, cache: EmbeddingCache = embedding_cache):
+        self.inner = inner
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.cache.embed(self.model, texts, self.inner.embed_documents).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.embed(self.model, [text], lambda t: [self.inner.embed_query(t[0])])[0].tolist()
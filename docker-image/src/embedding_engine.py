@@ -0,0 +1,74 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence
+
+import numpy as np
+import openai
+
+# Errors worth retrying: throttling, timeouts, dropped connections and 5xx responses
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class EmbeddingEngine:
+    """
+    Batched embedding client: splits texts into batches of up to batch_size,
+    keeps up to max_in_flight batches in flight and retries throttled or
+    failed batches with exponential backoff. Rows come back in input order.
+    """
+
+    def __init__(self, client, model: str, batch_size: int = 512, max_in_flight: int = 4,
+                 max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.api_calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+        return delay * (0.5 + random.random() / 2)
+
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            with self._calls_lock:
+                self.api_calls += 1
+            try:
+                resp = self.client.embeddings.create(
+                    model=self.model,
+                    input=batch,
+                    encoding_format="float"
+                )
+                return np.asarray([d.embedding for d in resp.data], dtype=np.float32)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt, e))
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        batches = [texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.max_in_flight <= 1:
+            return np.vstack([self._embed_batch(b) for b in batches])
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches)),
+                                thread_name_prefix='embed') as pool:
+            return np.vstack(list(pool.map(self._embed_batch, batches)))
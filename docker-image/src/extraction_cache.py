@@ -0,0 +1,75 @@
+import hashlib
+import tempfile
+from typing import List
+
+from src.db.queries import get_text_extraction, save_text_extraction
+from src.textUtils import clean_extracted_text, get_chunker, iter_text
+
+# Bump when iter_text or clean_extracted_text change output, to re-extract everything
+EXTRACTOR_VERSION = "1"
+# Extracted text beyond this many characters is spooled to disk while chunking
+SPOOL_MAX_SIZE = 1 << 20
+
+
+def extractor_key(filename: str) -> str:
+    ext = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ''
+    return f"{ext[:24]}:{EXTRACTOR_VERSION}"
+
+
+def chunking_key(clean: bool, max_tokens: int, overlap: int, boundary: str = None) -> str:
+    return f"{'clean' if clean else 'raw'}:{max_tokens}:{overlap}:{boundary or 'fixed'}"
+
+
+def file_chunks(db, f, clean: bool = False, max_tokens: int = 300, overlap: int = 50,
+                boundary: str = None) -> List[str]:
+    """
+    Chunks of a File's extracted text (cleaned with clean_extracted_text if
+    clean), served from the TextExtraction cache keyed by sha256 of the
+    upload. A new chunking of cached text is computed from the stored text
+    and its spans stored; only uploads never seen before are parsed, and
+    only then is File.file_data loaded.
+    """
+    content_hash = f.content_hash or hashlib.sha256(f.file_data).hexdigest()
+    extractor = extractor_key(f.filename)
+    key = chunking_key(clean, max_tokens, overlap, boundary)
+    chunker = get_chunker(max_tokens, overlap, boundary)
+
+    cached = get_text_extraction(db, content_hash, extractor, clean)
+    text = None if cached is None else (cached.clean_text if clean else cached.text)
+    if text is not None:
+        spans = (cached.chunkings or {}).get(key)
+        if spans is not None:
+            return [text[start:end] for start, end in spans]
+        chunks = chunker.chunks(text)
+        save_text_extraction(db, content_hash, extractor, chunking_key=key,
+                             spans=[[c.char_start, c.char_end] for c in chunks])
+        return [c.text for c in chunks]
+
+    # Extract once, spooling the raw and the cleaned sections to temporary
+    # files rather than memory, and chunk the requested variant while pages
+    # are still being extracted
+    with tempfile.SpooledTemporaryFile(SPOOL_MAX_SIZE, mode='w+', encoding='utf-8') as raw, \
+            tempfile.SpooledTemporaryFile(SPOOL_MAX_SIZE, mode='w+', encoding='utf-8') as cleaned:
+
+        def sections():
+            sep_raw = sep_clean = ""
+            for section in iter_text(f.file_data, f.filename):
+                raw.write(sep_raw + section)
+                sep_raw = "\n"
+                section_clean = clean_extracted_text(section)
+                if section_clean:
+                    cleaned.write(sep_clean + section_clean)
+                    sep_clean = "\n"
+                if not clean:
+                    yield section
+                elif section_clean:
+                    yield section_clean
+
+        chunks = list(chunker.iter_chunks(sections()))
+        # Stored one text at a time, so only one full copy is in memory at once
+        raw.seek(0)
+        save_text_extraction(db, content_hash, extractor, text=raw.read(), chunking_key=key,
+                             spans=[[c.char_start, c.char_end] for c in chunks])
+        cleaned.seek(0)
+        save_text_extraction(db, content_hash, extractor, clean_text=cleaned.read())
+    return [c.text for c in chunks]
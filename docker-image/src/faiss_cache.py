@@ -0,0 +1,117 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_openai import OpenAIEmbeddings
+
+
+@lru_cache(maxsize=None)
+def shared_openai_embeddings():
+    """One OpenAIEmbeddings client per process, routed through the embedding cache."""
+    # Imported here: src.embedding_cache -> src.db.queries -> this module
+    from src.embedding_cache import CachedEmbeddings
+    inner = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
+    return CachedEmbeddings(inner, inner.model)
+
+
+_MISSING = object()
+
+
+def _index_nbytes(index, pkl: bytes) -> int:
+    """Approximate resident size: float32 vectors plus the pickled metadata."""
+    return index.ntotal * index.d * 4 + len(pkl or b'')
+
+
+class FaissIndexCache:
+    """
+    Process-wide LRU of deserialized FAISS indexes, keyed by (kind, id) and
+    bounded by their approximate size in bytes. Each entry remembers the
+    row's index_version, which every write of the blobs bumps, so a hit is
+    validated without reading the deferred blobs; they are only loaded (by
+    first attribute access) on a miss. Rows without an index cache None.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def _get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def _put(self, key, version, value, nbytes: int):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old[1]
+            if nbytes > self.max_bytes:
+                # Larger than the whole budget: serve it uncached
+                return
+            self._entries[key] = (version, nbytes, value)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+
+    def invalidate(self, kind: str, obj_id):
+        with self._lock:
+            entry = self._entries.pop((kind, str(obj_id)), None)
+            if entry is not None:
+                self._nbytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def get_file_store(self, f) -> Optional[FAISS]:
+        """LangChain FAISS store for a File's index_faiss/index_pkl (save_local format), or None."""
+        key, version = ('file', str(f.id)), f.index_version
+        store = self._get(key, version)
+        if store is _MISSING:
+            store, nbytes = None, 0
+            if f.index_faiss:
+                index = faiss.deserialize_index(np.frombuffer(f.index_faiss, dtype='uint8'))
+                docstore, index_to_docstore_id = pickle.loads(f.index_pkl)
+                store = FAISS(
+                    embedding_function=shared_openai_embeddings(),
+                    index=index,
+                    docstore=docstore,
+                    index_to_docstore_id=index_to_docstore_id,
+                )
+                nbytes = _index_nbytes(index, f.index_pkl)
+            self._put(key, version, store, nbytes)
+        return store
+
+    def get_course_index(self, course):
+        """(faiss index, metadata dict) for a Course's ID-mapped chunk index; (None, {}) if it has none."""
+        key, version = ('course', str(course.id)), course.index_version
+        entry = self._get(key, version)
+        if entry is _MISSING:
+            entry, nbytes = (None, {}), 0
+            if course.index_faiss:
+                index = faiss.deserialize_index(np.frombuffer(course.index_faiss, dtype='uint8'))
+                metadata = pickle.loads(course.index_pkl) if course.index_pkl else {}
+                entry = (index, metadata)
+                nbytes = _index_nbytes(index, course.index_pkl)
+            self._put(key, version, entry, nbytes)
+        return entry
+
+
+faiss_index_cache = FaissIndexCache(max_bytes=int(os.getenv("FAISS_CACHE_MB", "512")) * 1024 * 1024)
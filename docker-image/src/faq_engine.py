@@ -0,0 +1,124 @@
+import os
+import re
+from collections import Counter
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+# Cosine similarity at or above which two questions count as the same FAQ
+FAQ_SIMILARITY_THRESHOLD = float(os.getenv("FAQ_SIMILARITY_THRESHOLD", "0.85"))
+# Alternative phrasings kept per cluster (shown to the LLM when labelling)
+MAX_VARIANTS = 3
+
+
+def normalize_question(text: str) -> str:
+    return re.sub(r'\s+', ' ', (text or '')).strip().lower()
+
+
+class QuestionCluster:
+    def __init__(self, representative: str, count: int = 0, variants: List[str] = None,
+                 label: str = None):
+        self.representative = representative
+        self.count = count
+        self.variants: List[str] = variants or []
+        # LLM-written FAQ wording, cached once the cluster has been labelled
+        self.label = label
+
+    def to_dict(self) -> dict:
+        return {'question': self.label or self.representative, 'count': self.count}
+
+    def to_record(self) -> dict:
+        return {'representative': self.representative, 'count': self.count,
+                'variants': self.variants, 'label': self.label}
+
+    @classmethod
+    def from_record(cls, record: dict) -> 'QuestionCluster':
+        return cls(record['representative'], record['count'],
+                   list(record.get('variants') or []), record.get('label'))
+
+
+class FaqState:
+    """
+    Incrementally maintained question clusters.
+
+    Each cluster keeps the running sum of its members' unit embeddings; its
+    centroid is that sum normalized. New phrasings join the cluster whose
+    centroid is most similar, computed as one matrix-vector product, if the
+    cosine similarity reaches threshold. Otherwise they start a new cluster.
+    """
+
+    def __init__(self, clusters: List[QuestionCluster] = None, sums: np.ndarray = None,
+                 threshold: float = FAQ_SIMILARITY_THRESHOLD):
+        self.clusters = clusters or []
+        self.sums = sums
+        self.threshold = threshold
+
+    def add(self, questions: Sequence[str], embed_fn: Callable[[List[str]], np.ndarray]):
+        counts = Counter()
+        original = {}
+        for q in questions:
+            key = normalize_question(q)
+            if not key:
+                continue
+            counts[key] += 1
+            original.setdefault(key, q.strip())
+        if not counts:
+            return
+
+        # Exact duplicates are embedded once; most frequent phrasing goes first
+        # so it becomes the representative of any cluster it starts
+        phrasings = [key for key, _ in counts.most_common()]
+        vectors = np.asarray(embed_fn([original[k] for k in phrasings]), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        n_old = len(self.clusters)
+        sums = np.zeros((n_old + len(phrasings), vectors.shape[1]), dtype=np.float32)
+        if n_old:
+            sums[:n_old] = self.sums
+        centroids = np.zeros_like(sums)
+        if n_old:
+            centroids[:n_old] = sums[:n_old] / np.linalg.norm(sums[:n_old], axis=1, keepdims=True)
+
+        for key, vec in zip(phrasings, vectors):
+            n = len(self.clusters)
+            best = -1
+            if n:
+                sims = centroids[:n] @ vec
+                best = int(np.argmax(sims))
+                if sims[best] < self.threshold:
+                    best = -1
+            if best < 0:
+                best = n
+                self.clusters.append(QuestionCluster(original[key]))
+            cluster = self.clusters[best]
+            cluster.count += counts[key]
+            if original[key] != cluster.representative and len(cluster.variants) < MAX_VARIANTS:
+                cluster.variants.append(original[key])
+            sums[best] += vec * counts[key]
+            centroids[best] = sums[best] / np.linalg.norm(sums[best])
+
+        self.sums = sums[:len(self.clusters)]
+
+    @classmethod
+    def load(cls, records: list, sums: bytes = None, dim: int = None,
+             threshold: float = FAQ_SIMILARITY_THRESHOLD) -> 'FaqState':
+        """Rebuilds state persisted as cluster records plus float32 centroid sums."""
+        clusters = [QuestionCluster.from_record(r) for r in records or []]
+        matrix = None
+        if clusters and sums and dim:
+            matrix = np.frombuffer(sums, dtype=np.float32).reshape(len(clusters), dim).copy()
+        if matrix is None:
+            clusters = []
+        return cls(clusters, matrix, threshold)
+
+    def dump(self):
+        """(cluster records, float32 centroid sums bytes, dim) for persisting."""
+        if self.sums is None:
+            return [], None, None
+        return ([c.to_record() for c in self.clusters],
+                self.sums.astype(np.float32).tobytes(), int(self.sums.shape[1]))
+
+    def top(self, n: int = 10) -> List[QuestionCluster]:
+        return sorted(self.clusters, key=lambda c: c.count, reverse=True)[:n]
+
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import re
+import threading
+from typing import Callable, List
+
+from langchain.schema import Document
+
+from src.db.queries import get_file_outline, save_file_outline
+
+
+def documents_hash(documents: List[Document]) -> str:
+    h = hashlib.sha256()
+    for doc in documents:
+        h.update(doc.page_content.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+# A whole reply wrapped in a Markdown code fence, e.g. ```json ... ```
+_CODE_FENCE = re.compile(r'^\s*```[\w-]*[ \t]*\n?(.*?)\n?[ \t]*```\s*$', re.DOTALL)
+
+
+def strip_code_fence(text: str) -> str:
+    """The model reply without a surrounding ```json fence, if it has one."""
+    if not isinstance(text, str):
+        return text
+    match = _CODE_FENCE.match(text)
+    return match.group(1).strip() if match else text.strip()
+
+
+class _Build:
+    """An outline being built; waiters for the same key block on done."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.outline = None
+
+
+class FileOutlineCache:
+    """
+    Persona-independent file outlines, keyed by (file id, sha256 of the
+    file's chunk texts, outline prompt version) and stored in FileOutline.
+
+    Concurrent requests for the same key in this process build it once:
+    the first builds it, the others wait on that key alone and take its
+    result. No lock is held while the LLM runs, so other files are never
+    held up. Other worker processes may build the same outline in
+    parallel; the first to save it wins. A code fence around the model's
+    JSON is stripped; an outline that is still not valid JSON is returned
+    but not stored, so the next request retries it.
+    """
+
+    def __init__(self):
+        self._session_factory = None
+        self._builds = {}
+        self._lock = threading.Lock()
+
+    def configure(self, session_factory):
+        self._session_factory = session_factory
+
+    def _load(self, key):
+        db = self._session_factory()
+        try:
+            return get_file_outline(db, *key)
+        finally:
+            db.close()
+
+    def get_or_build(self, file_id, documents: List[Document], prompt_version: str,
+                     build_fn: Callable[[List[Document]], str]) -> str:
+        if self._session_factory is None:
+            return build_fn(documents)
+        key = (str(file_id), documents_hash(documents), prompt_version)
+        while True:
+            outline = self._load(key)
+            if outline is not None:
+                return outline
+            with self._lock:
+                build = self._builds.get(key)
+                if build is None:
+                    build = self._builds[key] = _Build()
+                    break
+            build.done.wait()
+            # A failed build leaves no outline; the next pass builds it again
+            if build.outline is not None:
+                return build.outline
+
+        try:
+            # No connection is held while the LLM builds the outline
+            outline = strip_code_fence(build_fn(documents))
+            try:
+                json.loads(outline)
+            except (TypeError, ValueError):
+                pass
+            else:
+                db = self._session_factory()
+                try:
+                    save_file_outline(db, *key, outline)
+                finally:
+                    db.close()
+            build.outline = outline
+            return outline
+        finally:
+            with self._lock:
+                self._builds.pop(key, None)
+            build.done.set()
+
+
+file_outline_cache = FileOutlineCache()
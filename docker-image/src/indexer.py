@@ -3,8 +3,9 @@ import faiss
 import numpy as np
 from sqlalchemy.orm import Session
 
-from textUtils import extract_text, clean_extracted_text, split_text, embed_text, openai_embed_text
-from src.db.queries import get_file_by_id, get_modules_by_course, get_files_by_module, insert_file_chunks
+from textUtils import clean_extracted_text, split_text, embed_texts, openai_embed_text
+from src.extraction_cache import file_chunks
+from src.db.queries import get_file_by_id, get_modules_by_course, get_files_by_module, insert_file_chunks, get_course_for_update
 
 def rebuild_course_index(db: Session, course_id: str):
     """
@@ -18,44 +19,122 @@ def rebuild_course_index(db: Session, course_id: str):
     # 1) Iterate modules → files → extract & chunk
     modules = get_modules_by_course(db, course_id)
     for mod in modules:
+        # file_data is only loaded for uploads missing from the extraction cache
         files = get_files_by_module(db, mod.id)
         for f in files:
-            raw = extract_text(f.file_data, f.filename)
-            chunks = split_text(raw)
+            chunks = file_chunks(db, f)
             for i, chunk in enumerate(chunks):
                 idx = len(texts)
                 texts.append(chunk)
                 metadata[idx] = {
                     'file_id': str(f.id),
                     'chunk_index': i,
-                    'filename': f.filename
+                    'filename': f.filename,
+                    'content': chunk
                 }
 
     if not texts:
         # no content: return empty index + metadata
         empty_index = faiss.IndexFlatL2(1)
-        return faiss.serialize_index(empty_index), pickle.dumps(metadata)
+        return faiss.serialize_index(empty_index).tobytes(), pickle.dumps(metadata)
 
-    # 2) Embed all chunks
-    embeddings = [embed_text(t) for t in texts]
-    arr = np.vstack(embeddings).astype('float32')
+    # 2) Embed all chunks in batches
+    arr = embed_texts(texts).astype('float32')
     dim = arr.shape[1]
 
-    # 3) Build FAISS index
-    index = faiss.IndexFlatL2(dim)
-    index.add(arr)
-    index_bytes = faiss.serialize_index(index)
+    # 3) Build FAISS index (ID-mapped so files can later be appended/removed in place)
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    index.add_with_ids(arr, np.arange(len(texts), dtype='int64'))
+    index_bytes = faiss.serialize_index(index).tobytes()
 
     # 4) Pickle metadata dict
     pkl_bytes = pickle.dumps(metadata)
 
     return index_bytes, pkl_bytes
 
+def _load_course_index(course):
+    """
+    Deserializes a course's stored index as an IndexIDMap2 keyed by the metadata ids.
+    Legacy IndexFlatL2 blobs are converted in place; empty placeholders yield None.
+    """
+    metadata = pickle.loads(course.index_pkl) if course.index_pkl else {}
+    if not course.index_faiss:
+        return None, {}
+
+    index = faiss.deserialize_index(np.frombuffer(course.index_faiss, dtype='uint8'))
+    if index.ntotal == 0:
+        return None, {}
+    if isinstance(index, faiss.IndexIDMap2):
+        return index, metadata
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    id_mapped = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+    id_mapped.add_with_ids(vectors, np.arange(index.ntotal, dtype='int64'))
+    return id_mapped, metadata
+
+
+def _drop_files(index, metadata, file_ids):
+    file_ids = {str(fid) for fid in file_ids}
+    stale = [idx for idx, md in metadata.items() if md.get('file_id') in file_ids]
+    if stale and index is not None:
+        index.remove_ids(np.asarray(stale, dtype='int64'))
+    for idx in stale:
+        del metadata[idx]
+
+
+def _serialize_course_index(index, metadata):
+    if index is None or index.ntotal == 0:
+        return faiss.serialize_index(faiss.IndexFlatL2(1)).tobytes(), pickle.dumps({})
+    return faiss.serialize_index(index).tobytes(), pickle.dumps(metadata)
+
+
+def add_file_to_course_index(db: Session, course_id: str, file_id: str):
+    """
+    Appends one file's chunk vectors to the course index without touching the
+    other files. Any vectors already stored for the file are replaced, so the
+    call is safe to retry.
+    Returns: (index_bytes, pkl_bytes)
+    """
+    f = get_file_by_id(db, file_id)
+    texts = file_chunks(db, f)
+    arr = embed_texts(texts).astype('float32')
+
+    # Lock the course row so concurrent uploads append to the latest index
+    course = get_course_for_update(db, course_id)
+    index, metadata = _load_course_index(course)
+    _drop_files(index, metadata, [f.id])
+
+    if texts:
+        if index is None:
+            index = faiss.IndexIDMap2(faiss.IndexFlatL2(arr.shape[1]))
+        start = max(metadata.keys(), default=-1) + 1
+        ids = np.arange(start, start + len(texts), dtype='int64')
+        index.add_with_ids(arr, ids)
+        for i, idx in enumerate(ids):
+            metadata[int(idx)] = {
+                'file_id': str(f.id),
+                'chunk_index': i,
+                'filename': f.filename,
+                'content': texts[i]
+            }
+
+    return _serialize_course_index(index, metadata)
+
+
+def remove_files_from_course_index(db: Session, course_id: str, file_ids):
+    """
+    Removes the vectors of the given files from the course index.
+    Returns: (index_bytes, pkl_bytes)
+    """
+    course = get_course_for_update(db, course_id)
+    index, metadata = _load_course_index(course)
+    _drop_files(index, metadata, file_ids)
+    return _serialize_course_index(index, metadata)
+
 def rebuild_file_index(db: Session, file_id: str):
     
     f = get_file_by_id(db, file_id)
-    raw = extract_text(f.file_data, f.filename)
-    chunks = split_text(raw)
+    chunks = file_chunks(db, f)
 
     texts, metadata = [], {}
     for i, chunk in enumerate(chunks):
@@ -64,19 +143,19 @@ def rebuild_file_index(db: Session, file_id: str):
         metadata[idx] = {
             'file_id':     str(f.id),
             'chunk_index': i,
-            'filename':    f.filename
+            'filename':    f.filename,
+            'content':     chunk
         }
 
     if not texts:
         empty = faiss.IndexFlatL2(1)
-        return faiss.serialize_index(empty), pickle.dumps(metadata)
+        return faiss.serialize_index(empty).tobytes(), pickle.dumps(metadata)
 
-    emb = [embed_text(t) for t in texts]
-    arr = np.vstack(emb).astype('float32')
+    arr = embed_texts(texts).astype('float32')
     dim = arr.shape[1]
     index = faiss.IndexFlatL2(dim)
     index.add(arr)
-    return faiss.serialize_index(index), pickle.dumps(metadata)
+    return faiss.serialize_index(index).tobytes(), pickle.dumps(metadata)
 
 def store_file_embeddings(db: Session, file_id: str) -> int:
     """
@@ -84,9 +163,11 @@ def store_file_embeddings(db: Session, file_id: str) -> int:
     Returns the number of chunks stored.
     """
     f = get_file_by_id(db, file_id)
-    raw_text = extract_text(f.file_data, f.filename)
-    clean_text = clean_extracted_text(raw_text)
-    chunks = split_text(clean_text)
+    # Audio/video uploads are indexed from their Whisper transcription
+    if f.transcription is not None:
+        chunks = split_text(clean_extracted_text(f.transcription))
+    else:
+        chunks = file_chunks(db, f, clean=True)
 
     if not chunks:
         return 0
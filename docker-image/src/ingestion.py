@@ -0,0 +1,155 @@
+import io
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from werkzeug.datastructures import FileStorage
+
+from transcriber import transcribe_audio
+from indexer import add_file_to_course_index, store_file_embeddings
+from FAISS_db_generation import build_file_store, rename_store_source
+from src.db.queries import (
+    get_file_by_id, update_file, update_course,
+    create_ingestion_job, get_ingestion_job_by_id, update_ingestion_job,
+    get_duplicate_file, copy_duplicate_file_chunks
+)
+
+# Ordered pipeline run for every uploaded file
+INGESTION_STAGES = ('transcribe', 'file_index', 'course_index', 'embeddings')
+
+
+def needs_transcription(mimetype: str) -> bool:
+    mimetype = mimetype or ""
+    return mimetype.startswith("audio/") or mimetype in ["application/octet-stream", "video/mp4"]
+
+
+# Stages reuse the results of a byte-identical File (same content_hash) when
+# one exists, so a re-uploaded file costs no transcription or embedding calls
+
+def _stage_transcribe(db, f, course_id):
+    twin = get_duplicate_file(db, f.id, f.content_hash)
+    if twin is not None and twin.transcription is not None:
+        update_file(db, f.id, transcription=twin.transcription)
+        f.transcription = twin.transcription
+        return
+    fobj = FileStorage(stream=io.BytesIO(f.file_data), filename=f.filename)
+    transcription = transcribe_audio(fobj)
+    update_file(db, f.id, transcription=transcription)
+    f.transcription = transcription
+
+
+def _stage_file_index(db, f, course_id):
+    twin = get_duplicate_file(db, f.id, f.content_hash, with_index=True)
+    if twin is not None and twin.index_faiss is not None:
+        # Same vectors; only the chunks' source filename differs
+        index_pkl = rename_store_source(twin.index_pkl, twin.filename, f.filename)
+        update_file(db, f.id, index_faiss=twin.index_faiss, index_pkl=index_pkl)
+        return
+    # If transcription, index the transcribed text, otherwise the uploaded file
+    if f.transcription is not None:
+        file_idx, file_pkl = build_file_store(f.transcription.encode("utf-8"), "transcription.txt")
+    else:
+        file_idx, file_pkl = build_file_store(f.file_data, f.filename)
+    update_file(db, f.id, index_faiss=file_idx, index_pkl=file_pkl)
+
+
+def _stage_course_index(db, f, course_id):
+    idx_bytes, pkl_bytes = add_file_to_course_index(db, course_id, f.id)
+    update_course(db, course_id=course_id, index_faiss=idx_bytes, index_pkl=pkl_bytes)
+
+
+def _stage_embeddings(db, f, course_id):
+    if copy_duplicate_file_chunks(db, f.id, course_id, f.content_hash):
+        return
+    store_file_embeddings(db, str(f.id))
+
+
+STAGE_HANDLERS = {
+    'transcribe':   _stage_transcribe,
+    'file_index':   _stage_file_index,
+    'course_index': _stage_course_index,
+    'embeddings':   _stage_embeddings,
+}
+
+
+def run_ingestion_job(session_factory, job_id):
+    """
+    Runs every pipeline stage for one IngestionJob, recording per-stage
+    status on the job row as it goes. Stops at the first failing stage.
+    """
+    db = session_factory()
+    try:
+        job = get_ingestion_job_by_id(db, job_id)
+        if not job:
+            return
+        stages = dict(job.stages or {})
+        # The upload's bytes load lazily, only for stages that cannot reuse a duplicate
+        f = get_file_by_id(db, job.file_id)
+        if not f:
+            update_ingestion_job(db, job_id, status='failed', error='File not found')
+            return
+
+        update_ingestion_job(db, job_id, status='running')
+        for stage in INGESTION_STAGES:
+            if stages.get(stage) in ('skipped', 'done'):
+                continue
+            stages[stage] = 'running'
+            update_ingestion_job(db, job_id, stage=stage, stages=stages)
+            try:
+                STAGE_HANDLERS[stage](db, f, job.course_id)
+            except Exception as e:
+                traceback.print_exc()
+                db.rollback()
+                stages[stage] = 'failed'
+                update_ingestion_job(db, job_id, status='failed', stages=stages,
+                                     error=f'{stage}: {e}')
+                return
+            stages[stage] = 'done'
+            update_ingestion_job(db, job_id, stages=stages)
+
+        update_ingestion_job(db, job_id, status='succeeded', stage=None, stages=stages)
+    finally:
+        db.close()
+
+
+class IngestionQueue:
+    """
+    Local worker pool that runs file ingestion outside the request thread.
+    With max_workers=0 jobs run inline, which keeps tests and debugging simple.
+    """
+
+    def __init__(self, session_factory, max_workers: int = 2, stages=INGESTION_STAGES):
+        self._session_factory = session_factory
+        # Stages the active retrieval backend reads from; the rest are marked skipped
+        self._stages = tuple(stages)
+        self._executor = (
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+            if max_workers > 0 else None
+        )
+
+    def enqueue(self, db, file, course_id):
+        """
+        Creates the IngestionJob row for a freshly stored file and schedules it.
+        Returns (job, future).
+        """
+        stages = {
+            stage: 'pending' if stage in self._stages else 'skipped'
+            for stage in INGESTION_STAGES
+        }
+        if not needs_transcription(file.file_type):
+            stages['transcribe'] = 'skipped'
+        job = create_ingestion_job(db, file.id, course_id, stages)
+        return job, self.submit(job.id)
+
+    def submit(self, job_id) -> Future:
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(run_ingestion_job(self._session_factory, job_id))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._executor.submit(run_ingestion_job, self._session_factory, job_id)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
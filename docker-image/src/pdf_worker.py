@@ -0,0 +1,28 @@
+"""
+Page extraction run inside the shared PDF process pool (see
+textUtils.iter_pdf_pages). Kept free of app imports so spawned or
+forkserver workers start quickly.
+"""
+from collections import OrderedDict
+from typing import List
+
+from PyPDF2 import PdfReader
+
+# Parsed PDFs kept per worker; tasks for the same upload reuse its reader
+_MAX_READERS = 2
+_readers: "OrderedDict[str, PdfReader]" = OrderedDict()
+
+
+def _reader(path: str) -> PdfReader:
+    reader = _readers.get(path)
+    if reader is None:
+        reader = _readers[path] = PdfReader(path)
+        while len(_readers) > _MAX_READERS:
+            _readers.popitem(last=False)
+    _readers.move_to_end(path)
+    return reader
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    reader = _reader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
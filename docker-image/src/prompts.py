@@ -3,7 +3,7 @@ import os
 from flask import json
 from openai import OpenAI
 from dotenv import load_dotenv, find_dotenv
-from FAISS_retriever import answer_to_QA, answer_to_QA_all_chunks
+from FAISS_retriever import answer_to_QA, answer_to_QA_all_chunks, answer_to_QA_documents
 
 load_dotenv(find_dotenv())
 
@@ -122,7 +122,11 @@ def prompt2_generate_course_outline(topic, expertise):
     
     return response.choices[0].message.content.strip()
 
-def prompt_generate_personalized_file_content(working_dir, persona):
+# Bump when the outline prompt changes so cached outlines are regenerated
+FILE_OUTLINE_PROMPT_VERSION = "1"
+
+# Persona-independent stage: organizes the file's chunks into chapters (cached per file)
+def prompt_structure_file_content(documents):
     rag_query = ( 
     """
     You are an AI assistant generating a structured outline for educational content.
@@ -166,9 +170,10 @@ def prompt_generate_personalized_file_content(working_dir, persona):
     """
     )
 
-    JSON_response = answer_to_QA_all_chunks(rag_query, working_dir)
-    print(JSON_response)
+    return answer_to_QA_documents(rag_query, documents)
 
+# Persona-specific stage: rewrites the cached outline's fullText fields for one student
+def prompt_personalize_file_content(JSON_response, persona):
     personalization_query = (
     f"""
     You are an AI assistant tasked with personalizing structured educational content.
@@ -374,50 +379,47 @@ def prompt4_valid_query(user_query, course_outline):
     else:
         print(f"Unexpected response: {result}")
 
-def prompt_course_faqs(course_title: str, questions: list[str]) -> dict:
-    if not questions:
-        return {"faqs": []}
-
-    max_n = min(10, len(questions))
-    bullet_list = "\n".join(f"- {q}" for q in questions)
+def prompt_label_faqs(course_title: str, clusters: list) -> list:
+    """
+    Asks GPT-4o for one clean FAQ question per cluster, in order. Returns
+    None if its answer does not line up with the clusters.
+    """
+    numbered = "\n".join(
+        f"{i + 1}. {c.representative}"
+        + "".join(f"\n   - also asked: {v}" for v in c.variants[:2])
+        for i, c in enumerate(clusters)
+    )
 
     system_query = (
         f"""
-You are an AI assistant. Below is the complete list of student chats in course '{course_title}'.
+You are an AI assistant. Below are {len(clusters)} frequently asked question groups from student chats in course '{course_title}'.
+Each group shows its most common phrasing and up to two other phrasings.
 
 Your tasks:
-1. Identify and group questions that have the same meaning even if phrased differently.
-2. Return EXACTLY the top {max_n} most frequently asked questions with their counts.
-3. Do NOT include any questions that were never asked.
-4. If fewer than {max_n} unique questions exist after grouping, return only those.
-5. Return strictly valid JSON in this format and nothing else:
+1. Write ONE clear, concise FAQ question for each group that captures what students are asking.
+2. Keep the groups in the given order and return exactly {len(clusters)} questions.
+3. Return strictly valid JSON in this format and nothing else:
 ```
 {{
-  "faqs": [
-    {{ "question": "string", "count": number }},
-    ...
-  ]
+  "questions": ["string", ...]
 }}
 ```
 """
     )
 
-    user_query = (
-        f"""
-Course: {course_title}
-
-Questions:
-{bullet_list}
-"""
-    )
-
     resp = client.chat.completions.create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": system_query},
-            {"role": "user",   "content": user_query}
+            {"role": "user",   "content": numbered}
         ],
         temperature=0.0,
     )
 
-    return json.loads(resp.choices[0].message.content.strip())
+    try:
+        labels = json.loads(resp.choices[0].message.content.strip()).get("questions", [])
+    except (ValueError, AttributeError):
+        return None
+    if len(labels) != len(clusters) or not all(isinstance(l, str) and l.strip() for l in labels):
+        return None
+    return [l.strip() for l in labels]
@@ -0,0 +1,179 @@
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+from sqlalchemy import text
+from langchain.schema import Document
+
+from indexer import remove_files_from_course_index
+from src.textUtils import embed_text, openai_embed_text
+from src.faiss_cache import faiss_index_cache
+from src.db.queries import (
+    get_course_by_id, get_file_by_id, update_course,
+    get_file_chunks, get_indexed_files_for_course, search_file_chunks
+)
+
+
+class RetrievalBackend(ABC):
+    """
+    Serves course-level and file-level retrieval from one vector store.
+    Search hits are dicts with content, file_id, chunk_index and distance.
+    """
+    name = None
+    # Ingestion stages (see src.ingestion.INGESTION_STAGES) this backend reads from
+    ingestion_stages = ()
+
+    @abstractmethod
+    def search(self, db, course_id, query: str, k: int = 5, file_id=None,
+               ef_search: int = None, probes: int = None) -> list[dict]:
+        """
+        ef_search/probes tune approximate backends per query and are ignored otherwise.
+        """
+
+    @abstractmethod
+    def file_documents(self, db, file_id) -> list[Document]:
+        """All chunks of one file, in document order."""
+
+    @abstractmethod
+    def course_citations(self, db, course_id) -> list[dict]:
+        """[{source, citation}] for the course's indexed files."""
+
+    def remove_files(self, db, course_id, file_ids):
+        """Drops the given files' vectors before the File rows are deleted."""
+        pass
+
+
+class PgVectorBackend(RetrievalBackend):
+    """
+    Retrieval over FileChunk rows (pgvector, text-embedding-3-small).
+    Chunks go away with their File via ON DELETE CASCADE.
+
+    Queries use the HNSW (or IVFFlat) index on FileChunk.embedding; search
+    breadth is set per transaction with hnsw.ef_search / ivfflat.probes.
+    """
+    name = 'pgvector'
+    ingestion_stages = ('transcribe', 'embeddings')
+
+    def __init__(self, vector_index: str = None, ef_search: int = None,
+                 probes: int = None, iterative_scan: str = None):
+        self.vector_index = vector_index or os.getenv("VECTOR_INDEX", "hnsw")
+        self.ef_search = ef_search or int(os.getenv("HNSW_EF_SEARCH", "40"))
+        self.probes = probes or int(os.getenv("IVFFLAT_PROBES", "10"))
+        # Without it an ANN scan returns only ef_search/probes candidates before the
+        # course filter, so a course with few of them gets fewer than k rows (or none).
+        # Needs pgvector >= 0.8; set VECTOR_ITERATIVE_SCAN=off on older versions.
+        self.iterative_scan = iterative_scan or os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order")
+
+    def _tune_ann_search(self, db, k, ef_search=None, probes=None):
+        if db.bind.dialect.name != 'postgresql':
+            return
+        set_local = text("SELECT set_config(:name, :value, true)")
+        if self.vector_index == 'ivfflat':
+            db.execute(set_local, {"name": "ivfflat.probes", "value": str(probes or self.probes)})
+        else:
+            # ef_search below k would cap the result count
+            ef = max(ef_search or self.ef_search, k)
+            db.execute(set_local, {"name": "hnsw.ef_search", "value": str(ef)})
+        if self.iterative_scan and self.iterative_scan != 'off':
+            db.execute(set_local, {"name": f"{self.vector_index}.iterative_scan",
+                                   "value": self.iterative_scan})
+
+    def search(self, db, course_id, query, k=5, file_id=None, ef_search=None, probes=None):
+        self._tune_ann_search(db, k, ef_search, probes)
+        query_vec = openai_embed_text([query])[0]
+        rows = search_file_chunks(db, course_id, query_vec, k=k, file_id=file_id)
+        return [
+            {'content': content, 'file_id': str(fid), 'chunk_index': idx, 'distance': float(dist)}
+            for content, fid, idx, dist in rows
+        ]
+
+    def file_documents(self, db, file_id):
+        f = get_file_by_id(db, file_id)
+        if not f:
+            return []
+        return [
+            Document(
+                page_content=chunk.content,
+                metadata={'source': f.filename, 'file_id': str(f.id), 'chunk_index': chunk.chunk_index}
+            )
+            for chunk in get_file_chunks(db, file_id)
+        ]
+
+    def course_citations(self, db, course_id):
+        return [
+            {'source': filename, 'citation': f"Mock APA Citation for {filename}"}
+            for _, filename in get_indexed_files_for_course(db, course_id)
+        ]
+
+
+class FaissBackend(RetrievalBackend):
+    """
+    Legacy retrieval over the FAISS blobs stored on File and Course
+    (LangChain per-file store plus the ada-002 course index).
+    """
+    name = 'faiss'
+    ingestion_stages = ('transcribe', 'file_index', 'course_index')
+
+    def search(self, db, course_id, query, k=5, file_id=None, ef_search=None, probes=None):
+        if file_id:
+            f = get_file_by_id(db, file_id)
+            store = faiss_index_cache.get_file_store(f) if f else None
+            if store is None:
+                return []
+            return [
+                {'content': doc.page_content, 'file_id': str(f.id),
+                 'chunk_index': None, 'distance': float(score)}
+                for doc, score in store.similarity_search_with_score(query, k=k)
+            ]
+
+        course = get_course_by_id(db, course_id)
+        if not course:
+            return []
+        index, metadata = faiss_index_cache.get_course_index(course)
+        if index is None or index.ntotal == 0:
+            return []
+        query_vec = np.asarray([embed_text(query)], dtype='float32')
+        distances, ids = index.search(query_vec, min(k, index.ntotal))
+        hits = []
+        for dist, idx in zip(distances[0], ids[0]):
+            md = metadata.get(int(idx))
+            if md is None:
+                continue
+            hits.append({'content': md.get('content', ''), 'file_id': md['file_id'],
+                         'chunk_index': md['chunk_index'], 'distance': float(dist)})
+        return hits
+
+    def file_documents(self, db, file_id):
+        f = get_file_by_id(db, file_id)
+        store = faiss_index_cache.get_file_store(f) if f else None
+        if store is None:
+            return []
+        return list(store.docstore.__dict__["_dict"].values())
+
+    def course_citations(self, db, course_id):
+        course = get_course_by_id(db, course_id)
+        if not course:
+            return []
+        _, metadata = faiss_index_cache.get_course_index(course)
+        return [
+            {'source': md.get('source', 'Unknown'),
+             'citation': f"Mock APA Citation for {md.get('filename')}"}
+            for md in metadata.values()
+        ]
+
+    def remove_files(self, db, course_id, file_ids):
+        idx_bytes, pkl_bytes = remove_files_from_course_index(db, course_id, file_ids)
+        update_course(db, course_id=course_id, index_faiss=idx_bytes, index_pkl=pkl_bytes)
+
+
+RETRIEVAL_BACKENDS = {
+    PgVectorBackend.name: PgVectorBackend,
+    FaissBackend.name:    FaissBackend,
+}
+
+
+def get_retrieval_backend(name: str = None) -> RetrievalBackend:
+    name = name or os.getenv("RETRIEVAL_BACKEND", PgVectorBackend.name)
+    if name not in RETRIEVAL_BACKENDS:
+        raise RuntimeError(f"Unknown RETRIEVAL_BACKEND '{name}'")
+    return RETRIEVAL_BACKENDS[name]()
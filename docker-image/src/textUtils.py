@@ -1,7 +1,13 @@
+import codecs
 import io
-from typing import Sequence, List
+import multiprocessing
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, Sequence, List, Union
 
-import tiktoken
 from PyPDF2 import PdfReader
 import textract
 from openai import OpenAI
@@ -9,64 +15,158 @@ import numpy as np
 import os
 import re
 
+from src.chunker import TokenChunker
+from src.pdf_worker import extract_pdf_pages
+from src.embedding_cache import embedding_cache
+from src.embedding_engine import EmbeddingEngine
+
 _embed_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def extract_text(file_data: bytes, filename: str) -> str:
+ADA_EMBEDDING_MODEL = "text-embedding-ada-002"
+SMALL_EMBEDDING_MODEL = "text-embedding-3-small"
+
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+
+_ada_engine = EmbeddingEngine(_embed_client, ADA_EMBEDDING_MODEL, max_in_flight=EMBED_MAX_IN_FLIGHT)
+_small_engine = EmbeddingEngine(_embed_client, SMALL_EMBEDDING_MODEL, max_in_flight=EMBED_MAX_IN_FLIGHT)
+
+# PDFs with at least this many pages are extracted by a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+# Pages handed to a worker per task
+PDF_PAGES_PER_TASK = 16
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Plain-text uploads are decoded in blocks of this many bytes
+TEXT_BLOCK_SIZE = 1 << 16
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    One extraction pool per process, shared by every ingestion worker. Its
+    processes are started by forkserver (or spawn), never forked from this
+    multithreaded process.
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pdf_pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS,
+                                            mp_context=multiprocessing.get_context(method))
+        return _pdf_pool
+
+def iter_pdf_pages(file_data: bytes, workers: int = None, min_parallel_pages: int = None) -> Iterator[str]:
+    """
+    Yields the text of each PDF page in order. Large PDFs are split into
+    page ranges extracted by the shared process pool, which reads the upload
+    from a temporary file. At most two ranges per worker are in flight, so
+    finished pages never pile up ahead of the consumer.
+    """
+    workers = EXTRACT_WORKERS if workers is None else workers
+    min_parallel_pages = PDF_PARALLEL_MIN_PAGES if min_parallel_pages is None else min_parallel_pages
+    reader = PdfReader(io.BytesIO(file_data))
+    n_pages = len(reader.pages)
+    if workers <= 1 or n_pages < min_parallel_pages:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+    del reader
+
+    ranges = [(s, min(s + PDF_PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, PDF_PAGES_PER_TASK)]
+    pool = _get_pdf_pool()
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as tmp:
+        tmp.write(file_data)
+        tmp.flush()
+        pending = deque()
+        try:
+            for start, end in ranges:
+                pending.append(pool.submit(extract_pdf_pages, tmp.name, start, end))
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+def iter_text(file_data: bytes, filename: str) -> Iterator[str]:
+    """
+    Yields an upload's text section by section: PDF pages, document
+    elements or newline-aligned text blocks. extract_text joins them with
+    newlines; split_text can consume them directly.
+    """
     ext = filename.lower().rsplit('.', 1)[-1]
     if ext == 'pdf':
-        reader = PdfReader(io.BytesIO(file_data))
-        texts = []
-        for page in reader.pages:
-            txt = page.extract_text()
+        for txt in iter_pdf_pages(file_data):
             if txt:
-                texts.append(txt)
-        return "\n".join(texts)
-    elif ext in ('doc', 'docx', 'ppt', 'pptx'):
-        return textract.process(io.BytesIO(file_data), extension=ext).decode('utf-8', errors='ignore')
+                yield txt
+    elif ext in ('docx', 'pptx'):
+        if ext == 'docx':
+            from unstructured.partition.docx import partition_docx as partition
+        else:
+            from unstructured.partition.pptx import partition_pptx as partition
+        for el in partition(file=io.BytesIO(file_data)):
+            if str(el):
+                yield str(el)
+    elif ext in ('doc', 'ppt'):
+        yield textract.process(io.BytesIO(file_data), extension=ext).decode('utf-8', errors='ignore')
     else:
-        return file_data.decode('utf-8', errors='ignore')
+        # Blocks are cut at their last newline so the sections rejoin with "\n" exactly
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        view = memoryview(file_data)
+        carry = ""
+        for i in range(0, len(view), TEXT_BLOCK_SIZE):
+            block = carry + decoder.decode(view[i : i + TEXT_BLOCK_SIZE])
+            cut = block.rfind("\n")
+            if cut < 0:
+                carry = block
+                continue
+            yield block[:cut]
+            carry = block[cut + 1:]
+        yield carry + decoder.decode(b'', final=True)
+
+def extract_text(file_data: bytes, filename: str) -> str:
+    return "\n".join(iter_text(file_data, filename))
     
+# The four cleanup rules in one alternation: collapse whitespace, then split
+# lower→Upper, letter→digit and digit→letter runs (all become one space)
+_CLEANUP = re.compile(
+    r'\s+'
+    r'|(?<=[a-z])(?=[A-Z])'
+    r'|(?<=[a-zA-Z])(?=[0-9])'
+    r'|(?<=[0-9])(?=[a-zA-Z])'
+)
+
 def clean_extracted_text(text: str) -> str:
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', text)
-    text = re.sub(r'(?<=[a-zA-Z])(?=[0-9])', ' ', text)
-    text = re.sub(r'(?<=[0-9])(?=[a-zA-Z])', ' ', text)
-
-    return text.strip()
-
-def split_text(text: str, max_tokens: int = 300, overlap: int = 50) -> List[str]:
-    enc = tiktoken.get_encoding("cl100k_base")
-    token_ids = enc.encode(text)
-    chunks = []
-    start = 0
-    while start < len(token_ids):
-        end = min(start + max_tokens, len(token_ids))
-        chunk = enc.decode(token_ids[start:end])
-        chunks.append(chunk)
-        start += max_tokens - overlap
-    return chunks
+    return _CLEANUP.sub(' ', text).strip()
+
+@lru_cache(maxsize=32)
+def get_chunker(max_tokens: int = 300, overlap: int = 50, boundary: str = None) -> TokenChunker:
+    return TokenChunker(max_tokens, overlap, boundary)
+
+def split_text(text: Union[str, Iterable[str]], max_tokens: int = 300, overlap: int = 50,
+               boundary: str = None) -> List[str]:
+    """
+    Splits text into windows of max_tokens tokens overlapping by overlap.
+    Accepts one string or a stream of sections (e.g. iter_text), which are
+    joined with newlines and chunked as they arrive. boundary='sentence' or
+    'paragraph' ends windows at such boundaries where possible.
+    """
+    return get_chunker(max_tokens, overlap, boundary).split(text)
 def embed_text(text: str) -> List[float]:
-    response = _embed_client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=text
-    )
-    return response.data[0].embedding
+    return embedding_cache.embed(ADA_EMBEDDING_MODEL, [text], _ada_engine.embed)[0].tolist()
 
-def openai_embed_text(texts: Sequence[str]) -> np.ndarray:
+def embed_texts(texts: Sequence[str]) -> np.ndarray:
+    """
+    Batched counterpart of embed_text: one row per text, same model, with
+    cache misses sent in pipelined 512-item batches.
+    """
     if not texts:
         return np.empty((0, 1536), dtype=np.float32)
-    CHUNK = 512
-    out: List[np.ndarray] = []
+    return embedding_cache.embed(ADA_EMBEDDING_MODEL, list(texts), _ada_engine.embed)
 
-    for i in range(0, len(texts), CHUNK):
-        batch = texts[i : i + CHUNK]
-
-        resp = _embed_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=batch,
-            encoding_format="float"
-        )
-        arr = np.asarray([d.embedding for d in resp.data], dtype=np.float32)
-        out.append(arr)
-
-    return np.vstack(out)
+def openai_embed_text(texts: Sequence[str]) -> np.ndarray:
+    if not texts:
+        return np.empty((0, 1536), dtype=np.float32)
+    # Only texts missing from the embedding cache reach the API
+    return embedding_cache.embed(SMALL_EMBEDDING_MODEL, list(texts), _small_engine.embed)
@@ -0,0 +1,73 @@
+import uuid
+
+import firebase_admin.auth as fauth
+
+import src.auth_cache as auth_cache
+from src.auth_cache import PrincipalCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_claims_are_reverified_after_revocation_interval(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth_cache.time, "time", clock)
+    cache = PrincipalCache(ttl=600, revocation_check_interval=60)
+    cache.put_claims("cookie", {"uid": "u1", "exp": clock.now + 3600})
+
+    clock.now += 59
+    assert cache.get_claims("cookie") == {"uid": "u1", "exp": 4600.0}
+    clock.now += 1
+    assert cache.get_claims("cookie") is None
+
+
+def test_principal_expires_with_ttl_and_cookie(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth_cache.time, "time", clock)
+    cache = PrincipalCache(ttl=30, revocation_check_interval=600)
+    cache.put_claims("cookie", {"uid": "u1", "exp": clock.now + 100})
+    cache.put_principal("cookie", {"user_id": "id1", "role": "student", "profile_id": "id1"})
+
+    clock.now += 29
+    assert cache.get_principal("cookie")["role"] == "student"
+    clock.now += 1
+    assert cache.get_principal("cookie") is None
+
+    clock.now += 70
+    assert cache.get_claims("cookie") is None
+
+
+def test_invalidate_user_drops_all_of_their_sessions():
+    cache = PrincipalCache()
+    for token in ("a", "b"):
+        cache.put_claims(token, {"uid": "u1"})
+        cache.put_principal(token, {"user_id": "id1", "role": "admin", "profile_id": None})
+
+    cache.invalidate_user("id1")
+
+    assert cache.get_claims("a") is None and cache.get_claims("b") is None
+
+
+def test_protected_routes_verify_cookie_once(client, monkeypatch):
+    calls = []
+
+    def verify(cookie, check_revoked=True):
+        calls.append(cookie)
+        return {"uid": cookie}
+
+    monkeypatch.setattr(fauth, "verify_session_cookie", verify)
+    uid = str(uuid.uuid4())
+    assert client.post("/register/instructor", json={
+        "idToken": uid, "email": f"{uid}@example.com", "password": "pw", "name": "Prof Cache"
+    }).status_code == 201
+    client.set_cookie("session", uid)
+
+    for _ in range(3):
+        assert client.get("/instructor/courses").status_code == 200
+
+    assert calls == [uid]
@@ -0,0 +1,202 @@
+import hashlib
+import io
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src.blobstore import BlobNotFound, BlobStore, LocalBlobStore, S3BlobStore, get_blob_store
+
+
+def test_local_store_reads_ranges_in_chunks(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    data = bytes(range(256)) * 10
+    store.put("ab" * 32, data)
+
+    assert store.size("ab" * 32) == len(data)
+    assert store.get("ab" * 32) == data
+    assert list(store.iter_range("ab" * 32, 100, 110, chunk_size=4)) == [
+        data[100:104], data[104:108], data[108:110]
+    ]
+    store.delete("ab" * 32)
+    assert not store.exists("ab" * 32)
+    with pytest.raises(BlobNotFound):
+        list(store.iter_range("ab" * 32))
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.ranges = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key, Range):
+        if Key not in self.objects:
+            error = Exception("missing")
+            error.response = {"Error": {"Code": "NoSuchKey"}}
+            raise error
+        self.ranges.append(Range)
+        start, end = Range[len("bytes="):].split("-")
+        data = self.objects[Key][int(start):int(end) + 1 if end else None]
+        return {"Body": io.BytesIO(data)}
+
+
+def test_s3_store_sends_range_requests():
+    s3 = FakeS3()
+    store = S3BlobStore("bucket", prefix="files/", client=s3)
+    store.put("k", b"0123456789")
+
+    assert b"".join(store.iter_range("k", 2, 5)) == b"234"
+    assert store.get("k") == b"0123456789"
+    assert s3.ranges == ["bytes=2-4", "bytes=0-"]
+    with pytest.raises(BlobNotFound):
+        list(store.iter_range("other"))
+
+
+def test_content_route_streams_ranges(client, instructor_course):
+    _, module_id = instructor_course
+    data = os.urandom(1000)
+    file_id = client.post(
+        f"/instructor/modules/{module_id}/files",
+        data={"file": (io.BytesIO(data), "lecture.mp4", "video/mp4")},
+        content_type="multipart/form-data"
+    ).get_json()["id"]
+    url = f"/instructor/files/{file_id}/content"
+
+    full = client.get(url)
+    assert full.status_code == 200 and full.data == data
+    assert full.headers["Accept-Ranges"] == "bytes"
+
+    part = client.get(url, headers={"Range": "bytes=100-199"})
+    assert part.status_code == 206 and part.data == data[100:200]
+    assert part.headers["Content-Range"] == "bytes 100-199/1000"
+
+    assert client.get(url, headers={"Range": "bytes=-10"}).data == data[-10:]
+    assert client.get(url, headers={"Range": "bytes=5000-"}).status_code == 416
+    assert client.get(url, headers={"If-None-Match": full.headers["ETag"]}).status_code == 304
+
+    # Multiple ranges and a stale or date-based If-Range get the full body
+    for headers in (
+        {"Range": "bytes=0-9,20-29"},
+        {"Range": "bytes=0-9", "If-Range": '"stale"'},
+        {"Range": "bytes=0-9", "If-Range": "Wed, 21 Oct 2015 07:28:00 GMT"},
+    ):
+        resp = client.get(url, headers=headers)
+        assert resp.status_code == 200 and resp.data == data
+    resp = client.get(url, headers={"Range": "bytes=0-9", "If-Range": full.headers["ETag"]})
+    assert resp.status_code == 206 and resp.data == data[:10]
+
+    # The bytes leave the store with the last file that references them
+    content_hash = full.headers["ETag"].strip('"')
+    assert get_blob_store().exists(content_hash)
+    client.delete(f"/instructor/files/{file_id}")
+    assert not get_blob_store().exists(content_hash)
+
+
+def test_blob_store_must_be_configured(monkeypatch):
+    get_blob_store.cache_clear()
+    try:
+        monkeypatch.delenv("BLOB_STORE")
+        with pytest.raises(RuntimeError, match="BLOB_STORE not set"):
+            get_blob_store()
+        # Local storage is opt-in and needs an explicit (mounted) directory
+        monkeypatch.setenv("BLOB_STORE", "local")
+        monkeypatch.delenv("BLOB_STORE_DIR")
+        with pytest.raises(RuntimeError, match="BLOB_STORE_DIR"):
+            get_blob_store()
+    finally:
+        monkeypatch.undo()
+        get_blob_store.cache_clear()
+
+
+class InterleavedSession:
+    """
+    A postgresql-dialect session over a shared set of committed FileBlob
+    rows. Inserts become visible to other sessions on commit, and the
+    advisory lock is a real lock held until commit, as in Postgres.
+    """
+
+    def __init__(self, committed, advisory_lock):
+        self.bind = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+        self.committed, self.advisory_lock = committed, advisory_lock
+        self.pending, self.locked = set(), False
+
+    def execute(self, stmt):
+        sql = str(stmt)
+        if "pg_advisory_xact_lock" in sql:
+            self.advisory_lock.acquire()
+            self.locked = True
+        elif sql.startswith("SELECT"):
+            return SimpleNamespace(first=lambda: True if self.committed else None)
+        elif sql.startswith("INSERT"):
+            self.pending.add("blob")
+        return SimpleNamespace(rowcount=0)
+
+    def commit(self):
+        self.committed |= self.pending
+        self.pending = set()
+        if self.locked:
+            self.locked = False
+            self.advisory_lock.release()
+
+
+def test_purge_waits_for_a_reupload_of_the_same_bytes(tmp_path, monkeypatch):
+    from src.db import queries
+    store = LocalBlobStore(str(tmp_path))
+    monkeypatch.setattr(queries, "get_blob_store", lambda: store)
+    committed, advisory_lock = set(), threading.Lock()
+    data = b"lecture notes"
+    content_hash = hashlib.sha256(data).hexdigest()
+    # The last file was deleted and committed; its bytes are still stored
+    store.put(content_hash, data)
+
+    # A new upload of the same bytes inserts its row (and skips the existing
+    # object) but has not committed when the delete's purge runs
+    upload = InterleavedSession(committed, advisory_lock)
+    queries.acquire_file_blob(upload, data)
+    purge = threading.Thread(
+        target=queries.purge_file_blobs,
+        args=(InterleavedSession(committed, advisory_lock), [content_hash])
+    )
+    purge.start()
+    purge.join(0.2)
+    assert purge.is_alive()
+
+    upload.commit()
+    purge.join(5)
+    assert not purge.is_alive()
+    assert store.get(content_hash) == data
+
+
+def test_deleting_an_instructor_releases_their_blobs(make_file):
+    from src.app import session_factory
+    from src.db.queries import create_file, delete_instructor_profile, delete_user, get_file_blob
+
+    db = session_factory()
+    try:
+        for delete in (delete_user, delete_instructor_profile):
+            course, module, _ = make_file(db)
+            data = os.urandom(64)
+            content_hash = hashlib.sha256(data).hexdigest()
+            for name in ("a.bin", "copy.bin"):
+                create_file(db, str(module.id), name, name, "application/octet-stream", 64, data)
+            assert get_file_blob(db, content_hash).size == 64
+
+            delete(db, course.instructor_id)
+
+            assert get_file_blob(db, content_hash) is None
+            assert not get_blob_store().exists(content_hash)
+    finally:
+        db.close()
+
+
+def test_store_missing_a_method_fails_when_created():
+    class WriteOnly(BlobStore):
+        def put(self, key, data):
+            pass
+
+    with pytest.raises(TypeError, match="iter_range"):
+        WriteOnly()
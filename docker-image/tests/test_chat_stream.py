@@ -0,0 +1,72 @@
+import json
+from types import SimpleNamespace
+
+from src.chat_stream import stream_chat_completion
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeCompletions:
+    def __init__(self, pieces, fail_after=None):
+        self.pieces = pieces
+        self.fail_after = fail_after
+        self.kwargs = None
+
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+        for i, piece in enumerate(self.pieces):
+            if i == self.fail_after:
+                raise RuntimeError("connection reset")
+            yield chunk(piece)
+
+
+def parse(frames):
+    events = []
+    for frame in frames:
+        lines = frame.strip().split("\n")
+        event = lines[0][len("event: "):] if lines[0].startswith("event: ") else None
+        events.append((event, json.loads(lines[-1][len("data: "):])))
+    return events
+
+
+def test_tokens_are_forwarded_and_reply_saved_before_done():
+    completions = FakeCompletions(["Hel", None, "lo", " there "])
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    saved = []
+
+    events = parse(stream_chat_completion(client, [{"role": "user", "content": "hi"}], saved.append,
+                                          meta={"chatId": "c1"}, model="gpt-4o"))
+
+    assert completions.kwargs["stream"] is True and completions.kwargs["model"] == "gpt-4o"
+    assert events[0] == ("meta", {"chatId": "c1"})
+    assert [e[1]["delta"] for e in events[1:-1]] == ["Hel", "lo", " there "]
+    event, done = events[-1]
+    assert event == "done" and done["assistant"] == "Hello there" and done["chatId"] == "c1"
+    assert 0 <= done["ttftMs"] <= done["totalMs"]
+    assert saved == ["Hello there"]
+
+
+def test_failed_stream_reports_error_and_saves_nothing():
+    completions = FakeCompletions(["partial", "more"], fail_after=1)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    saved = []
+
+    events = parse(stream_chat_completion(client, [], saved.append))
+
+    assert events[-1] == ("error", {"error": "connection reset"})
+    assert saved == []
+
+
+def test_reply_is_saved_when_the_client_disconnects():
+    completions = FakeCompletions(["Hel", "lo", " there"])
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    saved = []
+
+    frames = stream_chat_completion(client, [], saved.append)
+    next(frames)  # meta
+    next(frames)  # first delta
+    frames.close()
+
+    assert saved == ["Hello there"]
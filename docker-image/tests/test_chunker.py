@@ -0,0 +1,68 @@
+import pytest
+
+import src.chunker as chunker
+from src.chunker import TokenChunker
+
+pytestmark = pytest.mark.usefixtures("char_tokens")
+
+
+def legacy_split(text, max_tokens, overlap):
+    enc = chunker.get_encoding()
+    tokens = enc.encode(text)
+    chunks, start = [], 0
+    while start < len(tokens):
+        chunks.append(enc.decode(tokens[start:start + max_tokens]))
+        start += max_tokens - overlap
+    return chunks
+
+
+@pytest.mark.parametrize("length", [0, 1, 39, 40, 41, 70, 100, 131])
+def test_fixed_windows_match_legacy_split(length):
+    text = "".join(chr(97 + i % 26) for i in range(length))
+    chunks = TokenChunker(40, 10).chunks(text)
+
+    assert [c.text for c in chunks] == legacy_split(text, 40, 10)
+    for c in chunks:
+        assert text[c.char_start:c.char_end] == c.text
+        assert c.token_end - c.token_start == len(c.text)
+
+
+def test_sentence_boundaries_end_windows_at_full_stops():
+    text = "One short sentence. " * 6 + "A" * 30
+    chunker_ = TokenChunker(50, 5, boundary="sentence")
+    chunks = chunker_.chunks(text)
+
+    assert all(c.text.endswith(".") for c in chunks[:-1])
+    assert chunks[-1].char_end == len(text)
+    assert all(c.token_end - c.token_start <= 50 for c in chunks)
+    # Each window still starts overlap tokens before the previous one ended
+    assert all(b.token_start == a.token_end - 5 for a, b in zip(chunks, chunks[1:]))
+
+
+def test_paragraph_boundaries_and_fallback_to_hard_cut():
+    text = "x" * 30 + "\n\n" + "y" * 30 + "\n\n" + "z" * 120
+    chunks = TokenChunker(50, 0, boundary="paragraph").chunks(text)
+
+    assert chunks[0].text == "x" * 30 + "\n\n"
+    # No boundary inside the long paragraph: hard cut at max_tokens
+    assert [len(c.text) for c in chunks[2:]] == [50, 50, 20]
+    assert "".join(c.text for c in chunks) == text
+
+
+@pytest.mark.parametrize("boundary", [None, "sentence"])
+def test_stream_matches_whole_text(boundary):
+    sections = ["Intro line. " * 3, "Body text goes here. " * 8, "", "Short end."]
+    whole = "\n".join(sections)
+    chunker_ = TokenChunker(40, 8, boundary=boundary)
+
+    streamed = list(chunker_.iter_chunks(iter(sections)))
+    assert streamed == chunker_.chunks(whole)
+    for c in streamed:
+        assert whole[c.char_start:c.char_end] == c.text
+
+
+def test_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        TokenChunker(10, 10)
+    with pytest.raises(ValueError):
+        TokenChunker(10, 2, boundary="page")
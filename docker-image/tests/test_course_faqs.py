@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import src.course_faqs as course_faqs
+from src.app import session_factory
+from src.db.queries import create_chat, create_message
+
+
+def test_refresh_only_processes_new_messages(make_file, fake_embed, monkeypatch):
+    labelled = []
+
+    def fake_label(title, clusters):
+        labelled.append([c.representative for c in clusters])
+        return [f"FAQ: {c.representative}" for c in clusters]
+
+    monkeypatch.setattr(course_faqs, "openai_embed_text", fake_embed)
+    monkeypatch.setattr(course_faqs, "prompt_label_faqs", fake_label)
+
+    db = session_factory()
+    try:
+        course, _, f = make_file(db)
+        chat = create_chat(db, str(course.instructor_id), str(f.id), "Questions")
+        for q in ["When is the deadline?", "When is the deadline?", "How does grading work?"]:
+            create_message(db, str(chat.id), "user", q)
+        create_message(db, str(chat.id), "assistant", "Friday, see the deadline page.")
+
+        later = datetime.utcnow() + timedelta(minutes=1)
+        first = course_faqs.refresh_course_faqs(db, course.id, course.title, now=later)
+        assert first == {"faqs": [
+            {"question": "FAQ: When is the deadline?", "count": 2},
+            {"question": "FAQ: How does grading work?", "count": 1},
+        ]}
+        assert fake_embed.calls == [["When is the deadline?", "How does grading work?"]]
+
+        create_message(db, str(chat.id), "user", "What's the deadline for hw1")
+        create_message(db, str(chat.id), "user", "When are office hours?")
+        second = course_faqs.refresh_course_faqs(db, course.id, course.title,
+                                                 now=later + timedelta(minutes=1))
+
+        # Only the two new questions are embedded; only the new cluster is labelled
+        assert fake_embed.calls[1:] == [["What's the deadline for hw1", "When are office hours?"]]
+        assert labelled == [["When is the deadline?", "How does grading work?"],
+                            ["When are office hours?"]]
+        assert second["faqs"][0] == {"question": "FAQ: When is the deadline?", "count": 3}
+        assert len(second["faqs"]) == 3
+
+        # Nothing new: no embedding, no labelling
+        course_faqs.refresh_course_faqs(db, course.id, course.title, now=later + timedelta(minutes=2))
+        assert len(fake_embed.calls) == 2 and len(labelled) == 2
+    finally:
+        db.close()
+
+
+def test_late_committed_message_with_an_old_timestamp_is_not_skipped(make_file, fake_embed, monkeypatch):
+    monkeypatch.setattr(course_faqs, "openai_embed_text", fake_embed)
+    monkeypatch.setattr(course_faqs, "prompt_label_faqs", lambda title, clusters: None)
+
+    db = session_factory()
+    try:
+        course, _, f = make_file(db)
+        chat = create_chat(db, str(course.instructor_id), str(f.id), "Questions")
+        create_message(db, str(chat.id), "user", "When is the deadline?")
+        later = datetime.utcnow() + timedelta(minutes=1)
+        course_faqs.refresh_course_faqs(db, course.id, course.title, now=later)
+
+        # Stamped by a lagging app clock (or a transaction that committed late)
+        late = create_message(db, str(chat.id), "user", "How does grading work?")
+        late.created_at = datetime(2020, 1, 1)
+        db.commit()
+
+        faqs = course_faqs.refresh_course_faqs(db, course.id, course.title,
+                                               now=later + timedelta(minutes=1))
+        assert {q["question"] for q in faqs["faqs"]} == {"When is the deadline?", "How does grading work?"}
+    finally:
+        db.close()
+
+
+def test_refresh_that_loses_the_race_keeps_the_winners_state(make_file, fake_embed, monkeypatch):
+    monkeypatch.setattr(course_faqs, "prompt_label_faqs",
+                        lambda title, clusters: [f"FAQ: {c.representative}" for c in clusters])
+    db, other = session_factory(), session_factory()
+    later = datetime.utcnow() + timedelta(minutes=1)
+    try:
+        course, _, f = make_file(db)
+        chat = create_chat(db, str(course.instructor_id), str(f.id), "Questions")
+        create_message(db, str(chat.id), "user", "When is the deadline?")
+
+        def embed_while_another_refresh_runs(texts):
+            # No lock is held while embedding, so a concurrent refresh can finish first
+            monkeypatch.setattr(course_faqs, "openai_embed_text", fake_embed)
+            course_faqs.refresh_course_faqs(other, course.id, course.title, now=later)
+            return fake_embed(texts)
+
+        monkeypatch.setattr(course_faqs, "openai_embed_text", embed_while_another_refresh_runs)
+        faqs = course_faqs.refresh_course_faqs(db, course.id, course.title,
+                                               now=later + timedelta(seconds=1))
+
+        assert faqs == {"faqs": [{"question": "FAQ: When is the deadline?", "count": 1}]}
+        db.expire_all()
+        stored = course_faqs.get_course_faq_state(db, course.id)
+        # The winner's write stands; the loser did not fold the message in a second time
+        assert stored.updated_at == later and stored.clusters[0]["count"] == 1
+    finally:
+        other.close()
+        db.close()
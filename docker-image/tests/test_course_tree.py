@@ -0,0 +1,28 @@
+import pytest
+
+
+@pytest.fixture
+def course(client, instructor_course):
+    course_id, _ = instructor_course
+    client.post(f"/instructor/courses/{course_id}/modules", json={"title": "Week 2"})
+    return course_id
+
+
+def test_tree_lists_modules_in_order(client, course):
+    resp = client.get(f"/courses/{course}/moduleswithfiles")
+
+    assert resp.status_code == 200
+    assert [(m["title"], m["files"]) for m in resp.get_json()] == [("Week 1", []), ("Week 2", [])]
+    assert resp.headers["ETag"]
+
+
+def test_etag_revalidates_until_the_course_changes(client, course):
+    etag = client.get(f"/courses/{course}/moduleswithfiles").headers["ETag"]
+
+    cached = client.get(f"/courses/{course}/moduleswithfiles", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.data == b""
+
+    client.post(f"/instructor/courses/{course}/modules", json={"title": "Week 3"})
+    fresh = client.get(f"/courses/{course}/moduleswithfiles", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["ETag"] != etag
+    assert len(fresh.get_json()) == 3
@@ -0,0 +1,61 @@
+import numpy as np
+
+from src.app import Session
+from src.embedding_cache import EmbeddingCache
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0, 2.0] for t in texts]
+
+
+def test_repeated_texts_are_embedded_once():
+    cache = EmbeddingCache()
+    embedder = CountingEmbedder()
+
+    first = cache.embed("model-a", ["alpha", "beta", "alpha"], embedder)
+    second = cache.embed("model-a", ["beta", "alpha"], embedder)
+
+    assert embedder.calls == [["alpha", "beta"]]
+    assert first.shape == (3, 3)
+    np.testing.assert_array_equal(second[0], first[1])
+
+
+def test_cache_is_keyed_by_model():
+    cache = EmbeddingCache()
+    embedder = CountingEmbedder()
+
+    cache.embed("model-a", ["gamma"], embedder)
+    cache.embed("model-b", ["gamma"], embedder)
+
+    assert embedder.calls == [["gamma"], ["gamma"]]
+
+
+def test_persisted_entries_survive_a_cold_memory_cache():
+    embedder = CountingEmbedder()
+    warm = EmbeddingCache()
+    warm.configure(Session)
+    warm.embed("model-p", ["persist me"], embedder)
+
+    cold = EmbeddingCache(max_entries=1)
+    cold.configure(Session)
+    vec = cold.embed("model-p", ["persist me"], embedder)
+
+    assert len(embedder.calls) == 1
+    assert vec[0].tolist() == [10.0, 1.0, 2.0]
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    embedder = CountingEmbedder()
+
+    cache.embed("m", ["one", "two"], embedder)
+    cache.embed("m", ["one"], embedder)
+    cache.embed("m", ["three"], embedder)
+    cache.embed("m", ["one", "two"], embedder)
+
+    assert embedder.calls == [["one", "two"], ["three"], ["two"]]
@@ -0,0 +1,51 @@
+import types
+
+import httpx
+import openai
+
+from src.embedding_engine import EmbeddingEngine
+
+
+class FakeEmbeddings:
+    def __init__(self, fail_first=0):
+        self.batches = []
+        self.fail_first = fail_first
+
+    def create(self, model, input, encoding_format):
+        if self.fail_first:
+            self.fail_first -= 1
+            response = httpx.Response(
+                429, headers={"retry-after": "0"},
+                request=httpx.Request("POST", "http://stub/v1/embeddings")
+            )
+            raise openai.RateLimitError("slow down", response=response, body=None)
+        self.batches.append(list(input))
+        return types.SimpleNamespace(data=[
+            types.SimpleNamespace(embedding=[float(t), 0.0]) for t in input
+        ])
+
+
+def _engine(embeddings, **kwargs):
+    client = types.SimpleNamespace(embeddings=embeddings)
+    return EmbeddingEngine(client, "stub-model", base_delay=0, **kwargs)
+
+
+def test_batches_preserve_input_order():
+    fake = FakeEmbeddings()
+    engine = _engine(fake, batch_size=3, max_in_flight=4)
+
+    out = engine.embed([str(i) for i in range(10)])
+
+    assert [len(b) for b in sorted(fake.batches, key=lambda b: int(b[0]))] == [3, 3, 3, 1]
+    assert out[:, 0].tolist() == list(range(10))
+    assert engine.api_calls == 4
+
+
+def test_rate_limited_batches_are_retried():
+    fake = FakeEmbeddings(fail_first=2)
+    engine = _engine(fake, batch_size=512)
+
+    out = engine.embed(["1", "2"])
+
+    assert out.shape == (2, 2)
+    assert engine.api_calls == 3
@@ -0,0 +1,56 @@
+import hashlib
+
+import pytest
+
+import src.chunker as chunker
+import src.extraction_cache as extraction_cache
+from src.app import session_factory
+from src.db.queries import get_file_by_id, get_text_extraction, update_file
+
+pytestmark = pytest.mark.usefixtures("char_tokens")
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    calls = []
+    real_iter_text = extraction_cache.iter_text
+
+    def counting_iter_text(file_data, filename):
+        calls.append(filename)
+        return real_iter_text(file_data, filename)
+
+    monkeypatch.setattr(extraction_cache, "iter_text", counting_iter_text)
+    return calls
+
+
+def test_chunks_are_served_from_the_cache_after_one_extraction(make_file, extractions):
+    data = b"First  line of NOTES2go\n" * 20
+    db = session_factory()
+    try:
+        _, _, f = make_file(db)
+        update_file(db, f.id, file_data=data, file_size=len(data))
+        assert f.content_hash == hashlib.sha256(data).hexdigest()
+
+        f = get_file_by_id(db, f.id)
+        raw = extraction_cache.file_chunks(db, f, max_tokens=100, overlap=20)
+        assert raw == [c.text for c in chunker.TokenChunker(100, 20).chunks(data.decode())]
+
+        # Same bytes: cleaned text, a new chunking and a repeat come from the cache
+        clean = extraction_cache.file_chunks(db, f, clean=True, max_tokens=100, overlap=20)
+        assert clean[0].startswith("First line of NOTES 2 go")
+        assert extraction_cache.file_chunks(db, f, max_tokens=60, overlap=0, boundary="paragraph")
+        assert extraction_cache.file_chunks(db, f, max_tokens=100, overlap=20) == raw
+        assert extractions == ["notes.txt"]
+
+        stored = get_text_extraction(db, f.content_hash, extraction_cache.extractor_key("notes.txt"))
+        assert set(stored.chunkings) == {"raw:100:20:fixed", "clean:100:20:fixed", "raw:60:0:paragraph"}
+        assert stored.text == data.decode()
+
+        # New content is extracted again, and the old text goes with its last reference
+        old_hash = f.content_hash
+        update_file(db, f.id, file_data=b"other", file_size=5)
+        assert extraction_cache.file_chunks(db, get_file_by_id(db, f.id)) == ["other"]
+        assert len(extractions) == 2
+        assert get_text_extraction(db, old_hash, extraction_cache.extractor_key("notes.txt")) is None
+    finally:
+        db.close()
@@ -0,0 +1,85 @@
+import pickle
+import uuid
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+
+from src.faiss_cache import FaissIndexCache
+
+
+class LazyCourse(SimpleNamespace):
+    """Counts reads of the blob attribute, which the ORM defers."""
+    reads = 0
+
+    def __getattribute__(self, name):
+        if name == 'index_faiss':
+            object.__setattr__(self, 'reads', object.__getattribute__(self, 'reads') + 1)
+        return object.__getattribute__(self, name)
+
+
+def make_course(n_vectors, dim=4):
+    index = faiss.IndexFlatL2(dim)
+    if n_vectors:
+        index.add(np.random.rand(n_vectors, dim).astype('float32'))
+    metadata = {i: {'file_id': 'f', 'chunk_index': i} for i in range(n_vectors)}
+    return LazyCourse(
+        id=uuid.uuid4(),
+        index_version=1,
+        index_faiss=faiss.serialize_index(index).tobytes(),
+        index_pkl=pickle.dumps(metadata),
+    )
+
+
+def test_course_index_is_deserialized_once():
+    cache = FaissIndexCache()
+    course = make_course(3)
+
+    first, _ = cache.get_course_index(course)
+    reads = course.reads
+    second, metadata = cache.get_course_index(course)
+
+    assert first is second
+    assert first.ntotal == 3 and len(metadata) == 3
+    # A hit is validated by index_version alone; the blobs are not read again
+    assert course.reads == reads
+
+
+def test_new_version_or_invalidate_reload_the_index():
+    cache = FaissIndexCache()
+    course = make_course(2)
+    first, _ = cache.get_course_index(course)
+
+    course.index_faiss = make_course(5).index_faiss
+    course.index_version += 1
+    reloaded, _ = cache.get_course_index(course)
+    assert reloaded is not first and reloaded.ntotal == 5
+
+    cache.invalidate('course', course.id)
+    assert cache.get_course_index(course)[0] is not reloaded
+
+
+def test_course_without_index_is_cached_as_empty():
+    cache = FaissIndexCache()
+    course = make_course(0)
+    course.index_faiss = None
+
+    assert cache.get_course_index(course) == (None, {})
+
+
+def test_least_recently_used_index_is_evicted_by_size():
+    a, b, c = make_course(10), make_course(10), make_course(10)
+    # Room for two 10 x 4 float32 indexes and their metadata
+    cache = FaissIndexCache(max_bytes=2 * (10 * 4 * 4 + len(a.index_pkl)))
+    index_a, _ = cache.get_course_index(a)
+    cache.get_course_index(b)
+    cache.get_course_index(a)
+    cache.get_course_index(c)
+
+    assert cache.get_course_index(a)[0] is index_a
+    assert len(cache._entries) == 2 and cache.nbytes <= cache.max_bytes
+
+    # An index bigger than the whole budget is served but not kept
+    big = make_course(100)
+    assert cache.get_course_index(big)[0].ntotal == 100
+    assert ('course', str(big.id)) not in cache._entries
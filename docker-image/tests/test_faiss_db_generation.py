@@ -0,0 +1,40 @@
+import pickle
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import FAISS_db_generation
+
+
+class FakeEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0, 0.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.0]
+
+
+def test_build_file_store_returns_save_local_bytes(monkeypatch):
+    monkeypatch.setattr(FAISS_db_generation, "cached_openai_embeddings", FakeEmbeddings)
+    monkeypatch.setattr(FAISS_db_generation, "_obtain_reference_using_gpt", lambda text: "Ref (2024)")
+    data = ("Corals host symbiotic algae. " * 100).encode("utf-8")
+
+    index_bytes, docstore_bytes = FAISS_db_generation.build_file_store(data, "notes.txt")
+
+    index = faiss.deserialize_index(np.frombuffer(index_bytes, dtype="uint8"))
+    docstore, index_to_docstore_id = pickle.loads(docstore_bytes)
+    docs = list(docstore._dict.values())
+    assert index.ntotal == len(docs) == len(index_to_docstore_id) > 1
+    assert all(d.metadata == {"source": "notes.txt", "citation": "Ref (2024)"} for d in docs)
+
+
+def test_copied_store_is_relabelled_with_the_new_filename(monkeypatch):
+    monkeypatch.setattr(FAISS_db_generation, "cached_openai_embeddings", FakeEmbeddings)
+    monkeypatch.setattr(FAISS_db_generation, "_obtain_reference_using_gpt", lambda text: "Ref (2024)")
+    _, docstore_bytes = FAISS_db_generation.build_file_store(b"Reef notes. " * 200, "notes.txt")
+
+    renamed = FAISS_db_generation.rename_store_source(docstore_bytes, "notes.txt", "copy.txt")
+
+    docstore, _ = pickle.loads(renamed)
+    assert {d.metadata["source"] for d in docstore._dict.values()} == {"copy.txt"}
@@ -0,0 +1,93 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain.schema import Document
+
+import FAISS_retriever
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self._lock:
+            self.in_flight -= 1
+        first_word = prompt.split("TEXT:\n", 1)[1].split()[0]
+        return SimpleNamespace(content=f"notes from {first_word}")
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # cl100k_base is downloaded on first use; count words instead in tests
+    monkeypatch.setattr(FAISS_retriever, "count_tokens", lambda text: len(text.split()))
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    llm = FakeLLM()
+    monkeypatch.setattr(FAISS_retriever, "get_chat_llm", lambda: llm)
+    return llm
+
+
+def make_docs(n, words=50):
+    return [Document(page_content=" ".join([f"part{i}"] * words)) for i in range(n)]
+
+
+def test_group_documents_keeps_order_and_size():
+    docs = make_docs(10)
+    size = FAISS_retriever.count_tokens(docs[0].page_content)
+    groups = FAISS_retriever.group_documents(docs, max_tokens=size * 3)
+    assert [len(g) for g in groups] == [3, 3, 3, 1]
+    assert [d for g in groups for d in g] == docs
+
+
+def test_map_documents_summarizes_groups_in_parallel_and_in_order(fake_llm):
+    docs = make_docs(12)
+    size = FAISS_retriever.count_tokens(docs[0].page_content)
+
+    notes = FAISS_retriever.map_documents(docs, group_tokens=size * 2, max_workers=3,
+                                          threshold_tokens=10 ** 6)
+
+    assert [n.page_content for n in notes] == [f"notes from part{i}" for i in range(0, 12, 2)]
+    assert len(fake_llm.prompts) == 6
+    assert 1 < fake_llm.max_in_flight <= 3
+
+
+def test_auto_mode_picks_map_reduce_for_large_documents(fake_llm, monkeypatch):
+    stuffed = []
+    monkeypatch.setattr(FAISS_retriever, "LLM_response_documents",
+                        lambda query, documents: stuffed.append(documents) or {"result": "ok"})
+    docs = make_docs(4)
+    total = sum(FAISS_retriever.count_tokens(d.page_content) for d in docs)
+
+    monkeypatch.setattr(FAISS_retriever, "MAP_REDUCE_THRESHOLD_TOKENS", total)
+    assert FAISS_retriever.answer_to_QA_documents("q", docs) == "ok"
+    assert stuffed[-1] == docs and fake_llm.prompts == []
+
+    monkeypatch.setattr(FAISS_retriever, "MAP_REDUCE_THRESHOLD_TOKENS", total - 1)
+    assert FAISS_retriever.answer_to_QA_documents("q", docs) == "ok"
+    assert len(fake_llm.prompts) == 1
+    assert [d.page_content for d in stuffed[-1]] == ["notes from part0"]
+
+    with pytest.raises(ValueError):
+        FAISS_retriever.answer_to_QA_documents("q", docs, mode="refine")
+
+
+def test_map_reduce_without_documents_skips_the_map_step(fake_llm, monkeypatch):
+    stuffed = []
+    monkeypatch.setattr(FAISS_retriever, "LLM_response_documents",
+                        lambda query, documents: stuffed.append(documents) or {"result": "ok"})
+
+    assert FAISS_retriever.answer_to_QA_documents("q", [], mode="map_reduce") == "ok"
+    assert stuffed == [[]] and fake_llm.prompts == []
@@ -0,0 +1,46 @@
+from src.faq_engine import FaqState
+
+
+def test_near_duplicates_are_counted_together(fake_embed):
+    questions = [
+        "When is the deadline?", "when is the  DEADLINE?", "What's the deadline for hw1",
+        "How does grading work?", "Explain grading please",
+        "When are office hours?",
+        "When is the deadline?",
+    ]
+
+    state = FaqState(threshold=0.9)
+    state.add(questions, fake_embed)
+
+    assert [(c.representative, c.count) for c in state.top()] == [
+        ("When is the deadline?", 4), ("How does grading work?", 2), ("When are office hours?", 1)
+    ]
+    # exact duplicates are embedded once
+    assert len(fake_embed.calls[0]) == 5
+
+
+def test_top_limits_and_empty_input_adds_nothing(fake_embed):
+    state = FaqState()
+    state.add([], fake_embed)
+    state.add(["  ", ""], fake_embed)
+    assert state.top() == [] and fake_embed.calls == []
+
+    state.add(["deadline?"] * 3 + ["grading?"] * 2 + ["office?"], fake_embed)
+    assert [c.to_dict() for c in state.top(2)] == [
+        {"question": "deadline?", "count": 3}, {"question": "grading?", "count": 2}
+    ]
+
+
+def test_state_round_trips_and_keeps_clustering_incrementally(fake_embed):
+    state = FaqState(threshold=0.9)
+    state.add(["When is the deadline?", "How does grading work?"], fake_embed)
+    state.clusters[0].label = "FAQ: deadline"
+
+    reloaded = FaqState.load(*state.dump(), threshold=0.9)
+    reloaded.add(["What's the deadline for hw1", "When are office hours?"], fake_embed)
+
+    assert [(c.to_dict(), c.variants) for c in reloaded.top()] == [
+        ({"question": "FAQ: deadline", "count": 2}, ["What's the deadline for hw1"]),
+        ({"question": "How does grading work?", "count": 1}, []),
+        ({"question": "When are office hours?", "count": 1}, []),
+    ]
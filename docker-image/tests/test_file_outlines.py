@@ -0,0 +1,84 @@
+import json
+import threading
+from types import SimpleNamespace
+
+from langchain.schema import Document
+
+from src.app import session_factory
+from src.file_outlines import FileOutlineCache
+
+
+def test_outline_is_built_once_per_content_and_prompt_version(make_file):
+    db = session_factory()
+    try:
+        _, _, f = make_file(db)
+    finally:
+        db.close()
+    cache = FileOutlineCache()
+    cache.configure(session_factory)
+    builds = []
+
+    def build(documents):
+        builds.append([d.page_content for d in documents])
+        return json.dumps({"chapters": [{"chapterTitle": documents[0].page_content}]})
+
+    docs = [Document(page_content="Intro"), Document(page_content="Body")]
+    first = cache.get_or_build(f.id, docs, "1", build)
+    assert cache.get_or_build(str(f.id), docs, "1", build) == first
+    assert builds == [["Intro", "Body"]]
+
+    # New content or a new prompt version rebuilds; invalid JSON is not stored
+    edited = [Document(page_content="Preface")] + docs
+    assert "Preface" in cache.get_or_build(f.id, edited, "1", build)
+    cache.get_or_build(f.id, docs, "2", build)
+    assert len(builds) == 3
+
+    assert cache.get_or_build(f.id, docs, "3", lambda d: "not json") == "not json"
+    cache.get_or_build(f.id, docs, "3", build)
+    assert len(builds) == 4
+
+
+    # GPT-4o often fences its JSON; the cleaned outline is returned and stored
+    fenced = lambda d: builds.append("fenced") or '```json\n{"chapters": []}\n```'
+    assert cache.get_or_build(f.id, docs, "4", fenced) == '{"chapters": []}'
+    assert cache.get_or_build(f.id, docs, "4", fenced) == '{"chapters": []}'
+    assert builds.count("fenced") == 1
+
+
+def test_only_builds_of_the_same_key_wait_for_each_other(monkeypatch):
+    import src.file_outlines as file_outlines
+
+    stored = {}
+    monkeypatch.setattr(file_outlines, "get_file_outline", lambda db, *key: stored.get(key))
+    monkeypatch.setattr(file_outlines, "save_file_outline",
+                        lambda db, *args: stored.setdefault(args[:3], args[3]))
+    cache = FileOutlineCache()
+    cache.configure(lambda: SimpleNamespace(close=lambda: None))
+
+    b_started = threading.Event()
+    builds, results = [], {}
+
+    def build_a(documents):
+        builds.append("a")
+        # Would time out if an unrelated file's build were serialized behind this one
+        results["b_ran_meanwhile"] = b_started.wait(5)
+        return json.dumps({"file": "a"})
+
+    def build_b(documents):
+        builds.append("b")
+        b_started.set()
+        return json.dumps({"file": "b"})
+
+    docs = [Document(page_content="Intro")]
+    threads = [threading.Thread(target=lambda: results.setdefault(
+        threading.current_thread().name, cache.get_or_build("a", docs, "1", build_a)))
+        for _ in range(4)]
+    for t in threads:
+        t.start()
+    cache.get_or_build("b", docs, "1", build_b)
+    for t in threads:
+        t.join()
+
+    assert results["b_ran_meanwhile"] is True
+    assert sorted(builds) == ["a", "b"]
+    assert {results[t.name] for t in threads} == {json.dumps({"file": "a"})}
@@ -0,0 +1,106 @@
+import pickle
+import sys
+import zlib
+
+import faiss
+import numpy as np
+import pytest
+
+from src.app import session_factory
+from src.db.queries import create_file, get_course_by_id, update_course
+
+DIM = 8
+
+
+def fake_embed_texts(texts):
+    # One fixed pseudo-random vector per distinct text
+    return np.stack([
+        np.random.default_rng(zlib.crc32(t.encode())).random(DIM, dtype=np.float32) for t in texts
+    ])
+
+
+@pytest.fixture
+def indexer(monkeypatch):
+    # conftest replaces `indexer` and `textUtils` with stubs; load the real module
+    import src.textUtils
+    monkeypatch.setitem(sys.modules, "textUtils", src.textUtils)
+    import src.indexer as indexer
+    monkeypatch.setattr(indexer, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(indexer, "file_chunks", lambda db, f, **kw: f.file_data.decode().split())
+    return indexer
+
+
+@pytest.fixture
+def db():
+    session = session_factory()
+    yield session
+    session.close()
+
+
+def _add_file(db, module, name, words):
+    return create_file(db, str(module.id), name, f"{name}.txt", "text/plain", len(words), words.encode())
+
+
+def _store(db, course_id, index_bytes, pkl_bytes):
+    update_course(db, course_id=str(course_id), index_faiss=index_bytes, index_pkl=pkl_bytes)
+
+
+def _load(db, course_id):
+    course = get_course_by_id(db, course_id, with_index=True)
+    index = faiss.deserialize_index(np.frombuffer(course.index_faiss, dtype='uint8'))
+    return index, pickle.loads(course.index_pkl)
+
+
+def _contents(metadata):
+    return sorted(md['content'] for md in metadata.values())
+
+
+def test_files_are_appended_and_removed_in_place(db, make_file, indexer):
+    course, module, _ = make_file(db)
+    a = _add_file(db, module, "a", "alpha beta")
+    b = _add_file(db, module, "b", "gamma")
+
+    _store(db, course.id, *indexer.add_file_to_course_index(db, str(course.id), str(a.id)))
+    _store(db, course.id, *indexer.add_file_to_course_index(db, str(course.id), str(b.id)))
+    index, metadata = _load(db, course.id)
+    assert index.ntotal == 3 and _contents(metadata) == ["alpha", "beta", "gamma"]
+
+    # Re-adding a file replaces its vectors instead of duplicating them
+    _store(db, course.id, *indexer.add_file_to_course_index(db, str(course.id), str(a.id)))
+    index, metadata = _load(db, course.id)
+    assert index.ntotal == 3 and _contents(metadata) == ["alpha", "beta", "gamma"]
+
+    # Ids and vectors stay aligned: each stored id reconstructs its own chunk's embedding
+    for idx, md in metadata.items():
+        assert np.allclose(index.reconstruct(idx), fake_embed_texts([md['content']])[0])
+
+    _store(db, course.id, *indexer.remove_files_from_course_index(db, str(course.id), [a.id]))
+    index, metadata = _load(db, course.id)
+    assert index.ntotal == 1 and _contents(metadata) == ["gamma"]
+
+    _store(db, course.id, *indexer.remove_files_from_course_index(db, str(course.id), [b.id]))
+    index, metadata = _load(db, course.id)
+    assert index.ntotal == 0 and metadata == {}
+
+
+def test_legacy_flat_index_is_converted_before_appending(db, make_file, indexer):
+    course, module, _ = make_file(db)
+    old = _add_file(db, module, "old", "delta epsilon")
+    new = _add_file(db, module, "new", "zeta")
+
+    # Indexes written before incremental updates were plain IndexFlatL2 with positional ids
+    legacy = faiss.IndexFlatL2(DIM)
+    legacy.add(fake_embed_texts(["delta", "epsilon"]))
+    legacy_md = {i: {'file_id': str(old.id), 'chunk_index': i, 'filename': old.filename, 'content': w}
+                 for i, w in enumerate(["delta", "epsilon"])}
+    _store(db, course.id, faiss.serialize_index(legacy).tobytes(), pickle.dumps(legacy_md))
+
+    _store(db, course.id, *indexer.add_file_to_course_index(db, str(course.id), str(new.id)))
+    index, metadata = _load(db, course.id)
+    assert isinstance(index, faiss.IndexIDMap2)
+    assert sorted(metadata) == [0, 1, 2] and _contents(metadata) == ["delta", "epsilon", "zeta"]
+
+    _store(db, course.id, *indexer.remove_files_from_course_index(db, str(course.id), [old.id]))
+    index, metadata = _load(db, course.id)
+    assert index.ntotal == 1 and _contents(metadata) == ["zeta"]
+    assert np.allclose(index.reconstruct(2), fake_embed_texts(["zeta"])[0])
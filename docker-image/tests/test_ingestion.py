@@ -0,0 +1,103 @@
+import uuid
+
+import pytest
+
+import src.ingestion as ingestion
+
+
+@pytest.fixture
+def module_id(instructor_course):
+    return instructor_course[1]
+
+
+@pytest.fixture
+def stub_stages(monkeypatch):
+    calls = []
+    for stage in ingestion.INGESTION_STAGES:
+        monkeypatch.setitem(
+            ingestion.STAGE_HANDLERS, stage,
+            lambda db, f, cid, stage=stage: calls.append(stage)
+        )
+    return calls
+
+
+def _upload(client, module_id, name, mimetype, data=b"hello world"):
+    import io
+    return client.post(
+        f"/instructor/modules/{module_id}/files",
+        data={"file": (io.BytesIO(data), name, mimetype)},
+        content_type="multipart/form-data"
+    )
+
+
+def test_upload_returns_job_and_records_stages(client, module_id, stub_stages):
+    resp = _upload(client, module_id, "notes.txt", "text/plain")
+    assert resp.status_code == 202
+    job_id = resp.get_json()["jobId"]
+
+    job = client.get(f"/instructor/ingestion-jobs/{job_id}").get_json()
+    assert job["status"] == "succeeded"
+    # The default pgvector backend only needs FileChunk rows
+    assert job["stages"] == {
+        "transcribe": "skipped",
+        "file_index": "skipped",
+        "course_index": "skipped",
+        "embeddings": "done"
+    }
+    assert stub_stages == ["embeddings"]
+
+
+def test_failing_stage_marks_job_failed(client, module_id, stub_stages, monkeypatch):
+    def boom(db, f, cid):
+        raise RuntimeError("index exploded")
+    monkeypatch.setitem(ingestion.STAGE_HANDLERS, "embeddings", boom)
+
+    job_id = _upload(client, module_id, "lecture.mp4", "video/mp4").get_json()["jobId"]
+
+    job = client.get(f"/instructor/ingestion-jobs/{job_id}").get_json()
+    assert job["status"] == "failed"
+    assert job["stages"]["transcribe"] == "done"
+    assert job["stages"]["embeddings"] == "failed"
+    assert "index exploded" in job["error"]
+
+
+def test_duplicate_upload_reuses_blob_and_chunks(client, module_id, monkeypatch):
+    import numpy as np
+    from sqlalchemy import func, select
+    from src.app import session_factory
+    from src.db.queries import insert_file_chunks
+    from src.db.schema import FileBlob, FileChunk
+
+    embedded = []
+    payload = b"syllabus " + uuid.uuid4().bytes
+
+    def fake_store_file_embeddings(db, file_id):
+        embedded.append(file_id)
+        f = ingestion.get_file_by_id(db, file_id)
+        assert f.file_data == payload
+        return insert_file_chunks(db, f.id, f.module.course_id, ["hello", "world"],
+                                  [np.ones(1536, dtype=np.float32)] * 2)
+
+    monkeypatch.setattr(ingestion, "store_file_embeddings", fake_store_file_embeddings)
+    first = _upload(client, module_id, "notes.txt", "text/plain", payload).get_json()
+    second = _upload(client, module_id, "copy.txt", "text/plain", payload).get_json()
+    assert client.get(f"/instructor/ingestion-jobs/{second['jobId']}").get_json()["status"] == "succeeded"
+
+    db = session_factory()
+    try:
+        # Only the first upload was embedded; the copy got its chunks and shares its bytes
+        assert embedded == [first["id"]]
+        for file_id in (first["id"], second["id"]):
+            count = select(func.count()).filter(FileChunk.file_id == uuid.UUID(file_id))
+            assert db.execute(count).scalar() == 2
+        blob_refs = select(FileBlob.ref_count).filter(FileBlob.size == len(payload))
+        assert db.execute(blob_refs).scalars().all() == [2]
+
+        assert client.delete(f"/instructor/files/{first['id']}").status_code in (200, 204)
+        db.expire_all()
+        assert db.execute(blob_refs).scalars().all() == [1]
+        assert client.delete(f"/instructor/files/{second['id']}").status_code in (200, 204)
+        db.expire_all()
+        assert db.execute(blob_refs).scalars().all() == []
+    finally:
+        db.close()
@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, exc
+
+from src.db.pool import InstrumentedQueuePool, engine_options, pool_metrics
+
+
+def test_pool_options_only_apply_to_postgres(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "8")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+
+    assert engine_options("sqlite:///:memory:") == {}
+    opts = engine_options("postgresql://u:p@localhost/learnx")
+    assert opts["pool_size"] == 8 and opts["pool_pre_ping"] is True
+    assert opts["connect_args"] == {"options": "-c statement_timeout=5000"}
+
+
+def test_exhausted_pool_counts_waits_and_timeouts():
+    engine = create_engine("sqlite://", poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    held = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+
+    released = threading.Timer(0.01, held.close)
+    engine.pool._timeout = 1
+    released.start()
+    engine.connect().close()
+
+    metrics = pool_metrics(engine)
+    assert metrics["waits"] == 2 and metrics["timeouts"] == 1
+    assert metrics["checkedOut"] == 0 and metrics["size"] == 1
@@ -0,0 +1,28 @@
+from sqlalchemy import inspect
+
+from src.app import session_factory
+from src.db.queries import get_file_by_id, get_files_by_module, get_course_by_id
+
+
+def test_blobs_are_only_loaded_on_request(make_file):
+    db = session_factory()
+    try:
+        course, module, f = make_file(db)
+        db.expunge_all()
+
+        plain = get_file_by_id(db, f.id)
+        assert {'blob', 'index_faiss', 'index_pkl'} <= inspect(plain).unloaded
+        assert {'index_faiss', 'index_pkl'} <= inspect(get_course_by_id(db, course.id)).unloaded
+        db.expunge_all()
+
+        full = get_file_by_id(db, f.id, with_data=True, with_index=True)
+        assert not {'blob', 'index_faiss', 'index_pkl'} & inspect(full).unloaded
+        assert 'data' not in inspect(full.blob).unloaded
+        assert full.file_data == b"hello"
+        db.expunge_all()
+
+        listed = get_files_by_module(db, module.id)
+        assert 'blob' in inspect(listed[0]).unloaded
+        assert listed[0].file_data == b"hello"
+    finally:
+        db.close()
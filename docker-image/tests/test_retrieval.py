@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.retrieval import PgVectorBackend
+
+
+class RecordingSession:
+    def __init__(self, dialect="postgresql"):
+        self.bind = SimpleNamespace(dialect=SimpleNamespace(name=dialect))
+        self.settings = {}
+
+    def execute(self, stmt, params):
+        self.settings[params["name"]] = params["value"]
+
+
+@pytest.fixture(autouse=True)
+def no_env_overrides(monkeypatch):
+    for name in ("VECTOR_INDEX", "HNSW_EF_SEARCH", "IVFFLAT_PROBES", "VECTOR_ITERATIVE_SCAN"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_course_scoped_searches_scan_iteratively_by_default():
+    db = RecordingSession()
+    PgVectorBackend()._tune_ann_search(db, k=5)
+
+    # Many courses share one HNSW graph: without iterative scans the course
+    # filter only sees ef_search candidates and can come back short of k
+    assert db.settings == {"hnsw.ef_search": "40", "hnsw.iterative_scan": "relaxed_order"}
+
+
+def test_ivfflat_and_disabled_iterative_scan(monkeypatch):
+    db = RecordingSession()
+    PgVectorBackend(vector_index="ivfflat")._tune_ann_search(db, k=5, probes=20)
+    assert db.settings == {"ivfflat.probes": "20", "ivfflat.iterative_scan": "relaxed_order"}
+
+    # pgvector < 0.8 rejects the setting, so it can be switched off
+    monkeypatch.setenv("VECTOR_ITERATIVE_SCAN", "off")
+    db = RecordingSession()
+    PgVectorBackend()._tune_ann_search(db, k=50)
+    assert db.settings == {"hnsw.ef_search": "50"}
+
+
+def test_search_route_validates_and_clamps_tuning(client, monkeypatch):
+    import src.app as app_module
+    calls = []
+    monkeypatch.setattr(app_module.retrieval_backend, "search",
+                        lambda db, cid, query, **kw: calls.append(kw) or [])
+    url = "/courses/00000000-0000-0000-0000-000000000000/search"
+
+    assert client.post(url, json={"query": "q", "k": 10000, "efSearch": "5000"}).status_code == 200
+    assert calls == [{"k": 50, "ef_search": 1000, "probes": None}]
+
+    for bad in ({"k": 0}, {"k": "many"}, {"efSearch": [40]}, {"probes": True}):
+        resp = client.post(url, json={"query": "q", **bad})
+        assert resp.status_code == 400 and "positive integer" in resp.get_json()["error"]
+    assert len(calls) == 1
+
+
+def test_backend_missing_a_method_fails_when_created():
+    from src.retrieval import RetrievalBackend
+
+    class SearchOnly(RetrievalBackend):
+        def search(self, db, course_id, query, k=5, file_id=None, ef_search=None, probes=None):
+            return []
+
+    with pytest.raises(TypeError, match="file_documents"):
+        SearchOnly()
@@ -0,0 +1,87 @@
+import pytest
+
+import src.textUtils as textUtils
+
+pytestmark = pytest.mark.usefixtures("char_tokens")
+
+
+def make_pdf(pages):
+    """Minimal PDF with one line of Helvetica text per page."""
+    n = len(pages)
+    font_id = 3 + 2 * n
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: ("<< /Type /Pages /Kids [%s] /Count %d >>"
+            % (" ".join(f"{3 + 2 * i} 0 R" for i in range(n)), n)).encode(),
+        font_id: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects[3 + 2 * i] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        ).encode()
+        objects[4 + 2 * i] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, objects[num])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for num in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[num]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def test_pdf_pages_stream_in_order_serially_and_in_parallel():
+    pages = [f"Page {i} text" for i in range(40)]
+    pdf = make_pdf(pages)
+
+    serial = list(textUtils.iter_pdf_pages(pdf, workers=1))
+    parallel = list(textUtils.iter_pdf_pages(pdf, workers=2, min_parallel_pages=1))
+    # One shared pool, never forked from the (multithreaded) app process
+    assert textUtils._get_pdf_pool() is textUtils._get_pdf_pool()
+    assert textUtils._get_pdf_pool()._mp_context.get_start_method() in ("forkserver", "spawn")
+
+    assert [p.strip() for p in serial] == pages
+    assert parallel == serial
+
+
+def test_plain_text_blocks_rejoin_exactly(monkeypatch):
+    monkeypatch.setattr(textUtils, "TEXT_BLOCK_SIZE", 7)
+    text = "first line\nsecond ünïcode line\n\nlast"
+    sections = list(textUtils.iter_text(text.encode("utf-8"), "notes.txt"))
+
+    assert len(sections) > 1
+    assert "\n".join(sections) == text == textUtils.extract_text(text.encode("utf-8"), "notes.txt")
+
+
+def test_split_text_gives_same_windows_for_a_stream():
+    sections = ["alpha " * 30, "beta " * 45, "gamma"]
+    whole = "\n".join(sections)
+
+    chunks = textUtils.split_text(whole, max_tokens=40, overlap=10)
+    assert textUtils.split_text(iter(sections), max_tokens=40, overlap=10) == chunks
+    assert chunks[0] == whole[:40] and chunks[1] == whole[30:70]
+    assert textUtils.split_text(iter([]), max_tokens=40, overlap=10) == []
+
+
+def legacy_clean(text):
+    import re
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', text)
+    text = re.sub(r'(?<=[a-zA-Z])(?=[0-9])', ' ', text)
+    text = re.sub(r'(?<=[0-9])(?=[a-zA-Z])', ' ', text)
+    return text.strip()
+
+
+def test_single_pass_cleanup_matches_the_four_rules():
+    import random
+    rng = random.Random(7)
+    alphabet = "aZ9 \n\tbY8.-"
+    for _ in range(500):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        assert textUtils.clean_extracted_text(text) == legacy_clean(text)